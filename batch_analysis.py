@@ -0,0 +1,185 @@
+import argparse
+import glob
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from overpass_stream import iter_overpass
+from snapshot_catalog import list_snapshots
+from snapshot_format import ColumnarSnapshot, is_snapshot
+from tags_analysis import TagStats
+from way_area_size import AreaStats, add_snapshot_ways
+
+
+def resolve_inputs(patterns):
+    """
+    Expand directories and globs into a sorted list of snapshot files
+
+    Directories are listed through the snapshot catalog, so only toilet
+    snapshots are picked up; globs are taken as given.
+    """
+    files = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            files.update(os.path.join(pattern, entry['file']) for entry in list_snapshots(pattern))
+        else:
+            files.update(path for path in glob.glob(pattern) if os.path.isfile(path))
+    return sorted(files)
+
+
+def analyze_file(file_path):
+    """
+    Tag and area statistics for one snapshot, in a single pass
+
+    Runs in a worker process; the returned dict (with the TagStats and
+    AreaStats partial results) is pickled back to the parent.
+    """
+    name = os.path.basename(file_path)
+    tags = TagStats()
+    areas = AreaStats(source=name)
+    timestamp = None
+    start = time.perf_counter()
+
+    if is_snapshot(file_path):
+        with ColumnarSnapshot(file_path) as snapshot:
+            timestamp = snapshot.meta.get('osm3s', {}).get('timestamp_osm_base')
+            for i in range(snapshot.count):
+                tags.add(snapshot.tags(i))
+            add_snapshot_ways(areas, snapshot)
+    else:
+        for item in iter_overpass(file_path):
+            if item[0] == 'element':
+                tags.add(item[1].get('tags'))
+                areas.add(item[1])
+            elif item[1] == 'osm3s':
+                timestamp = item[2].get('timestamp_osm_base')
+        areas.finish()
+
+    return {
+        'file': name,
+        'timestamp': timestamp,
+        'seconds': time.perf_counter() - start,
+        'tags': tags,
+        'areas': areas,
+    }
+
+
+def _trend_row(result):
+    tags = result['tags']
+    wheelchair = tags.values.get('wheelchair')
+    fee = tags.values.get('fee')
+    return {
+        'file': result['file'],
+        'timestamp': result['timestamp'],
+        'elements': tags.elements,
+        'ways': result['areas'].ways,
+        'total_area_m2': round(float(result['areas'].metrics['area_m2'].sum()), 1),
+        'bounds_problems': len(result['areas'].without_bounds),
+        'wheelchair_yes': wheelchair.counts.get('yes', 0) if wheelchair else 0,
+        'fee_no': fee.counts.get('no', 0) if fee else 0,
+    }
+
+
+def run_batch(patterns, max_workers=None, top_values=10):
+    """
+    Analyze many snapshots across a process pool and merge the results
+
+    Args:
+        patterns: Directories and/or globs of snapshots
+        max_workers: Worker processes (default: one per core)
+        top_values: Values listed per key in the combined tag report
+
+    Returns:
+        Report dict with one trend row per file (oldest first) and the
+        combined tag stats, way area distribution and bounds problems
+    """
+    files = resolve_inputs(patterns)
+    if not files:
+        return None
+
+    max_workers = max_workers or os.cpu_count() or 1
+    start = time.perf_counter()
+    if max_workers == 1 or len(files) == 1:
+        results = [analyze_file(path) for path in files]
+    else:
+        # Large chunks cut pickling overhead for many small files, while
+        # still spreading the work over every worker
+        chunksize = max(1, len(files) // (max_workers * 4))
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(analyze_file, files, chunksize=chunksize))
+    elapsed = time.perf_counter() - start
+
+    # Merge in file order so approximate counts do not depend on scheduling
+    tags = TagStats()
+    areas = AreaStats()
+    for result in results:
+        tags.merge(result['tags'])
+        areas.merge(result['areas'])
+
+    rows = sorted((_trend_row(result) for result in results),
+                  key=lambda row: (row['timestamp'] or '', row['file']))
+    return {
+        'files': len(files),
+        'workers': max_workers,
+        'elapsed_s': round(elapsed, 3),
+        'cpu_s': round(sum(result['seconds'] for result in results), 3),
+        'trend': rows,
+        'tags': tags.to_dict(top_values),
+        'areas': areas.to_dict(),
+    }
+
+
+def print_report(report):
+    print(f"\n📊 Analyzed {report['files']} snapshots with {report['workers']} workers "
+          f"in {report['elapsed_s']}s ({report['cpu_s']}s of work)")
+
+    print("\nPer snapshot:")
+    print(f"   {'timestamp':<22}{'elements':>9}{'ways':>7}{'area m²':>10}{'wheelchair':>12}{'fee=no':>8}  file")
+    for row in report['trend']:
+        print(f"   {row['timestamp'] or '?':<22}{row['elements']:>9}{row['ways']:>7}{row['total_area_m2']:>10.0f}"
+              f"{row['wheelchair_yes']:>12}{row['fee_no']:>8}  {row['file']}")
+
+    tags = report['tags']
+    print(f"\nCombined: {tags['elements']} elements, {len(tags['keys'])} keys")
+    for key, info in list(tags['keys'].items())[:10]:
+        print(f"   {key}: {info['coverage']:.1%} coverage, "
+              f"{'' if info['exact'] else '~'}{info['distinct']} distinct values")
+
+    areas = report['areas']
+    if areas['area_m2']:
+        print(f"\nWay areas: median {areas['area_m2']['p50']:,.1f} m², p99 {areas['area_m2']['p99']:,.1f} m², "
+              f"{len(areas['outliers'])} outliers")
+        for way in areas['largest'][:3]:
+            print(f"   way {way['id']} in {way['file']}: {way['area_m2']:,.1f} m²")
+    problems = areas['bounds_problems']
+    print(f"Bounds problems: {len(problems)}")
+    for problem in problems[:10]:
+        print(f"   way {problem['id']} in {problem['file']}: {problem['reason']}")
+    if len(problems) > 10:
+        print(f"   ... and {len(problems) - 10} more")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze many toilet snapshots in parallel")
+    parser.add_argument('inputs', nargs='+', help="Snapshot directories and/or globs")
+    parser.add_argument('--workers', type=int, help="Worker processes (default: one per core)")
+    parser.add_argument('-o', '--output', help="Also write the report as JSON")
+    args = parser.parse_args()
+
+    print("🚽 Batch Snapshot Analysis")
+    print("=" * 30)
+    report = run_batch(args.inputs, args.workers)
+    if report is None:
+        print("❌ No snapshots found")
+        return
+
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"\n💾 Report saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
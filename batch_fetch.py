@@ -0,0 +1,237 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+
+import requests
+
+from fetch_toilets import REGIONS, fetch_toilet_data, merge_snapshots, save_snapshot
+from overpass_client import OverpassClient, get_default_client
+from snapshot_format import load_snapshot
+
+STATE_FILE = 'batch_fetch_state.json'
+DEFAULT_REGIONS = ('norway', 'sweden', 'denmark', 'finland',
+                   'oslo', 'bergen', 'trondheim', 'stockholm', 'gothenburg', 'copenhagen', 'helsinki')
+
+# Upper bound on concurrent queries, whatever /api/status reports
+DEFAULT_MAX_WORKERS = 4
+# Seconds between /api/status polls while every slot is taken
+MIN_POLL_INTERVAL = 1.0
+MAX_POLL_INTERVAL = 30.0
+
+
+def _save_state(state, path):
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2)
+    os.replace(temp_path, path)
+
+
+def load_state(path, regions, restart=False):
+    """
+    Resume the unfinished batch in path, or start a new one
+
+    A batch is resumed when it has not been merged yet and asks for the same
+    regions; its completed regions whose snapshot still exists are kept.
+    """
+    state = None
+    if not restart:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = None
+    if state and not state.get('merged') and state.get('order') == list(regions):
+        for job in state['regions'].values():
+            if job['status'] != 'done' or not os.path.exists(job['file']):
+                job.update(status='pending', attempts=0)
+        return state, True
+
+    return {
+        'batch': datetime.now().strftime("%Y%m%d_%H%M%S"),
+        'order': list(regions),
+        'regions': {name: {'status': 'pending', 'attempts': 0} for name in regions},
+        'merged': None,
+    }, False
+
+
+def free_slots(client):
+    """
+    (free query slots, seconds until the next one) from the interpreter's
+    /api/status, or (None, 0) if the endpoint has no status page
+    """
+    try:
+        status = client.status()
+    except (requests.exceptions.RequestException, ValueError):
+        return None, 0
+    return status['slots_available'], status['next_slot_in']
+
+
+def fetch_region(name, output_dir, batch, client):
+    """
+    Fetch one region to toilets_<name>_<batch>.json, streamed to disk
+
+    Returns:
+        The region's state entry; raises on failure
+    """
+    region = REGIONS[name]
+    output_file = os.path.join(output_dir, f"toilets_{name}_{batch}.json")
+    bbox = None if region.area_query else region.bbox
+    snapshot, summary = fetch_toilet_data(bbox=bbox, area_query=region.area_query,
+                                          output_file=output_file, client=client, stream=True)
+    if not summary:
+        raise RuntimeError(f"fetching {name} failed")
+    if 'runtime error' in summary.get('remark', ''):
+        raise RuntimeError(f"Overpass could not complete {name}: {summary['remark']}")
+    return {
+        'status': 'done',
+        'file': snapshot,
+        'elements': sum(summary['counts'].values()),
+        'timestamp': summary.get('osm3s', {}).get('timestamp_osm_base'),
+        'finished': datetime.now().isoformat(timespec='seconds'),
+    }
+
+
+def merge_regions(state, output_dir, name='merged'):
+    """Write the union of every region's snapshot, each element once"""
+    parts = [load_snapshot(state['regions'][region]['file']) for region in state['order']]
+    data = merge_snapshots(parts)
+    output_file = os.path.join(output_dir, f"toilets_{name}_{state['batch']}.json")
+    save_snapshot(data, output_file)
+    return output_file
+
+
+def run_batch(regions=DEFAULT_REGIONS, output_dir='.', client=None, max_workers=DEFAULT_MAX_WORKERS,
+              max_attempts=2, restart=False, merged_name='merged'):
+    """
+    Fetch many regions, as many at a time as the interpreter has free slots
+
+    Jobs are started in order. Before each start /api/status is asked how
+    many query slots are free; with none free the scheduler waits for a
+    running job or for the time the interpreter says the next slot frees
+    up. Interpreters without a status page get max_workers at a time.
+
+    Progress is written to batch_fetch_state.json in output_dir after every
+    job, so an interrupted batch resumes where it stopped. Once every
+    region is fetched, their snapshots are merged into
+    toilets_<merged_name>_<batch>.json and the batch is closed.
+
+    Args:
+        regions: Names from fetch_toilets.REGIONS
+        output_dir: Where snapshots and the state file go
+        client: OverpassClient (default: shared client)
+        max_workers: Upper bound on concurrent queries
+        max_attempts: Tries per region before it is given up for this run
+        restart: Ignore an unfinished batch and start over
+        merged_name: Region name of the merged snapshot
+
+    Returns:
+        The batch state dict; its 'merged' is None if some region failed
+    """
+    unknown = [name for name in regions if name not in REGIONS]
+    if unknown:
+        raise ValueError(f"Unknown regions: {', '.join(unknown)}. Known: {', '.join(REGIONS)}")
+
+    os.makedirs(output_dir, exist_ok=True)
+    state_path = os.path.join(output_dir, STATE_FILE)
+    state, resumed = load_state(state_path, regions, restart)
+    client = client or get_default_client()
+
+    queue = [name for name in state['order'] if state['regions'][name]['status'] != 'done']
+    if resumed:
+        print(f"♻️  Resuming batch {state['batch']}: {len(regions) - len(queue)} of {len(regions)} regions done")
+    print(f"🗺️  Fetching {len(queue)} regions (up to {max_workers} at a time)")
+    _save_state(state, state_path)
+
+    running = {}
+    poll_interval = MIN_POLL_INTERVAL
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while queue or running:
+            if queue and len(running) < max_workers:
+                slots, next_slot_in = free_slots(client)
+                if slots is None:
+                    slots = max_workers - len(running)
+                for name in queue[:max(0, min(slots, max_workers - len(running)))]:
+                    queue.remove(name)
+                    state['regions'][name]['attempts'] += 1
+                    state['regions'][name]['status'] = 'running'
+                    print(f"🚀 {name}: started")
+                    running[executor.submit(fetch_region, name, output_dir, state['batch'], client)] = name
+                if not running:
+                    # Every slot is taken by someone else's queries
+                    delay = min(MAX_POLL_INTERVAL, max(poll_interval, next_slot_in))
+                    print(f"⏳ No free query slot, waiting {delay:.0f}s")
+                    time.sleep(delay)
+                    poll_interval = min(MAX_POLL_INTERVAL, poll_interval * 2)
+                    continue
+                poll_interval = MIN_POLL_INTERVAL
+
+            # With jobs waiting, wake up now and then to look for freed slots
+            timeout = MAX_POLL_INTERVAL if queue else None
+            done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                job = state['regions'][name]
+                try:
+                    job.update(future.result())
+                    job.pop('error', None)
+                    print(f"✅ {name}: {job['elements']} elements")
+                except Exception as e:
+                    job['error'] = str(e)
+                    if job['attempts'] < max_attempts:
+                        job['status'] = 'pending'
+                        queue.append(name)
+                        print(f"🔁 {name}: {e}, retrying later")
+                    else:
+                        job['status'] = 'failed'
+                        print(f"❌ {name}: {e}")
+                _save_state(state, state_path)
+
+    failed = [name for name in state['order'] if state['regions'][name]['status'] != 'done']
+    if failed:
+        print(f"⚠️  {len(failed)} regions failed ({', '.join(failed)}); run again to resume")
+        return state
+
+    state['merged'] = merge_regions(state, output_dir, merged_name)
+    _save_state(state, state_path)
+    return state
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fetch many regions in one batch, resuming interrupted runs")
+    parser.add_argument('regions', nargs='*', default=list(DEFAULT_REGIONS),
+                        help=f"Region names (default: {' '.join(DEFAULT_REGIONS)})")
+    parser.add_argument('-o', '--output-dir', default='.', help="Where snapshots and progress are written")
+    parser.add_argument('--endpoint', action='append', help="Interpreter URL (repeatable)")
+    parser.add_argument('--workers', type=int, default=DEFAULT_MAX_WORKERS,
+                        help="Most queries run at once, if the interpreter has the slots")
+    parser.add_argument('--attempts', type=int, default=2, help="Tries per region in one run")
+    parser.add_argument('--restart', action='store_true', help="Start over instead of resuming")
+    parser.add_argument('--merged-name', default='merged', help="Region name of the merged snapshot")
+    parser.add_argument('--list', action='store_true', help="List the known regions and exit")
+    args = parser.parse_args()
+
+    if args.list:
+        for name, region in REGIONS.items():
+            print(f"   {name}: {region.area_query or region.bbox}")
+        return
+
+    print("🚽 Batch Toilet Fetcher")
+    print("=" * 30)
+    client = OverpassClient(endpoints=args.endpoint) if args.endpoint else None
+    try:
+        state = run_batch(args.regions, args.output_dir, client, args.workers, args.attempts,
+                          args.restart, args.merged_name)
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    if not state['merged']:
+        sys.exit(1)
+    print(f"\n🎉 Batch {state['batch']} complete, merged snapshot: {state['merged']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+from synthetic_osm import TagModel, load_anchors, write_synthetic_snapshot
+
+DEFAULT_SCALES = (1_000, 10_000, 100_000)
+DEFAULT_RESULTS_DIR = 'bench_results'
+DEFAULT_MODEL = 'toilets_norway_20250623_151225.json'
+
+# A stage this much slower (or hungrier) than the baseline is flagged
+REGRESSION_RATIO = 1.25
+
+
+def _extract_tags(input_file, work_dir):
+    from tags_analysis import extract_tags_and_values
+    extract_tags_and_values(input_file)
+
+
+def _tag_stats(input_file, work_dir):
+    from tags_analysis import compute_tag_stats
+    compute_tag_stats(input_file).to_dict()
+
+
+def _areas(input_file, work_dir):
+    from way_area_size import analyze_toilet_areas
+    analyze_toilet_areas(input_file)
+
+
+def _map(input_file, work_dir):
+    from generate_map import generate_toilet_map
+    generate_toilet_map(input_file, os.path.join(work_dir, 'map.html'))
+
+
+def _map_chunked(input_file, work_dir):
+    from generate_map import generate_toilet_map
+    generate_toilet_map(input_file, os.path.join(work_dir, 'map_chunked.html'), chunked=True)
+
+
+def _build_toilets(input_file, work_dir):
+    from build_toilets import build_toilets
+    build_toilets(input_file, os.path.join(work_dir, 'data'))
+
+
+def _to_snapshot(input_file, work_dir):
+    from snapshot_format import json_to_snapshot
+    json_to_snapshot(input_file, os.path.join(work_dir, 'snapshot.tsnap'))
+
+
+def _dedup(input_file, work_dir):
+    from dedup_toilets import dedup_snapshot
+    dedup_snapshot(input_file, os.path.join(work_dir, 'dedup.json'), os.path.join(work_dir, 'conflation.json'))
+
+
+def _cluster_tiles(input_file, work_dir):
+    from cluster_tiles import build_cluster_tiles
+    build_cluster_tiles(input_file, os.path.join(work_dir, 'clusters'))
+
+
+# Stage name -> function(input_file, work_dir), each run in a fresh process
+STAGES = {
+    'extract_tags_and_values': _extract_tags,
+    'compute_tag_stats': _tag_stats,
+    'analyze_toilet_areas': _areas,
+    'generate_toilet_map': _map,
+    'generate_toilet_map_chunked': _map_chunked,
+    'build_toilets': _build_toilets,
+    'json_to_snapshot': _to_snapshot,
+    'dedup_snapshot': _dedup,
+    'cluster_tiles': _cluster_tiles,
+}
+
+
+def run_stage_in_child(stage, input_file, work_dir):
+    """Child process entry point: run one stage and print its own timing as JSON"""
+    start = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        STAGES[stage](input_file, work_dir)
+    print(json.dumps({'stage_s': time.perf_counter() - start}))
+
+
+def _wait_with_rusage(process, timeout=None):
+    """Reap a child with os.wait4, returning (exit status, rusage) or None on timeout"""
+    deadline = time.monotonic() + timeout if timeout else None
+    delay = 0.001
+    while True:
+        pid, status, rusage = os.wait4(process.pid, os.WNOHANG)
+        if pid:
+            process.returncode = os.waitstatus_to_exitcode(status)
+            return process.returncode, rusage
+        if deadline and time.monotonic() > deadline:
+            return None
+        time.sleep(delay)
+        delay = min(delay * 2, 0.05)
+
+
+def measure_stage(stage, input_file, work_dir, timeout=None):
+    """
+    Run a stage in a subprocess and measure it
+
+    A fresh interpreter per stage keeps one stage's memory from hiding
+    another's. The peak RSS is the child's own, from os.wait4.
+
+    Returns:
+        Dict with ok, wall_s (including interpreter start-up), stage_s (the
+        stage function alone), peak_rss_mb, and error if it failed
+    """
+    command = [sys.executable, os.path.abspath(__file__), '--run-stage', stage, input_file, work_dir]
+    with tempfile.TemporaryFile() as stdout, tempfile.TemporaryFile() as stderr:
+        start = time.perf_counter()
+        process = subprocess.Popen(command, stdout=stdout, stderr=stderr,
+                                   cwd=os.path.dirname(os.path.abspath(__file__)))
+        finished = _wait_with_rusage(process, timeout)
+        wall = time.perf_counter() - start
+        if finished is None:
+            process.kill()
+            process.wait()
+            return {'ok': False, 'error': f"timed out after {timeout}s", 'wall_s': round(wall, 3)}
+
+        returncode, rusage = finished
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS
+        peak_kb = rusage.ru_maxrss / 1024 if sys.platform == 'darwin' else rusage.ru_maxrss
+        result = {'wall_s': round(wall, 3), 'peak_rss_mb': round(peak_kb / 1024, 1)}
+        stdout.seek(0)
+        stderr.seek(0)
+        if returncode != 0:
+            lines = stderr.read().decode('utf-8', errors='replace').strip().splitlines()
+            result.update(ok=False, error=lines[-1] if lines else f"exit code {returncode}")
+            return result
+        timing = json.loads(stdout.read().decode('utf-8').strip().splitlines()[-1])
+        result.update(ok=True, stage_s=round(timing['stage_s'], 3))
+        return result
+
+
+def git_commit():
+    """Current commit hash and whether the tree has uncommitted changes, or (None, None)"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=here, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=here,
+                                capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, bool(status.strip())
+
+
+def dataset_path(data_dir, count, seed):
+    return os.path.join(data_dir, f"synthetic_{count}_{seed}.json")
+
+
+def run_benchmarks(scales=DEFAULT_SCALES, stages=None, model_file=DEFAULT_MODEL, anchors_file=DEFAULT_MODEL,
+                   seed=42, data_dir=None, timeout=None):
+    """
+    Generate a synthetic snapshot per scale and time every stage on it
+
+    Datasets already in data_dir (same size and seed) are reused, so a
+    comparison run on another commit measures the same input.
+
+    Args:
+        scales: Element counts to test
+        stages: Stage names to run (default: all of STAGES)
+        model_file: Tag model for the generator (see TagModel.load)
+        anchors_file: Snapshot whose toilets the synthetic ones cluster
+            around, or None to spread them evenly
+        seed: Generator seed
+        data_dir: Where datasets are kept (default: a temporary directory)
+        timeout: Seconds before a stage is killed
+
+    Returns:
+        Results dict, ready to be saved as JSON
+    """
+    stages = list(stages or STAGES)
+    model = TagModel.load(model_file)
+    anchors = load_anchors(anchors_file) if anchors_file else None
+    commit, dirty = git_commit()
+    results = {
+        'commit': commit,
+        'dirty': dirty,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'seed': seed,
+        'model': os.path.basename(model_file),
+        'runs': [],
+    }
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        data_dir = data_dir or temp_dir
+        os.makedirs(data_dir, exist_ok=True)
+        for count in scales:
+            input_file = dataset_path(data_dir, count, seed)
+            generate_s = None
+            if not os.path.exists(input_file):
+                start = time.perf_counter()
+                write_synthetic_snapshot(input_file, count, model, seed, anchors)
+                generate_s = round(time.perf_counter() - start, 3)
+            size_mb = os.path.getsize(input_file) / 1024 / 1024
+            print(f"\n📦 {count:,} elements ({size_mb:.1f} MB)"
+                  + (f", generated in {generate_s:.1f}s" if generate_s is not None else ", reused"))
+
+            for stage in stages:
+                with tempfile.TemporaryDirectory(dir=temp_dir) as work_dir:
+                    result = measure_stage(stage, input_file, work_dir, timeout)
+                results['runs'].append({'elements': count, 'input_mb': round(size_mb, 2), 'stage': stage, **result})
+                if result['ok']:
+                    print(f"   {stage:<30}{result['wall_s']:>9.2f}s{result['peak_rss_mb']:>9.1f} MB")
+                else:
+                    print(f"   {stage:<30} ❌ {result['error']}")
+    return results
+
+
+def compare_results(results, baseline):
+    """
+    Print each stage's time and peak memory against a baseline run
+
+    Returns:
+        List of (elements, stage, metric, ratio) above REGRESSION_RATIO
+    """
+    previous = {(run['elements'], run['stage']): run for run in baseline['runs'] if run.get('ok')}
+    print(f"\n📈 Against {(baseline.get('commit') or 'unknown')[:10]}:")
+    regressions = []
+    for run in results['runs']:
+        before = previous.get((run['elements'], run['stage']))
+        if not run.get('ok') or not before:
+            continue
+        ratios = {}
+        for metric in ('stage_s', 'peak_rss_mb'):
+            if before.get(metric):
+                ratios[metric] = run[metric] / before[metric]
+                if ratios[metric] > REGRESSION_RATIO:
+                    regressions.append((run['elements'], run['stage'], metric, ratios[metric]))
+        flag = ' ⚠️' if any(ratio > REGRESSION_RATIO for ratio in ratios.values()) else ''
+        print(f"   {run['elements']:>9,} {run['stage']:<30}"
+              f"time x{ratios.get('stage_s', float('nan')):.2f}  memory x{ratios.get('peak_rss_mb', float('nan')):.2f}{flag}")
+    return regressions
+
+
+def save_results(results, results_dir=DEFAULT_RESULTS_DIR):
+    """Write results to <results_dir>/bench_<commit>_<time>.json and return the path"""
+    os.makedirs(results_dir, exist_ok=True)
+    commit = (results['commit'] or 'nocommit')[:10] + ('-dirty' if results['dirty'] else '')
+    path = os.path.join(results_dir, f"bench_{commit}_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    return path
+
+
+def main():
+    if len(sys.argv) == 5 and sys.argv[1] == '--run-stage':
+        run_stage_in_child(*sys.argv[2:])
+        return
+
+    parser = argparse.ArgumentParser(description="Time every stage on synthetic snapshots of growing size")
+    parser.add_argument('--scales', type=int, nargs='+', default=list(DEFAULT_SCALES),
+                        help="Element counts (default: %(default)s)")
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES), help="Stages to run (default: all)")
+    parser.add_argument('--tags', default=DEFAULT_MODEL,
+                        help="Tag model: a snapshot, _tag_stats.json or _tags_analysis.json")
+    parser.add_argument('--anchors', default=DEFAULT_MODEL,
+                        help="Snapshot to cluster synthetic toilets around ('' to spread evenly)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--data-dir', help="Keep generated datasets here and reuse them")
+    parser.add_argument('--timeout', type=float, help="Seconds before a stage is killed")
+    parser.add_argument('--results-dir', default=DEFAULT_RESULTS_DIR)
+    parser.add_argument('--compare', metavar='RESULTS_JSON', help="Earlier results to compare against")
+    args = parser.parse_args()
+
+    print("🚽 Scaling Benchmark")
+    print("=" * 30)
+    print(f"{'stage':<33}{'wall':>10}{'peak RSS':>12}")
+    try:
+        results = run_benchmarks(args.scales, args.stages, args.tags, args.anchors or None,
+                                 args.seed, args.data_dir, args.timeout)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"❌ Benchmark failed: {e}")
+        sys.exit(1)
+
+    path = save_results(results, args.results_dir)
+    print(f"\n💾 Results saved to {path}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            regressions = compare_results(results, json.load(f))
+        if regressions:
+            print(f"⚠️  {len(regressions)} regressions above x{REGRESSION_RATIO}")
+            sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
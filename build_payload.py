@@ -0,0 +1,272 @@
+import argparse
+import json
+import os
+from collections import Counter
+
+from geo import element_coordinates
+from snapshot_format import ELEMENT_TYPES, TYPE_CODES, load_snapshot
+from toilet_filters import FilterIndex
+
+# Tags read by the generated map page and the React app; everything else
+# (created_by, check_date, source, ...) is dropped from the payload
+PAYLOAD_TAGS = (
+    'access',
+    'fee',
+    'wheelchair',
+    'unisex',
+    'changing_table',
+    'toilets:disposal',
+    'building',
+    'opening_hours',
+    'operator',
+    'charge',
+    'description',
+    'note',
+    'image',
+)
+
+LAYOUTS = ('objects', 'arrays', 'delta')
+
+# Decimal places kept for coordinates; 5 is about 1.1 m, well below what
+# a marker can show
+DEFAULT_PRECISION = 5
+
+# Positions of the fixed fields in an arrays/delta row. The row continues
+# with any extra fields listed in the payload's 'fields', then key index,
+# value index pairs for the tags
+ROW_FIELDS = ['type', 'id', 'lat', 'lon', 'numberOfToilets']
+
+
+def project_element(element, precision=DEFAULT_PRECISION, tag_keys=PAYLOAD_TAGS):
+    """
+    Reduce an Overpass element to the fields the map uses
+
+    Ways and relations are turned into a single point with element_coordinates,
+    so the payload carries no geometry; the number of geometry points is kept
+    as numberOfToilets, which is what the React app showed as cubicles.
+
+    Args:
+        element: Overpass element dict
+        precision: Decimal places to round coordinates to
+        tag_keys: Tags to keep
+
+    Returns:
+        {type, id, lat, lon, numberOfToilets, tags}, or None for elements
+        without a usable position
+    """
+    coordinates = element_coordinates(element)
+    if not coordinates:
+        return None
+    lat, lon = coordinates
+    tags = element.get('tags') or {}
+    return {
+        'type': element['type'],
+        'id': element['id'],
+        'lat': round(lat, precision),
+        'lon': round(lon, precision),
+        'numberOfToilets': 1 if element['type'] == 'node' else len(element.get('geometry') or ()) or 1,
+        'tags': {key: tags[key] for key in tag_keys if key in tags},
+    }
+
+
+def project_elements(elements, precision=DEFAULT_PRECISION, tag_keys=PAYLOAD_TAGS):
+    """Project every element, skipping those without a position"""
+    projected = (project_element(element, precision, tag_keys) for element in elements)
+    return [toilet for toilet in projected if toilet]
+
+
+def _encode_rows(toilets, precision, delta, fields):
+    scale = 10 ** precision
+    keys = [key for key in PAYLOAD_TAGS if any(key in toilet['tags'] for toilet in toilets)]
+    key_codes = {key: code for code, key in enumerate(keys)}
+
+    # Most frequent values get the smallest indices, which are the shortest
+    # to write
+    value_counts = Counter(value for toilet in toilets for value in toilet['tags'].values())
+    value_counts.update(toilet[field] for toilet in toilets for field in fields)
+    values = [value for value, _ in sorted(value_counts.items(), key=lambda item: (-item[1], item[0]))]
+    value_codes = {value: code for code, value in enumerate(values)}
+
+    rows = []
+    previous = [0, 0, 0]
+    for toilet in toilets:
+        fixed = [toilet['id'], round(toilet['lat'] * scale), round(toilet['lon'] * scale)]
+        if delta:
+            fixed, previous = [value - last for value, last in zip(fixed, previous)], fixed
+        row = [TYPE_CODES[toilet['type']], *fixed, toilet['numberOfToilets']]
+        row.extend(value_codes[toilet[field]] for field in fields)
+        for key, value in toilet['tags'].items():
+            row.extend((key_codes[key], value_codes[value]))
+        rows.append(row)
+    return keys, values, rows
+
+
+def encode_payload(toilets, layout='arrays', precision=DEFAULT_PRECISION, osm3s=None, fields=(),
+                   filter_keys=(), display=None):
+    """
+    Write projected toilets in one of the payload layouts
+
+    Layouts:
+        objects: {"elements": [{type, id, lat, lon, numberOfToilets, tags}]},
+            readable by anything that reads Overpass JSON
+        arrays: every toilet as one row of integers (see ROW_FIELDS) with
+            coordinates scaled by 10**precision and tags as indices into
+            the shared keys and values tables
+        delta: like arrays, but rows are sorted by id and id, lat and lon
+            are written as the difference to the previous row
+
+    Args:
+        toilets: Dicts as returned by project_element
+        layout: One of LAYOUTS
+        precision: Decimal places the coordinates were rounded to
+        osm3s: The snapshot's osm3s block, for the timestamp and copyright
+        fields: Extra string fields of each toilet to write after
+            ROW_FIELDS, as indices into the values table
+        filter_keys: Attributes to add toilet_filters.FilterIndex bitsets
+            for, as 'filters', with bits in the order of the elements
+        display: display_rules.DisplayRules to add the popup display strings
+            of the tag values with, as 'display' ({key: {value: text}})
+
+    Returns:
+        The payload dict
+    """
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown layout '{layout}', expected one of: {', '.join(LAYOUTS)}")
+
+    osm3s = osm3s or {}
+    payload = {
+        'format': layout,
+        'precision': precision,
+        'timestamp': osm3s.get('timestamp_osm_base'),
+        'copyright': osm3s.get('copyright'),
+    }
+    if layout == 'delta':
+        toilets = sorted(toilets, key=lambda toilet: (toilet['id'], TYPE_CODES[toilet['type']]))
+    if filter_keys:
+        payload['filters'] = FilterIndex.from_toilets(toilets, filter_keys).to_dict()
+    if display:
+        payload['display'] = display.table(toilets)
+    if layout == 'objects':
+        payload['elements'] = toilets
+        return payload
+
+    keys, values, rows = _encode_rows(toilets, precision, layout == 'delta', list(fields))
+    payload.update({
+        'types': ELEMENT_TYPES,
+        'fields': ROW_FIELDS + list(fields),
+        'keys': keys,
+        'values': values,
+        'elements': rows,
+    })
+    return payload
+
+
+def build_payload(toilet_data, layout='arrays', precision=DEFAULT_PRECISION, filter_keys=(), display=None):
+    """
+    Build the slim map payload from Overpass data
+
+    Args:
+        toilet_data: Overpass JSON dict
+        layout: One of LAYOUTS (see encode_payload)
+        precision: Decimal places kept for coordinates
+        filter_keys: Attributes to precompute filter bitsets for
+        display: DisplayRules for the popup display strings, or None
+
+    Returns:
+        The payload dict
+    """
+    toilets = project_elements(toilet_data.get('elements', []), precision)
+    return encode_payload(toilets, layout, precision, toilet_data.get('osm3s'), filter_keys=filter_keys,
+                          display=display)
+
+
+def decode_payload(payload):
+    """
+    Turn any payload layout (or plain Overpass JSON) back into toilet dicts
+
+    This is the Python twin of decodePayload() in the map pages.
+    """
+    layout = payload.get('format')
+    if layout not in ('arrays', 'delta'):
+        return payload.get('elements', [])
+
+    scale = 10 ** payload['precision']
+    types, keys, values = payload['types'], payload['keys'], payload['values']
+    fields = payload['fields']
+    toilets = []
+    previous = [0, 0, 0]
+    for row in payload['elements']:
+        fixed = row[1:4]
+        if layout == 'delta':
+            fixed = previous = [value + last for value, last in zip(fixed, previous)]
+        toilet = {
+            'type': types[row[0]],
+            'id': fixed[0],
+            'lat': round(fixed[1] / scale, payload['precision']),
+            'lon': round(fixed[2] / scale, payload['precision']),
+            'numberOfToilets': row[4],
+        }
+        for i in range(len(ROW_FIELDS), len(fields)):
+            toilet[fields[i]] = values[row[i]]
+        toilet['tags'] = {keys[row[i]]: values[row[i + 1]] for i in range(len(fields), len(row), 2)}
+        toilets.append(toilet)
+    return toilets
+
+
+def dump_payload(payload):
+    """Serialize a payload as compact JSON"""
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':'))
+
+
+def write_payload(json_file_path, output_file=None, layout='arrays', precision=DEFAULT_PRECISION):
+    """
+    Build the slim payload for a snapshot and write it to output_file
+
+    Args:
+        json_file_path: Overpass JSON file or columnar snapshot
+        output_file: Output path (default: <input>_payload.json)
+        layout: One of LAYOUTS
+        precision: Decimal places kept for coordinates
+
+    Returns:
+        The output path, or None on failure
+    """
+    if not os.path.exists(json_file_path):
+        print(f"❌ Error: File '{json_file_path}' not found!")
+        return None
+
+    try:
+        toilet_data = load_snapshot(json_file_path)
+        payload = build_payload(toilet_data, layout, precision)
+    except Exception as e:
+        print(f"❌ Error building payload: {e}")
+        return None
+
+    if not output_file:
+        output_file = os.path.splitext(json_file_path)[0] + '_payload.json'
+
+    text = dump_payload(payload)
+    with open(output_file, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+    before = os.path.getsize(json_file_path)
+    after = len(text.encode('utf-8'))
+    print(f"📦 Wrote {len(payload['elements'])} toilets to {output_file} ({layout}, {precision} decimals)")
+    print(f"   Before: {before / 1024:,.1f} KB")
+    print(f"   After:  {after / 1024:,.1f} KB ({before / after:.1f}x smaller)")
+    return output_file
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the slim toilet payload used by the maps")
+    parser.add_argument('input', help="Overpass JSON file or columnar snapshot")
+    parser.add_argument('-o', '--output', help="Output file (default: <input>_payload.json)")
+    parser.add_argument('--layout', choices=LAYOUTS, default='arrays')
+    parser.add_argument('--precision', type=int, default=DEFAULT_PRECISION,
+                        help="Decimal places kept for coordinates")
+    args = parser.parse_args()
+    write_payload(args.input, args.output, args.layout, args.precision)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import argparse
+import os
+
+from build_payload import (DEFAULT_PRECISION, LAYOUTS, PAYLOAD_TAGS, dump_payload, encode_payload,
+                           project_element)
+from display_rules import get_default_rules
+from snapshot_format import load_snapshot
+from static_assets import print_size_report, publish
+from toilet_filters import BITSET_KEYS
+
+# Served as /data/ by the app, which reads manifest.json to find the
+# content-hashed toilets.json
+DEFAULT_OUTPUT_DIR = os.path.join('norway-toilet-map', 'public', 'data')
+ASSET_NAME = 'toilets.json'
+
+# Toilets with these access values are not shown on the map
+HIDDEN_ACCESS = ('no', 'private')
+
+# Normalized field -> source tag; missing tags become 'unknown'
+NORMALIZED_FIELDS = {
+    'access': 'access',
+    'fee': 'fee',
+    'wheelchair': 'wheelchair',
+    'unisex': 'unisex',
+    'disposal': 'toilets:disposal',
+    'building': 'building',
+}
+
+# Tags the popup still reads from toilet.tags; the rest are normalized fields
+POPUP_TAGS = tuple(key for key in PAYLOAD_TAGS if key not in NORMALIZED_FIELDS.values())
+
+
+def normalize_toilet(element, precision=DEFAULT_PRECISION):
+    """
+    Turn an Overpass element into the toilet object the React app renders
+
+    The position (the polygon centroid for ways), numberOfToilets and the
+    normalized fields are all computed here, so the app does no
+    per-element work when it loads.
+
+    Returns:
+        The toilet dict, or None if it has no position or is hidden
+    """
+    tags = element.get('tags') or {}
+    access = tags.get('access') or 'unknown'
+    if access in HIDDEN_ACCESS:
+        return None
+
+    toilet = project_element(element, precision, POPUP_TAGS)
+    if not toilet:
+        return None
+    for field, tag in NORMALIZED_FIELDS.items():
+        toilet[field] = tags.get(tag) or 'unknown'
+    return toilet
+
+
+def build_toilets(json_file_path, output_dir=DEFAULT_OUTPUT_DIR, layout='delta', precision=DEFAULT_PRECISION):
+    """
+    Build the ready-to-render toilets.json for the React app
+
+    The minified payload is published under a content-hashed name with
+    gzip (and brotli) variants, and manifest.json is pointed at it, so the
+    data file can be cached forever and only the manifest goes stale. Tag
+    values come with their popup display strings from display_rules.json.
+
+    Args:
+        json_file_path: Overpass JSON file or columnar snapshot
+        output_dir: Folder for the payload files and manifest.json
+        layout: One of build_payload.LAYOUTS
+        precision: Decimal places kept for coordinates
+
+    Returns:
+        The path of the published payload, or None on failure
+    """
+    if not os.path.exists(json_file_path):
+        print(f"❌ Error: File '{json_file_path}' not found!")
+        return None
+
+    try:
+        toilet_data = load_snapshot(json_file_path)
+    except Exception as e:
+        print(f"❌ Error reading {json_file_path}: {e}")
+        return None
+
+    elements = toilet_data.get('elements', [])
+    toilets = []
+    hidden = unplaced = ways = 0
+    for element in elements:
+        toilet = normalize_toilet(element, precision)
+        if toilet:
+            toilets.append(toilet)
+            ways += toilet['type'] != 'node'
+        elif (element.get('tags') or {}).get('access') in HIDDEN_ACCESS:
+            hidden += 1
+        else:
+            unplaced += 1
+
+    payload = encode_payload(toilets, layout, precision, toilet_data.get('osm3s'),
+                             fields=tuple(NORMALIZED_FIELDS), filter_keys=BITSET_KEYS,
+                             display=get_default_rules())
+    data = dump_payload(payload).encode('utf-8')
+    manifest = publish({ASSET_NAME: data}, output_dir)
+    output_file = os.path.join(output_dir, manifest['assets'][ASSET_NAME]['file'])
+
+    before = os.path.getsize(json_file_path)
+    print(f"🏗️  Built {len(toilets)} toilets ({ways} ways placed at their centroid) into {output_file}")
+    print(f"   Skipped {hidden} with access=no/private and {unplaced} without a position")
+    print(f"   Size: {before / 1024:,.1f} KB -> {len(data) / 1024:,.1f} KB")
+    print_size_report(manifest, [ASSET_NAME])
+    return output_file
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the React app's toilets.json from a snapshot")
+    parser.add_argument('input', help="Overpass JSON file or columnar snapshot")
+    parser.add_argument('-o', '--output-dir', default=DEFAULT_OUTPUT_DIR,
+                        help="Folder for the hashed payload files and manifest.json")
+    parser.add_argument('--layout', choices=LAYOUTS, default='delta')
+    parser.add_argument('--precision', type=int, default=DEFAULT_PRECISION,
+                        help="Decimal places kept for coordinates")
+    args = parser.parse_args()
+    build_toilets(args.input, args.output_dir, args.layout, args.precision)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,368 @@
+import argparse
+import json
+import math
+import os
+import shutil
+import sys
+from array import array
+from collections import defaultdict
+
+from build_toilets import normalize_toilet
+from instrumentation import stage
+from snapshot_format import TYPE_CODES, load_snapshot
+
+# The options MapContent.jsx gives Supercluster
+DEFAULT_RADIUS = 80
+DEFAULT_EXTENT = 512
+DEFAULT_MIN_ZOOM = 0
+DEFAULT_MAX_ZOOM = 16
+DEFAULT_MIN_POINTS = 2
+
+# Decimal places of the coordinates written to tiles
+TILE_PRECISION = 6
+
+# Highest zoom written out. Up to here a zoom's file is small next to the
+# toilets payload (about 50 KB at z9 for Norway); above it most items are
+# single toilets, which a client clusters from the payload it already has
+DEFAULT_TILE_MAX_ZOOM = 9
+
+# Row layouts of a tile's 'clusters' and 'points'
+CLUSTER_FIELDS = ['lat', 'lon', 'point_count', 'cluster_id', 'expansion_zoom']
+POINT_FIELDS = ['lat', 'lon', 'ref']
+
+
+def lng_x(lng):
+    """Longitude -> Web Mercator x in [0, 1]"""
+    return lng / 360 + 0.5
+
+
+def lat_y(lat):
+    """Latitude -> Web Mercator y in [0, 1], clamped at the poles"""
+    sin = math.sin(lat * math.pi / 180)
+    if sin >= 1:
+        return 0.0
+    if sin <= -1:
+        return 1.0
+    y = 0.5 - 0.25 * math.log((1 + sin) / (1 - sin)) / math.pi
+    return min(max(y, 0.0), 1.0)
+
+
+def x_lng(x):
+    return (x - 0.5) * 360
+
+
+def y_lat(y):
+    return 360 * math.atan(math.exp((180 - y * 360) * math.pi / 180)) / math.pi - 90
+
+
+def _fround(values):
+    """Round doubles to float32, as Supercluster stores its index coordinates"""
+    return array('f', values).tolist()
+
+
+class _Level:
+    """Points and clusters of one zoom level, in parallel lists"""
+
+    def __init__(self, x, y, ids, counts):
+        self.x = x
+        self.y = y
+        self.ids = ids            # Point index, or cluster id
+        self.counts = counts      # 1 for points
+        self.zoom = [math.inf] * len(x)
+        self.parent = [-1] * len(x)
+        self.index_x = _fround(x)
+        self.index_y = _fround(y)
+        self._grid = None
+        self._cell = None
+
+    def __len__(self):
+        return len(self.x)
+
+    def within(self, x, y, r):
+        """Items whose (float32) position is within r of (x, y), in index order"""
+        if self._cell != r:
+            self._cell = r
+            self._grid = defaultdict(list)
+            for i, (ix, iy) in enumerate(zip(self.index_x, self.index_y)):
+                self._grid[math.floor(ix / r), math.floor(iy / r)].append(i)
+        r2 = r * r
+        col, row = math.floor(x / r), math.floor(y / r)
+        found = []
+        for d_col in (-1, 0, 1):
+            for d_row in (-1, 0, 1):
+                for i in self._grid.get((col + d_col, row + d_row), ()):
+                    dx, dy = self.index_x[i] - x, self.index_y[i] - y
+                    if dx * dx + dy * dy <= r2:
+                        found.append(i)
+        found.sort()
+        return found
+
+
+class ClusterIndex:
+    """
+    Hierarchical greedy clustering per zoom level, as done by Supercluster
+
+    A port of the algorithm (and the cluster ids) of the Supercluster
+    library the React app uses. Points are projected to Web Mercator [0, 1].
+    From max_zoom down to min_zoom, each item of the level above that is
+    not yet taken absorbs every untaken item within
+    radius / (extent * 2**zoom). Together they become one cluster at their
+    weighted centroid. The level above max_zoom holds the points
+    themselves. Neighbours are summed in index order, which can differ from
+    Supercluster's k-d tree order in the last bits of a centroid.
+
+    Args:
+        points: (lat, lon, ref) tuples, in the order the app loads them
+        radius, extent, min_zoom, max_zoom, min_points: Supercluster options
+    """
+
+    def __init__(self, points, radius=DEFAULT_RADIUS, extent=DEFAULT_EXTENT, min_zoom=DEFAULT_MIN_ZOOM,
+                 max_zoom=DEFAULT_MAX_ZOOM, min_points=DEFAULT_MIN_POINTS):
+        self.points = list(points)
+        self.radius = radius
+        self.extent = extent
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+        self.min_points = min_points
+        self.children = {}
+
+        x = _fround(lng_x(lon) for _, lon, _ in self.points)
+        y = _fround(lat_y(lat) for lat, _, _ in self.points)
+        self.levels = {max_zoom + 1: _Level(x, y, list(range(len(self.points))), [1] * len(self.points))}
+        for zoom in range(max_zoom, min_zoom - 1, -1):
+            self.levels[zoom] = self._cluster(self.levels[zoom + 1], zoom)
+
+    def _cluster(self, level, zoom):
+        r = self.radius / (self.extent * 2 ** zoom)
+        x, y, ids, counts = [], [], [], []
+        for i in range(len(level)):
+            if level.zoom[i] <= zoom:
+                continue
+            level.zoom[i] = zoom
+            neighbours = [j for j in level.within(level.x[i], level.y[i], r) if level.zoom[j] > zoom]
+            origin_count = level.counts[i]
+            count = origin_count + sum(level.counts[j] for j in neighbours)
+
+            if count > origin_count and count >= self.min_points:
+                cluster_id = (i << 5) + (zoom + 1) + len(self.points)
+                wx, wy = level.x[i] * origin_count, level.y[i] * origin_count
+                for j in neighbours:
+                    level.zoom[j] = zoom
+                    wx += level.x[j] * level.counts[j]
+                    wy += level.y[j] * level.counts[j]
+                    level.parent[j] = cluster_id
+                level.parent[i] = cluster_id
+                self.children[cluster_id] = [i] + neighbours
+                x.append(wx / count)
+                y.append(wy / count)
+                ids.append(cluster_id)
+                counts.append(count)
+            else:
+                # Too few for a cluster: the item, and any untaken neighbours, move up as they are
+                for j in [i] + (neighbours if count > 1 else []):
+                    level.zoom[j] = zoom
+                    x.append(level.x[j])
+                    y.append(level.y[j])
+                    ids.append(level.ids[j])
+                    counts.append(level.counts[j])
+        return _Level(x, y, ids, counts)
+
+    def _limit_zoom(self, zoom):
+        return max(self.min_zoom, min(math.floor(zoom), self.max_zoom + 1))
+
+    def origin_zoom(self, cluster_id):
+        """The zoom level whose items formed a cluster"""
+        return (cluster_id - len(self.points)) % 32
+
+    def get_children(self, cluster_id):
+        """
+        The items one zoom level up that a cluster was made of
+
+        Returns:
+            (level zoom, item indices in that level)
+        """
+        if cluster_id not in self.children:
+            raise KeyError(f"No cluster with id {cluster_id}")
+        return self.origin_zoom(cluster_id), self.children[cluster_id]
+
+    def expansion_zoom(self, cluster_id):
+        """The zoom at which a cluster splits into more than one item"""
+        zoom = self.origin_zoom(cluster_id) - 1
+        while zoom <= self.max_zoom:
+            level_zoom, children = self.get_children(cluster_id)
+            zoom += 1
+            if len(children) != 1:
+                break
+            cluster_id = self.levels[level_zoom].ids[children[0]]
+        return zoom
+
+    def item(self, zoom, i):
+        """One item of a zoom level as a dict: a cluster or a point"""
+        level = self.levels[zoom]
+        lat, lon = y_lat(level.y[i]), x_lng(level.x[i])
+        if level.counts[i] > 1:
+            return {'cluster': True, 'lat': lat, 'lon': lon, 'point_count': level.counts[i],
+                    'cluster_id': level.ids[i]}
+        _, _, ref = self.points[level.ids[i]]
+        return {'cluster': False, 'lat': lat, 'lon': lon, 'ref': ref}
+
+    def get_clusters(self, bbox, zoom):
+        """
+        Clusters and points inside a bounding box at a zoom level
+
+        Args:
+            bbox: (south, west, north, east); must not cross the antimeridian
+            zoom: Map zoom level
+
+        Returns:
+            List of item dicts (see item)
+        """
+        south, west, north, east = bbox
+        zoom = self._limit_zoom(zoom)
+        level = self.levels[zoom]
+        min_x, max_x = lng_x(max(west, -180)), lng_x(min(east, 180))
+        min_y, max_y = lat_y(min(north, 90)), lat_y(max(south, -90))
+        return [self.item(zoom, i) for i in range(len(level))
+                if min_x <= level.index_x[i] <= max_x and min_y <= level.index_y[i] <= max_y]
+
+
+def load_points(json_file_path):
+    """
+    The app's toilets as (lat, lon, ref), in the order toilets.json lists them
+
+    Supercluster's result depends on the order of its input, so points are
+    taken the way build_toilets.py writes them: hidden toilets dropped,
+    ways at their centroid, sorted by id and type.
+    """
+    toilets = [toilet for toilet in map(normalize_toilet, load_snapshot(json_file_path).get('elements', []))
+               if toilet]
+    toilets.sort(key=lambda toilet: (toilet['id'], TYPE_CODES[toilet['type']]))
+    return [(toilet['lat'], toilet['lon'], f"{toilet['type']}/{toilet['id']}") for toilet in toilets]
+
+
+def tile_of(x, y, zoom):
+    """The z/x/y tile containing a Web Mercator position"""
+    tiles = 2 ** zoom
+    return min(tiles - 1, math.floor(x * tiles)), min(tiles - 1, math.floor(y * tiles))
+
+
+def write_cluster_tiles(index, output_dir, tile_max_zoom=DEFAULT_TILE_MAX_ZOOM):
+    """
+    Write the low zoom levels' clusters as one <zoom>.json per level plus index.json
+
+    Each zoom file maps "x/y" (standard slippy-map numbering) to the
+    clusters and points whose position falls inside that tile, with their
+    expansion zoom precomputed. A zoom is one file rather than a file per
+    tile, since at these zooms most of a level is in view anyway and
+    thousands of tiny files cost more to write, hash and copy than they
+    save. index.json lists the options and each zoom's non-empty tiles with
+    the number of toilets in them.
+
+    Args:
+        index: ClusterIndex
+        output_dir: Folder for the zoom files and index.json
+        tile_max_zoom: Highest zoom written (capped at the index's max_zoom + 1)
+
+    Returns:
+        The index dict
+    """
+    if os.path.isdir(output_dir):
+        shutil.rmtree(output_dir)  # Drop tiles left over from an older snapshot
+    os.makedirs(output_dir)
+
+    summary = {
+        'radius': index.radius,
+        'extent': index.extent,
+        'min_zoom': index.min_zoom,
+        'max_zoom': index.max_zoom,
+        'min_points': index.min_points,
+        'tile_max_zoom': min(tile_max_zoom, index.max_zoom + 1),
+        'total': len(index.points),
+        'cluster_fields': CLUSTER_FIELDS,
+        'point_fields': POINT_FIELDS,
+        'zooms': {},
+    }
+    for zoom in range(index.min_zoom, summary['tile_max_zoom'] + 1):
+        level = index.levels[zoom]
+        tiles = defaultdict(lambda: {'clusters': [], 'points': []})
+        counts = defaultdict(int)
+        for i in range(len(level)):
+            key = tile_of(level.x[i], level.y[i], zoom)
+            item = index.item(zoom, i)
+            lat, lon = round(item['lat'], TILE_PRECISION), round(item['lon'], TILE_PRECISION)
+            if item['cluster']:
+                tiles[key]['clusters'].append([lat, lon, item['point_count'], item['cluster_id'],
+                                               index.expansion_zoom(item['cluster_id'])])
+                counts[key] += item['point_count']
+            else:
+                tiles[key]['points'].append([lat, lon, item['ref']])
+                counts[key] += 1
+
+        with open(os.path.join(output_dir, f"{zoom}.json"), 'w', encoding='utf-8') as f:
+            json.dump({f"{x}/{y}": tiles[x, y] for x, y in sorted(tiles)}, f, separators=(',', ':'))
+        summary['zooms'][str(zoom)] = {f"{x}/{y}": counts[x, y] for x, y in sorted(tiles)}
+
+    with open(os.path.join(output_dir, 'index.json'), 'w', encoding='utf-8') as f:
+        json.dump(summary, f, separators=(',', ':'))
+    return summary
+
+
+def build_cluster_tiles(json_file_path, output_dir, radius=DEFAULT_RADIUS, max_zoom=DEFAULT_MAX_ZOOM,
+                        tile_max_zoom=DEFAULT_TILE_MAX_ZOOM):
+    """
+    Cluster a snapshot's toilets and write the low zoom levels
+
+    Args:
+        json_file_path: Overpass JSON file or columnar snapshot
+        output_dir: Folder for the <zoom>.json files and index.json
+        radius: Cluster radius in pixels of a 512 px tile
+        max_zoom: Highest zoom level that is clustered (sets expansion zooms)
+        tile_max_zoom: Highest zoom level written out
+
+    Returns:
+        output_dir, or None on failure
+    """
+    if not os.path.exists(json_file_path):
+        print(f"❌ Error: File '{json_file_path}' not found!")
+        return None
+
+    try:
+        with stage('load') as s:
+            points = load_points(json_file_path)
+            s.record(elements=len(points))
+    except Exception as e:
+        print(f"❌ Error reading {json_file_path}: {e}")
+        return None
+
+    with stage('cluster'):
+        index = ClusterIndex(points, radius=radius, max_zoom=max_zoom)
+    with stage('write_tiles') as s:
+        summary = write_cluster_tiles(index, output_dir, tile_max_zoom)
+        s.record(files=len(summary['zooms']) + 1)
+
+    print(f"🔵 Clustered {len(points)} toilets into {output_dir} "
+          f"(radius {radius}, zoom 0-{max_zoom}, written up to {summary['tile_max_zoom']})")
+    for zoom, tiles in summary['zooms'].items():
+        items = len(index.levels[int(zoom)])
+        size = os.path.getsize(os.path.join(output_dir, f"{zoom}.json"))
+        print(f"   z{zoom:>2}: {items:>6} items in {len(tiles):>5} tiles, {size / 1024:,.1f} KB")
+    return output_dir
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute the map's marker clusters for the low zoom levels")
+    parser.add_argument('input', help="Overpass JSON file or columnar snapshot")
+    parser.add_argument('-o', '--output-dir', help="Output folder (default: <input>_clusters)")
+    parser.add_argument('--radius', type=int, default=DEFAULT_RADIUS, help="Cluster radius in pixels")
+    parser.add_argument('--max-zoom', type=int, default=DEFAULT_MAX_ZOOM, help="Highest clustered zoom level")
+    parser.add_argument('--tile-max-zoom', type=int, default=DEFAULT_TILE_MAX_ZOOM,
+                        help="Highest zoom level written out")
+    args = parser.parse_args()
+
+    output_dir = args.output_dir or os.path.splitext(args.input)[0] + '_clusters'
+    if not build_cluster_tiles(args.input, output_dir, args.radius, args.max_zoom, args.tile_max_zoom):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,378 @@
+import argparse
+import json
+import math
+import os
+import sys
+from collections import defaultdict
+
+from geo import EARTH_RADIUS_M, element_coordinates, haversine_m
+from snapshot_format import SNAPSHOT_EXTENSION, is_snapshot, load_snapshot, write_snapshot
+
+# Two toilets closer than this are taken to be the same facility
+DEFAULT_DISTANCE_M = 10.0
+
+# Elements that disagree on any of these are never merged, however close:
+# two differently named toilets, or toilets on different floors, are two
+# toilets
+DISTINCT_KEYS = ('name', 'ref', 'level')
+
+METRES_PER_DEGREE = EARTH_RADIUS_M * math.pi / 180
+
+# Representative preference: a way keeps the building outline and gives
+# the better position, so it wins over nodes inside it
+TYPE_PREFERENCE = {'way': 0, 'relation': 1, 'node': 2}
+
+
+def element_ref(element):
+    return f"{element['type']}/{element['id']}"
+
+
+class SpatialGrid:
+    """
+    Uniform hash grid over lat/lon with cells at least cell_m wide
+
+    Cells are a fixed number of degrees. Their longitude width is sized for
+    the highest latitude in the data, where a degree of longitude is
+    shortest, so a cell is never narrower than cell_m anywhere and every
+    pair within cell_m lies in the same or an adjacent cell.
+    """
+
+    def __init__(self, cell_m, max_abs_lat):
+        self.cell_lat = cell_m / METRES_PER_DEGREE
+        self.cell_lon = self.cell_lat / max(math.cos(math.radians(min(max_abs_lat, 89.0))), 1e-6)
+        self.cells = defaultdict(list)
+
+    def key(self, lat, lon):
+        return math.floor(lat / self.cell_lat), math.floor(lon / self.cell_lon)
+
+    def insert(self, index, lat, lon):
+        self.cells[self.key(lat, lon)].append(index)
+
+    def neighbours(self, lat, lon):
+        """Indexes in the cell of (lat, lon) and the 8 cells around it"""
+        row, col = self.key(lat, lon)
+        for d_row in (-1, 0, 1):
+            for d_col in (-1, 0, 1):
+                yield from self.cells.get((row + d_row, col + d_col), ())
+
+    def in_bounds(self, south, west, north, east):
+        """Indexes in every cell overlapping a bounding box"""
+        row0, col0 = self.key(south, west)
+        row1, col1 = self.key(north, east)
+        if (row1 - row0 + 1) * (col1 - col0 + 1) > len(self.cells):
+            # A huge box: walking the occupied cells is cheaper
+            for (row, col), indexes in self.cells.items():
+                if row0 <= row <= row1 and col0 <= col <= col1:
+                    yield from indexes
+            return
+        for row in range(row0, row1 + 1):
+            for col in range(col0, col1 + 1):
+                yield from self.cells.get((row, col), ())
+
+
+def point_in_ring(lat, lon, ring):
+    """Even-odd ray casting test of a point against a closed ring of (lat, lon)"""
+    inside = False
+    lat_j, lon_j = ring[-1]
+    for lat_i, lon_i in ring:
+        if (lat_i > lat) != (lat_j > lat):
+            if lon < (lon_j - lon_i) * (lat - lat_i) / (lat_j - lat_i) + lon_i:
+                inside = not inside
+        lat_j, lon_j = lat_i, lon_i
+    return inside
+
+
+def way_ring(element):
+    """The closed ring of a way's geometry as (lat, lon) tuples, or None"""
+    points = [(point['lat'], point['lon']) for point in element.get('geometry') or () if point]
+    if len(points) >= 4 and points[0] == points[-1]:
+        return points
+    return None
+
+
+class _Clusters:
+    """
+    Union-find over element indexes that refuses to join conflicting names
+
+    Joins are not allowed to chain: members are kept per cluster so a join
+    can be checked against every member, not just the two linked elements.
+    """
+
+    def __init__(self, elements, positions):
+        self.parent = list(range(len(elements)))
+        self.positions = positions
+        self.members = [[i] for i in range(len(elements))]
+        self.identity = [
+            {key: (element.get('tags') or {})[key]
+             for key in DISTINCT_KEYS if key in (element.get('tags') or {})}
+            for element in elements
+        ]
+
+    def find(self, i):
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, a, b):
+        """Join the clusters of a and b; False if they disagree on a DISTINCT_KEYS tag"""
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a == root_b:
+            return True
+        identity_a, identity_b = self.identity[root_a], self.identity[root_b]
+        if any(identity_a[key] != identity_b[key] for key in identity_a.keys() & identity_b.keys()):
+            return False
+        if root_b < root_a:
+            root_a, root_b = root_b, root_a
+            identity_a, identity_b = identity_b, identity_a
+        self.parent[root_b] = root_a
+        identity_a.update(identity_b)
+        self.members[root_a].extend(self.members[root_b])
+        self.members[root_b] = []
+        return True
+
+    def within(self, a, b, distance_m):
+        """Whether every member of a's cluster is within distance_m of every member of b's"""
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a == root_b:
+            return True
+        for i in self.members[root_a]:
+            for j in self.members[root_b]:
+                if self.positions[i] and self.positions[j] and \
+                        haversine_m(*self.positions[i], *self.positions[j]) > distance_m:
+                    return False
+        return True
+
+
+def cluster_extent(positions):
+    """Largest distance in metres between two located members"""
+    located = [position for position in positions if position]
+    return max((haversine_m(*a, *b) for n, a in enumerate(located) for b in located[n + 1:]), default=0.0)
+
+
+def find_duplicates(elements, distance_m=DEFAULT_DISTANCE_M):
+    """
+    Find the pairs of elements that map the same toilet
+
+    Two kinds of pair are found with one spatial hash grid, so each element
+    is only compared with its neighbours and the run time stays roughly
+    linear in the number of elements:
+
+    - 'inside': a node inside the closed ring of a way (the toilet node in
+      its building)
+    - 'near': two elements whose positions (node location, way centroid)
+      are within distance_m of each other
+
+    Args:
+        elements: Overpass elements
+        distance_m: Distance for 'near' pairs in metres
+
+    Returns:
+        (pairs, positions): pairs as (i, j, reason, distance_m) with i < j,
+        sorted; positions as (lat, lon) or None per element
+    """
+    positions = [element_coordinates(element) for element in elements]
+    located = [i for i, position in enumerate(positions) if position]
+    if not located:
+        return [], positions
+
+    max_abs_lat = max(abs(positions[i][0]) for i in located)
+    grid = SpatialGrid(distance_m, max_abs_lat)
+    for i in located:
+        grid.insert(i, *positions[i])
+
+    pairs = {}
+    for i in located:
+        lat, lon = positions[i]
+        for j in grid.neighbours(lat, lon):
+            if j <= i:
+                continue
+            distance = haversine_m(lat, lon, *positions[j])
+            if distance <= distance_m:
+                pairs[(i, j)] = ('near', distance)
+
+    for i, element in enumerate(elements):
+        if element['type'] != 'way':
+            continue
+        ring = way_ring(element)
+        if not ring:
+            continue
+        lats = [point[0] for point in ring]
+        lons = [point[1] for point in ring]
+        for j in grid.in_bounds(min(lats), min(lons), max(lats), max(lons)):
+            if elements[j]['type'] != 'node' or not point_in_ring(*positions[j], ring):
+                continue
+            pair = (min(i, j), max(i, j))
+            distance = haversine_m(*positions[i], *positions[j]) if positions[i] else 0.0
+            pairs[pair] = ('inside', distance)
+
+    return sorted((i, j, reason, distance) for (i, j), (reason, distance) in pairs.items()), positions
+
+
+def _preference(element):
+    return (TYPE_PREFERENCE.get(element['type'], 9), -len(element.get('tags') or {}), element['id'])
+
+
+def merge_cluster(members):
+    """
+    Merge a cluster of elements into its representative
+
+    The representative is the preferred element (ways first, then the one
+    with the most tags, then the lowest id). Tags are taken from members
+    in that same order, so a key keeps the first value found; differing
+    values are reported as conflicts.
+
+    Returns:
+        (merged element, conflicts) where conflicts maps key -> {ref: value}
+    """
+    ordered = sorted(members, key=_preference)
+    merged_tags = {}
+    values = defaultdict(dict)
+    for element in ordered:
+        for key, value in (element.get('tags') or {}).items():
+            merged_tags.setdefault(key, value)
+            values[key][element_ref(element)] = value
+    conflicts = {key: by_ref for key, by_ref in sorted(values.items()) if len(set(by_ref.values())) > 1}
+    return {**ordered[0], 'tags': merged_tags}, conflicts
+
+
+def dedup_elements(elements, distance_m=DEFAULT_DISTANCE_M):
+    """
+    Merge duplicate toilets in a list of Overpass elements
+
+    'near' links only join clusters whose members all stay within
+    distance_m of each other, so a row of toilets a few metres apart is not
+    chained into one. 'inside' links always join: a node in a building can
+    be further than distance_m from the building's centroid.
+
+    Returns:
+        (elements, report): the deduplicated elements in input order (each
+        cluster at its representative's position) and the conflation report
+    """
+    pairs, positions = find_duplicates(elements, distance_m)
+    clusters = _Clusters(elements, positions)
+    links = []
+    refused = []
+    for i, j, reason, distance in pairs:
+        link = {'a': element_ref(elements[i]), 'b': element_ref(elements[j]),
+                'reason': reason, 'distance_m': round(distance, 2)}
+        if reason == 'near' and not clusters.within(i, j, distance_m):
+            refused.append({**link, 'refused': 'extent'})
+        elif clusters.union(i, j):
+            links.append((i, link))
+        else:
+            refused.append({**link, 'refused': 'tags'})
+
+    members = defaultdict(list)
+    for i in range(len(elements)):
+        members[clusters.find(i)].append(i)
+    cluster_links = defaultdict(list)
+    for i, link in links:
+        cluster_links[clusters.find(i)].append(link)
+
+    output = []
+    report_clusters = []
+    for i, element in enumerate(elements):
+        root = clusters.find(i)
+        if len(members[root]) == 1:
+            output.append(element)
+            continue
+        if i != min(members[root], key=lambda j: _preference(elements[j])):
+            continue  # Emitted where its representative is
+        merged, conflicts = merge_cluster([elements[j] for j in members[root]])
+        output.append(merged)
+        report_clusters.append({
+            'representative': element_ref(merged),
+            'members': sorted(element_ref(elements[j]) for j in members[root]),
+            'extent_m': round(cluster_extent([positions[j] for j in members[root]]), 2),
+            'links': cluster_links[root],
+            'conflicts': conflicts,
+        })
+
+    counts = defaultdict(int)
+    for _, link in links:
+        counts[link['reason']] += 1
+    report = {
+        'distance_m': distance_m,
+        'input_elements': len(elements),
+        'output_elements': len(output),
+        'removed': len(elements) - len(output),
+        'clusters': len(report_clusters),
+        'links': dict(sorted(counts.items())),
+        'unlocated': sum(1 for position in positions if position is None),
+        'refused': refused,
+        'merged': report_clusters,
+    }
+    return output, report
+
+
+def dedup_snapshot(input_file, output_file=None, report_file=None, distance_m=DEFAULT_DISTANCE_M):
+    """
+    Deduplicate a snapshot and write the result plus a conflation report
+
+    Reads Overpass JSON or a columnar snapshot and writes the same format
+    (chosen by output_file's extension).
+
+    Args:
+        input_file: Snapshot to deduplicate
+        output_file: Deduplicated snapshot (default: <input>_dedup.<ext>)
+        report_file: Conflation report (default: <input>_conflation.json)
+        distance_m: Distance under which two toilets are merged
+
+    Returns:
+        The report dict, or None on failure
+    """
+    base, ext = os.path.splitext(input_file)
+    if not output_file:
+        output_file = f"{base}_dedup{SNAPSHOT_EXTENSION if is_snapshot(input_file) else ext}"
+    if not report_file:
+        report_file = f"{base}_conflation.json"
+
+    try:
+        data = load_snapshot(input_file)
+    except Exception as e:
+        print(f"❌ Error reading {input_file}: {e}")
+        return None
+
+    elements, report = dedup_elements(data.get('elements', []), distance_m)
+    report['input'] = os.path.basename(input_file)
+    deduped = {**data, 'elements': elements}
+
+    try:
+        if output_file.endswith(SNAPSHOT_EXTENSION):
+            write_snapshot(deduped, output_file)
+        else:
+            with open(output_file, 'w', encoding='utf-8') as f:
+                json.dump(deduped, f, indent=2, ensure_ascii=False)
+        with open(report_file, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    except OSError as e:
+        print(f"❌ Error writing output: {e}")
+        return None
+
+    print(f"🧹 {report['input_elements']} elements -> {report['output_elements']} "
+          f"({report['removed']} duplicates in {report['clusters']} clusters, "
+          f"{len(report['refused'])} refused)")
+    for reason, count in report['links'].items():
+        print(f"   {reason}: {count} links")
+    print(f"💾 Saved {output_file} and {report_file}")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge toilets mapped twice (node in building, nearby nodes)")
+    parser.add_argument('snapshot', help="Overpass JSON or .tsnap snapshot")
+    parser.add_argument('-d', '--distance', type=float, default=DEFAULT_DISTANCE_M,
+                        help=f"Merge toilets closer than this many metres (default {DEFAULT_DISTANCE_M:g})")
+    parser.add_argument('-o', '--output', help="Deduplicated snapshot (default: <snapshot>_dedup)")
+    parser.add_argument('--report', help="Conflation report (default: <snapshot>_conflation.json)")
+    args = parser.parse_args()
+
+    print("🚽 Toilet Deduplication")
+    print("=" * 30)
+    if dedup_snapshot(args.snapshot, args.output, args.report, args.distance) is None:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+import functools
+import json
+import os
+import re
+import sys
+
+from snapshot_format import load_snapshot
+from toilet_filters import toilet_value
+
+DEFAULT_RULES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'display_rules.json')
+
+
+def as_is(value, currencies):
+    return value
+
+
+def capitalize(value, currencies):
+    return value[:1].upper() + value[1:]
+
+
+@functools.lru_cache(maxsize=None)
+def currency_pattern(currencies):
+    """
+    One regex matching any of the currency codes as a whole word
+
+    Letters may not touch the code, but digits may: '15nok' is a price, while
+    'kronokk' holds no currency. Plain \\b would miss '15nok'.
+    """
+    codes = '|'.join(re.escape(code) for code in currencies)
+    return re.compile(rf'(?<![^\W\d_])(?:{codes})(?![^\W\d_])', re.I)
+
+
+def currency(value, currencies):
+    """Currency codes in capitals ('50 nok' -> '50 NOK'); values without one are capitalized"""
+    if not currencies:
+        return capitalize(value, currencies)
+    codes = {code.lower(): code for code in currencies}
+    value, found = currency_pattern(currencies).subn(lambda match: codes[match.group(0).lower()], value)
+    return value if found else capitalize(value, currencies)
+
+
+# Rule name in display_rules.json -> function(value, currencies)
+TRANSFORMS = {
+    'as_is': as_is,
+    'capitalize': capitalize,
+    'currency': currency,
+}
+
+
+class DisplayRules:
+    """
+    How tag values are written in popups, as declared in display_rules.json
+
+    Each tag key names one of TRANSFORMS; keys without a rule are shown as
+    they are. Every (key, value) pair is formatted once and remembered, and
+    table() collects the results for a whole dataset so the build can ship
+    them instead of each client formatting values per popup.
+
+    Args:
+        rules: Tag key -> rule name
+        currencies: Codes the 'currency' rule writes in capitals
+    """
+
+    def __init__(self, rules, currencies=()):
+        unknown = sorted(set(rules.values()) - set(TRANSFORMS))
+        if unknown:
+            raise ValueError(f"Unknown display rule(s) {', '.join(unknown)}, "
+                             f"expected one of: {', '.join(TRANSFORMS)}")
+        self.rules = dict(rules)
+        self.currencies = tuple(currencies)
+        self._shown = {}
+
+    @classmethod
+    def load(cls, path=DEFAULT_RULES_FILE):
+        with open(path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        return cls(config.get('rules', {}), config.get('currencies', ()))
+
+    def display(self, key, value):
+        """The display string of a tag value"""
+        pair = (key, value)
+        if pair not in self._shown:
+            transform = TRANSFORMS[self.rules[key]] if key in self.rules else as_is
+            self._shown[pair] = transform(value, self.currencies)
+        return self._shown[pair]
+
+    def table(self, toilets, keys=None):
+        """
+        Display strings for every value of the ruled keys in a dataset
+
+        Values read from a toilet's tags or its normalized fields, like
+        toilet_filters.toilet_value. Only values whose display string
+        differs are listed; anything missing is shown as it is.
+
+        Returns:
+            {key: {value: display string}}
+        """
+        table = {}
+        for key in keys or self.rules:
+            shown = {}
+            for toilet in toilets:
+                value = toilet_value(toilet, key)
+                if isinstance(value, str) and value not in shown:
+                    shown[value] = self.display(key, value)
+            changed = {value: text for value, text in sorted(shown.items()) if text != value}
+            if changed:
+                table[key] = changed
+        return table
+
+
+_default_rules = None
+
+
+def get_default_rules():
+    """The rules in display_rules.json next to this module, loaded once"""
+    global _default_rules
+    if _default_rules is None:
+        _default_rules = DisplayRules.load()
+    return _default_rules
+
+
+def main():
+    """Show how a snapshot's tag values will be displayed"""
+    if len(sys.argv) < 2:
+        print("Usage: python display_rules.py <json_file_path> [rules_file]")
+        print("Example: python display_rules.py toilets_norway_20250623_151225.json")
+        return
+
+    rules = DisplayRules.load(sys.argv[2]) if len(sys.argv) > 2 else get_default_rules()
+    elements = load_snapshot(sys.argv[1]).get('elements', [])
+    for key, shown in rules.table(elements).items():
+        print(f"🏷️  {key} ({rules.rules[key]}): {len(shown)} values reformatted")
+        for value, text in list(shown.items())[:5]:
+            print(f"   {value!r} -> {text!r}")
+
+
+if __name__ == "__main__":
+    main()
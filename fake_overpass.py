@@ -0,0 +1,211 @@
+import json
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+BBOX_PATTERN = re.compile(r'\(bbox:\s*(-?[\d.]+)\s*,\s*(-?[\d.]+)\s*,\s*(-?[\d.]+)\s*,\s*(-?[\d.]+)\s*\)')
+NEWER_PATTERN = re.compile(r'newer:"([^"]+)"')
+
+
+def element_in_bbox(element, bbox):
+    """Check whether a node lies in, or a way's bounds intersect, the bbox"""
+    south, west, north, east = bbox
+    if element['type'] == 'node':
+        return south <= element['lat'] <= north and west <= element['lon'] <= east
+    bounds = element.get('bounds')
+    if not bounds:
+        return False
+    return not (bounds['maxlat'] < south or bounds['minlat'] > north or
+                bounds['maxlon'] < west or bounds['minlon'] > east)
+
+
+class FakeOverpassServer:
+    """
+    Local stand-in for the Overpass interpreter, serving a saved snapshot
+
+    Answers POST /api/interpreter with the snapshot's elements, filtered by
+    the (bbox:...) clause of the query if there is one. Area clauses are
+    ignored, so the snapshot is assumed to already cover the area. Delta
+    queries are supported in a simplified form: with a newer:"..." filter
+    only elements whose 'timestamp' is later are returned in full, and an
+    'out ids' statement appends the ids of every matching element.
+
+    GET /api/status answers in Overpass' plain-text status format, reporting
+    the configured number of free slots.
+
+    Args:
+        data: Overpass document to serve
+        latency: Seconds to sleep before answering each query
+        max_elements: Answer with an Overpass 'out of memory' runtime error
+            when a query would return more elements than this
+        errors: HTTP status codes to answer the first queries with, in order
+            (e.g. [429, 504] fails the first two queries)
+        error_rate: Probability of answering any later query with error_status
+        error_status: Status code used for error_rate failures
+        slots: Free query slots reported by /api/status
+        slot_wait: Seconds until the next slot frees up, reported when
+            slots is 0
+        etag: ETag sent with every answer; a query whose If-None-Match
+            matches it is answered 304 Not Modified
+
+    Use as a context manager; the interpreter URL is available as .url and
+    every received query is recorded in .queries.
+    """
+
+    def __init__(self, data, latency=0.0, max_elements=None, errors=None, error_rate=0.0,
+                 error_status=429, slots=2, slot_wait=1, etag=None, host='127.0.0.1', port=0):
+        self.data = data
+        self.latency = latency
+        self.max_elements = max_elements
+        self.errors = list(errors or [])
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.slots = slots
+        self.slot_wait = slot_wait
+        self.etag = etag
+        self.queries = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/api/interpreter"
+
+    def status_text(self):
+        """Plain-text body of /api/status"""
+        lines = ["Connected as: 2130706433", "Current time: 2025-06-23T13:11:31Z", "Rate limit: 2"]
+        if self.slots:
+            lines.append(f"{self.slots} slots available now.")
+        else:
+            lines.append(f"Slot available after: 2025-06-23T13:11:32Z, in {self.slot_wait} seconds.")
+        lines.append("Currently running queries (pid, space limit, time limit, start time):")
+        return "\n".join(lines) + "\n"
+
+    def answer(self, query):
+        """Build the (status, document) answer for an Overpass query"""
+        with self._lock:
+            self.queries.append(query)
+            injected = self.errors.pop(0) if self.errors else None
+        if injected is None and self.error_rate and random.random() < self.error_rate:
+            injected = self.error_status
+        if injected is not None:
+            return injected, {'remark': f'fake_overpass injected error {injected}'}
+
+        elements = self.data.get('elements', [])
+        match = BBOX_PATTERN.search(query)
+        if match:
+            bbox = tuple(float(value) for value in match.groups())
+            elements = [el for el in elements if element_in_bbox(el, bbox)]
+
+        output = elements
+        match = NEWER_PATTERN.search(query)
+        if match:
+            since = match.group(1)
+            output = [el for el in elements if el.get('timestamp', '') > since]
+        if 'out ids' in query:
+            output = output + [{'type': el['type'], 'id': el['id']} for el in elements]
+
+        document = {
+            'version': self.data.get('version', 0.6),
+            'generator': 'fake_overpass',
+            'osm3s': self.data.get('osm3s', {}),
+            'elements': output,
+        }
+        if self.max_elements is not None and len(elements) > self.max_elements:
+            document['elements'] = []
+            document['remark'] = 'runtime error: Query run out of memory using about 2048 MB of RAM.'
+        return 200, document
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                form = parse_qs(self.rfile.read(length).decode('utf-8'))
+                query = form.get('data', [''])[0]
+
+                if server.latency:
+                    time.sleep(server.latency)
+
+                if server.etag and self.headers.get('If-None-Match') == server.etag:
+                    with server._lock:
+                        server.queries.append(query)
+                    self.send_response(304)
+                    self.send_header('ETag', server.etag)
+                    self.end_headers()
+                    return
+
+                status, document = server.answer(query)
+                body = json.dumps(document).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                if server.etag:
+                    self.send_header('ETag', server.etag)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if not self.path.rstrip('/').endswith('/api/status'):
+                    self.send_error(404)
+                    return
+                body = server.status_text().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    """Serve a snapshot file as a local Overpass interpreter"""
+    if len(sys.argv) < 2:
+        print("Usage: python fake_overpass.py <json_file_path> [port]")
+        print("Example: python fake_overpass.py toilets_oslo_20250623_151209.json 8080")
+        return
+
+    with open(sys.argv[1], 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 8080
+
+    server = FakeOverpassServer(data, port=port)
+    print(f"🧪 Fake Overpass serving {len(data.get('elements', []))} elements at {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
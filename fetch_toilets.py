@@ -2,45 +2,167 @@ import requests
 import json
 from datetime import datetime
 import os
+import sys
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
-def fetch_toilet_data(bbox=None, area_query=None, output_file=None):
+from instrumentation import enable_from_args, file_size, instrumented, stage
+from overpass_cache import get_default_cache, query_overpass
+from overpass_client import OverpassError, OverpassTimeout, get_default_client
+from overpass_stream import summarize
+from snapshot_catalog import record_snapshot, region_from_name
+
+OSLO_BBOX = (59.7, 10.6, 60.0, 11.0)
+NORWAY_AREA = 'area["ISO3166-1"="NO"]'
+# Covers mainland Norway, Svalbard and Jan Mayen
+NORWAY_BBOX = (57.9, -9.1, 81.0, 33.7)
+
+# A named region: countries are queried by their ISO area (the bbox is only
+# used to split tiled fetches), cities by their bbox
+Region = namedtuple('Region', ['bbox', 'area_query'])
+
+REGIONS = {
+    'norway': Region(NORWAY_BBOX, NORWAY_AREA),
+    'sweden': Region((55.0, 10.5, 69.1, 24.2), 'area["ISO3166-1"="SE"]'),
+    'denmark': Region((54.5, 7.9, 57.8, 15.3), 'area["ISO3166-1"="DK"]'),
+    'finland': Region((59.6, 20.4, 70.1, 31.6), 'area["ISO3166-1"="FI"]'),
+    'oslo': Region(OSLO_BBOX, None),
+    'bergen': Region((60.30, 5.20, 60.48, 5.45), None),
+    'trondheim': Region((63.36, 10.25, 63.46, 10.55), None),
+    'stavanger': Region((58.90, 5.60, 59.00, 5.80), None),
+    'stockholm': Region((59.20, 17.80, 59.45, 18.25), None),
+    'gothenburg': Region((57.60, 11.80, 57.80, 12.10), None),
+    'copenhagen': Region((55.60, 12.45, 55.75, 12.65), None),
+    'helsinki': Region((60.13, 24.80, 60.30, 25.10), None),
+}
+
+ELEMENT_TYPE_ORDER = {'node': 0, 'way': 1, 'relation': 2}
+
+
+class TileFailed(Exception):
+    """Raised when Overpass could not answer a tile query (timeout or too large)"""
+
+
+def build_query(bbox=None, area_query=None, timeout=25):
     """
-    Fetch toilet data from OpenStreetMap using Overpass API
+    Build the Overpass query for toilets inside a bbox, an area, or both
     
     Args:
-        bbox: Bounding box as tuple (south, west, north, east) for Oslo: (59.7, 10.6, 60.0, 11.0)
-        area_query: Area query string like 'area["ISO3166-1"="NO"]' for Norway
-        output_file: Output filename (default: toilets_YYYYMMDD_HHMMSS.json)
+        bbox: Bounding box as tuple (south, west, north, east)
+        area_query: Area query string like 'area["ISO3166-1"="NO"]'
+        timeout: Server-side query timeout in seconds
     """
-    
-    # Default to Oslo if no parameters provided
-    if not bbox and not area_query:
-        bbox = (59.7, 10.6, 60.0, 11.0)  # Oslo bounding box
-        print("Using default Oslo bounding box")
-    
-    # Construct the Overpass query
+    bbox_filter = ""
     if bbox:
         south, west, north, east = bbox
-        query = f"""
-        [out:json][timeout:25];
+        bbox_filter = f"(bbox:{south},{west},{north},{east})"
+    
+    if area_query:
+        return f"""
+        [out:json][timeout:{timeout}];
+        {area_query}->.searchArea;
         (
-            node["amenity"="toilets"](bbox:{south},{west},{north},{east});
-            way["amenity"="toilets"](bbox:{south},{west},{north},{east});
+            node["amenity"="toilets"](area.searchArea){bbox_filter};
+            way["amenity"="toilets"](area.searchArea){bbox_filter};
         );
         out geom;
         """
-        location_name = "oslo" if bbox == (59.7, 10.6, 60.0, 11.0) else "custom_bbox"
-    else:
-        query = f"""
-        [out:json][timeout:25];
-        {area_query}->.searchArea;
+    
+    return f"""
+        [out:json][timeout:{timeout}];
         (
-            node["amenity"="toilets"](area.searchArea);
-            way["amenity"="toilets"](area.searchArea);
+            node["amenity"="toilets"]{bbox_filter};
+            way["amenity"="toilets"]{bbox_filter};
         );
         out geom;
         """
-        location_name = "norway" if 'ISO3166-1"="NO"' in area_query else "custom_area"
+
+
+def location_name_for(bbox=None, area_query=None):
+    """Derive the location part of the snapshot filename from REGIONS"""
+    for name, region in REGIONS.items():
+        if area_query and region.area_query == area_query:
+            return name
+        if not area_query and not region.area_query and tuple(bbox or ()) == region.bbox:
+            return name
+    return "custom_area" if area_query else "custom_bbox"
+
+
+def print_summary(output_file, total, nodes, ways):
+    """Print the summary shown after a snapshot has been saved"""
+    print(f"\n✅ Success!")
+    print(f"📁 Saved to: {output_file}")
+    print(f"📊 Found {total} toilet locations:")
+    print(f"   - {nodes} point locations (nodes)")
+    print(f"   - {ways} area locations (ways)")
+    print(f"📏 File size: {os.path.getsize(output_file)} bytes")
+
+
+def save_snapshot(data, output_file):
+    """Write an Overpass document to disk and print a summary of its contents"""
+    elements = data.get('elements', [])
+    with stage('write') as s:
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+        s.record(bytes_out=file_size(output_file), elements=len(elements))
+    
+    nodes = sum(1 for el in elements if el['type'] == 'node')
+    ways = sum(1 for el in elements if el['type'] == 'way')
+    print_summary(output_file, len(elements), nodes, ways)
+    with stage('catalog'):
+        record_snapshot(output_file, data)
+
+
+def summarize_snapshot(output_file):
+    """
+    Summarize a response streamed to disk and add it to the catalog
+    
+    The counts come from an incremental parse of the written file, so
+    memory use stays flat no matter how large the download was.
+    
+    Returns:
+        Summary dict with the document's header fields and per-type 'counts'
+    """
+    with stage('summarize') as s:
+        summary = summarize(output_file)
+        s.record(elements=sum(summary['counts'].values()))
+    counts = summary['counts']
+    print_summary(output_file, sum(counts.values()), counts.get('node', 0), counts.get('way', 0))
+    with stage('catalog'):
+        record_snapshot(output_file)
+    
+    remark = summary.get('remark', '')
+    if 'runtime error' in remark:
+        print(f"⚠️  Overpass did not complete the query, the snapshot is incomplete: {remark}")
+    return summary
+
+
+@instrumented()
+def fetch_toilet_data(bbox=None, area_query=None, output_file=None, client=None, stream=False,
+                      cache=None):
+    """
+    Fetch toilet data from OpenStreetMap using Overpass API
+    
+    Args:
+        bbox: Bounding box as tuple (south, west, north, east) for Oslo: (59.7, 10.6, 60.0, 11.0)
+        area_query: Area query string like 'area["ISO3166-1"="NO"]' for Norway
+        output_file: Output filename (default: toilets_YYYYMMDD_HHMMSS.json)
+        client: OverpassClient to send the query with (default: shared client)
+        stream: Write the response to disk as it arrives instead of parsing
+            it in memory. The returned data is then the summary from
+            summarize_snapshot rather than the full document
+        cache: overpass_cache.ResponseCache to answer repeated queries from
+            (default: the one configured by OVERPASS_CACHE, if any)
+    """
+    
+    # Default to Oslo if no parameters provided
+    if not bbox and not area_query:
+        bbox = OSLO_BBOX
+        print("Using default Oslo bounding box")
+    
+    # Construct the Overpass query
+    query = build_query(bbox=bbox, area_query=area_query)
+    location_name = location_name_for(bbox=bbox, area_query=area_query)
     
     # Generate output filename if not provided
     if not output_file:
@@ -48,42 +170,39 @@ def fetch_toilet_data(bbox=None, area_query=None, output_file=None):
         output_file = f"toilets_{location_name}_{timestamp}.json"
     
     # Make the API request
-    url = "https://overpass-api.de/api/interpreter"
-    
     print(f"Fetching toilet data...")
     print(f"Query: {query.strip()}")
     
+    client = client or get_default_client()
+    cache = cache or get_default_cache()
+    
     try:
-        response = requests.post(
-            url,
-            data={'data': query},
-            headers={'Content-Type': 'application/x-www-form-urlencoded'},
-            timeout=30
-        )
+        with stage('http_wait') as s:
+            # Retries busy answers and fails over across endpoints, unless the cache answers
+            body, source = query_overpass(client, query, location_name, cache,
+                                          output_file=output_file if stream else None)
+            size = file_size(output_file) if stream else len(body)
+            s.record(**{'bytes_in' if source == 'network' else 'cache_bytes': size,
+                        'cache_hits': int(source != 'network')})
+        if source != 'network':
+            print(f"🗄️  Answered from the response cache ({source})")
         
-        response.raise_for_status()  # Raises an HTTPError for bad responses
+        if stream:
+            return output_file, summarize_snapshot(output_file)
         
         # Parse JSON response
-        data = response.json()
+        with stage('parse') as s:
+            data = json.loads(body)
+            s.record(elements=len(data.get('elements', [])))
         
         # Save to file
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
-        
-        # Print summary
-        elements = data.get('elements', [])
-        nodes = sum(1 for el in elements if el['type'] == 'node')
-        ways = sum(1 for el in elements if el['type'] == 'way')
-        
-        print(f"\n✅ Success!")
-        print(f"📁 Saved to: {output_file}")
-        print(f"📊 Found {len(elements)} toilet locations:")
-        print(f"   - {nodes} point locations (nodes)")
-        print(f"   - {ways} area locations (ways)")
-        print(f"📏 File size: {os.path.getsize(output_file)} bytes")
+        save_snapshot(data, output_file)
         
         return output_file, data
         
+    except OverpassError as e:
+        print(f"❌ Request failed: {e}")
+        return None, None
     except requests.exceptions.RequestException as e:
         print(f"❌ Request failed: {e}")
         return None, None
@@ -94,6 +213,345 @@ def fetch_toilet_data(bbox=None, area_query=None, output_file=None):
         print(f"❌ Unexpected error: {e}")
         return None, None
 
+def split_bbox(bbox, rows, cols):
+    """Split a bounding box into a rows x cols grid of sub-bboxes"""
+    south, west, north, east = bbox
+    lat_step = (north - south) / rows
+    lon_step = (east - west) / cols
+    tiles = []
+    for row in range(rows):
+        for col in range(cols):
+            tiles.append((
+                round(south + row * lat_step, 7),
+                round(west + col * lon_step, 7),
+                round(south + (row + 1) * lat_step, 7),
+                round(west + (col + 1) * lon_step, 7),
+            ))
+    return tiles
+
+
+def fetch_tile(tile, client, area_query=None, query_timeout=25, request_timeout=30, cache=None,
+               region=None):
+    """
+    Fetch a single tile and return the Overpass document
+    
+    Raises TileFailed when the tile should be split: the request timed out,
+    the server answered 504, or Overpass reported a runtime error (query
+    timed out or ran out of memory) in the 'remark' field. Other busy answers
+    are retried by the client. With a cache, tiles answered before are read
+    from it, under the TTL of region.
+    """
+    query = build_query(bbox=tile, area_query=area_query, timeout=query_timeout)
+    try:
+        with stage('fetch_tile.http_wait') as s:
+            body, source = query_overpass(client, query, region, cache,
+                                          timeout=request_timeout, retry_on_timeout=False)
+            s.record(cache_hits=int(source != 'network'))
+    except OverpassTimeout as e:
+        raise TileFailed(str(e))
+    
+    with stage('fetch_tile.parse') as s:
+        data = json.loads(body)
+        s.record(bytes_in=len(body), elements=len(data.get('elements', [])))
+    remark = data.get('remark', '')
+    if 'runtime error' in remark:
+        raise TileFailed(remark)
+    return data
+
+
+def sort_elements(elements):
+    """Sort elements the way Overpass outputs them: nodes, then ways, by id"""
+    return sorted(elements, key=lambda el: (ELEMENT_TYPE_ORDER.get(el['type'], 99), el['id']))
+
+
+def merge_snapshots(parts):
+    """
+    Merge several Overpass documents into one snapshot
+    
+    Elements are deduplicated by (type, id), so ways and boundary nodes that
+    were returned by more than one tile appear only once. The merged osm3s
+    block keeps the oldest timestamp_osm_base, which is the point in time
+    the whole snapshot is guaranteed to be current for.
+    """
+    merged = {}
+    osm3s = {}
+    header = {}
+    for part in parts:
+        if not header:
+            header = {key: part[key] for key in ('version', 'generator') if key in part}
+        part_osm3s = part.get('osm3s', {})
+        part_base = part_osm3s.get('timestamp_osm_base')
+        if part_base and (not osm3s.get('timestamp_osm_base') or part_base < osm3s['timestamp_osm_base']):
+            osm3s = dict(part_osm3s)
+        for element in part.get('elements', []):
+            merged[(element['type'], element['id'])] = element
+    
+    return {**header, 'osm3s': osm3s, 'elements': sort_elements(merged.values())}
+
+
+@instrumented()
+def fetch_toilet_data_tiled(bbox=None, area_query=None, output_file=None, rows=4, cols=4,
+                            max_workers=4, min_tile_size=0.05, client=None,
+                            query_timeout=25, request_timeout=30, cache=None):
+    """
+    Fetch toilet data tile by tile through a bounded worker pool
+    
+    The bbox (or, for an area query, the area's bbox) is split into a grid of
+    rows x cols tiles that are fetched concurrently. A tile that times out or
+    is too large for the server is split into four quarters and retried,
+    until tiles would become smaller than min_tile_size degrees. The results
+    are merged into one snapshot with elements deduplicated by (type, id).
+    
+    Args:
+        bbox: Bounding box as tuple (south, west, north, east)
+        area_query: Area query string like 'area["ISO3166-1"="NO"]'. Without a
+            bbox, the area must be one of REGIONS, which know their bbox
+        output_file: Output filename (default: toilets_<location>_YYYYMMDD_HHMMSS.json)
+        rows, cols: Initial grid size
+        max_workers: Number of tiles fetched at the same time
+        min_tile_size: Smallest tile edge in degrees before giving up on a tile
+        client: OverpassClient shared by all workers (default: shared client)
+        query_timeout: Server-side [timeout:] for each tile query
+        request_timeout: Client-side timeout for each tile request
+        cache: overpass_cache.ResponseCache for the tile responses (default:
+            the one configured by OVERPASS_CACHE, if any)
+    
+    Returns:
+        (output_file, data), or (None, None) if any tile could not be fetched
+    """
+    if not bbox and not area_query:
+        bbox = OSLO_BBOX
+        print("Using default Oslo bounding box")
+    
+    location_name = location_name_for(bbox=bbox, area_query=area_query)
+    if not bbox:
+        if location_name not in REGIONS:
+            print("❌ Tiled fetch of a custom area needs the area's bounding box")
+            return None, None
+        bbox = REGIONS[location_name].bbox
+    
+    if not output_file:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        output_file = f"toilets_{location_name}_{timestamp}.json"
+    
+    client = client or get_default_client()
+    cache = cache or get_default_cache()
+    tiles = split_bbox(bbox, rows, cols)
+    print(f"Fetching toilet data in {len(tiles)} tiles with {max_workers} workers...")
+    
+    parts = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {
+            executor.submit(fetch_tile, tile, client, area_query, query_timeout, request_timeout,
+                            cache, location_name): tile
+            for tile in tiles
+        }
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                tile = pending.pop(future)
+                try:
+                    parts.append(future.result())
+                except TileFailed as e:
+                    south, west, north, east = tile
+                    if min(north - south, east - west) / 2 < min_tile_size:
+                        print(f"❌ Tile {tile} failed and is too small to split: {e}")
+                        for other in pending:
+                            other.cancel()
+                        return None, None
+                    print(f"✂️  Splitting tile {tile}: {e}")
+                    for sub_tile in split_bbox(tile, 2, 2):
+                        future = executor.submit(
+                            fetch_tile, sub_tile, client, area_query, query_timeout, request_timeout,
+                            cache, location_name
+                        )
+                        pending[future] = sub_tile
+                except (OverpassError, requests.exceptions.RequestException) as e:
+                    print(f"❌ Request for tile {tile} failed: {e}")
+                    for other in pending:
+                        other.cancel()
+                    return None, None
+                except json.JSONDecodeError as e:
+                    print(f"❌ Failed to parse JSON response for tile {tile}: {e}")
+                    for other in pending:
+                        other.cancel()
+                    return None, None
+    
+    print(f"📦 Fetched {len(parts)} tiles")
+    with stage('merge') as s:
+        data = merge_snapshots(parts)
+        s.record(elements=len(data['elements']))
+    
+    try:
+        save_snapshot(data, output_file)
+    except Exception as e:
+        print(f"❌ Unexpected error: {e}")
+        return None, None
+    
+    return output_file, data
+
+def build_delta_query(since, bbox=None, area_query=None, timeout=25):
+    """
+    Build an Overpass query for the toilets changed since a timestamp
+    
+    The query prints two result sets: the elements created or modified since
+    'since' (with geometry), followed by the ids of every toilet currently
+    matching the query. Elements missing from the id list have been deleted
+    or lost their amenity=toilets tag. Ways are also reported as changed when
+    one of their nodes moved, since that changes the way's geometry without
+    bumping its own version.
+    """
+    bbox_filter = ""
+    if bbox:
+        south, west, north, east = bbox
+        bbox_filter = f"(bbox:{south},{west},{north},{east})"
+    area_filter = ""
+    area_statement = ""
+    if area_query:
+        area_filter = "(area.searchArea)"
+        area_statement = f"\n        {area_query}->.searchArea;"
+    
+    return f"""
+        [out:json][timeout:{timeout}];{area_statement}
+        (
+            node["amenity"="toilets"]{area_filter}{bbox_filter};
+            way["amenity"="toilets"]{area_filter}{bbox_filter};
+        )->.current;
+        node(w.current)(newer:"{since}")->.moved;
+        (
+            node.current(newer:"{since}");
+            way.current(newer:"{since}");
+            way.current(bn.moved);
+        );
+        out geom;
+        .current out ids;
+        """
+
+
+def region_from_filename(snapshot_file):
+    """Guess the (bbox, area_query) a snapshot was fetched with from its filename"""
+    region = REGIONS.get(region_from_name(snapshot_file))
+    if not region:
+        return None, None
+    if region.area_query:
+        return None, region.area_query
+    return region.bbox, None
+
+
+def apply_delta(snapshot, delta):
+    """
+    Apply a delta response from build_delta_query to a snapshot
+    
+    Adds and modifications replace elements by (type, id); elements whose
+    (type, id) is not in the delta's id list are deleted. Returns the new
+    snapshot and a dict with the number of added, modified and deleted
+    elements.
+    """
+    elements = {(el['type'], el['id']): el for el in snapshot.get('elements', [])}
+    
+    current_ids = set()
+    changed = []
+    for element in delta.get('elements', []):
+        key = (element['type'], element['id'])
+        if element.keys() <= {'type', 'id'}:
+            current_ids.add(key)
+        else:
+            changed.append(element)
+    
+    counts = {'added': 0, 'modified': 0, 'deleted': 0}
+    for element in changed:
+        key = (element['type'], element['id'])
+        counts['modified' if key in elements else 'added'] += 1
+        elements[key] = element
+    
+    for key in list(elements):
+        if key not in current_ids:
+            del elements[key]
+            counts['deleted'] += 1
+    
+    refreshed = {key: value for key, value in snapshot.items() if key not in ('elements', 'remark')}
+    refreshed['osm3s'] = delta.get('osm3s', snapshot.get('osm3s', {}))
+    refreshed['elements'] = sort_elements(elements.values())
+    return refreshed, counts
+
+
+@instrumented()
+def refresh_snapshot(snapshot_file, bbox=None, area_query=None, output_file=None, client=None):
+    """
+    Incrementally refresh a saved snapshot using its osm3s timestamp
+    
+    Only the elements changed since the snapshot's timestamp_osm_base are
+    downloaded, together with the ids of all current toilets, and applied to
+    the snapshot keyed by (type, id). The result is written as a new snapshot.
+    
+    Args:
+        snapshot_file: Snapshot written by fetch_toilet_data
+        bbox, area_query: Region the snapshot covers (guessed from the
+            filename for the Oslo and Norway defaults)
+        output_file: Output filename (default: toilets_<location>_YYYYMMDD_HHMMSS.json)
+        client: OverpassClient to send the query with (default: shared client)
+    
+    Returns:
+        (output_file, data), or (None, None) if the refresh failed
+    """
+    try:
+        with open(snapshot_file, 'r', encoding='utf-8') as f:
+            snapshot = json.load(f)
+    except FileNotFoundError:
+        print(f"❌ Error: File '{snapshot_file}' not found!")
+        return None, None
+    except json.JSONDecodeError as e:
+        print(f"❌ Error reading JSON file: {e}")
+        return None, None
+    
+    since = snapshot.get('osm3s', {}).get('timestamp_osm_base')
+    if not since:
+        print("❌ Snapshot has no osm3s.timestamp_osm_base to refresh from")
+        return None, None
+    
+    if not bbox and not area_query:
+        bbox, area_query = region_from_filename(snapshot_file)
+        if not bbox and not area_query:
+            print("❌ Could not tell which region the snapshot covers, pass bbox or area_query")
+            return None, None
+    
+    if not output_file:
+        location_name = location_name_for(bbox=bbox, area_query=area_query)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        output_file = f"toilets_{location_name}_{timestamp}.json"
+    
+    query = build_delta_query(since, bbox=bbox, area_query=area_query)
+    print(f"Fetching changes since {since}...")
+    
+    client = client or get_default_client()
+    
+    try:
+        delta = client.post(query).json()
+    except (OverpassError, requests.exceptions.RequestException) as e:
+        print(f"❌ Request failed: {e}")
+        return None, None
+    except json.JSONDecodeError as e:
+        print(f"❌ Failed to parse JSON response: {e}")
+        return None, None
+    
+    # A truncated id list would look like mass deletion, so never apply it
+    remark = delta.get('remark', '')
+    if 'runtime error' in remark:
+        print(f"❌ Overpass could not complete the query: {remark}")
+        return None, None
+    
+    data, counts = apply_delta(snapshot, delta)
+    print(f"🔄 {counts['added']} added, {counts['modified']} modified, {counts['deleted']} deleted")
+    
+    try:
+        save_snapshot(data, output_file)
+    except Exception as e:
+        print(f"❌ Unexpected error: {e}")
+        return None, None
+    
+    return output_file, data
+
+
 def preview_data(data, num_samples=3):
     """Preview some sample toilet data"""
     if not data or 'elements' not in data:
@@ -120,6 +578,8 @@ def preview_data(data, num_samples=3):
                     print(f"  {key}: {value}")
 
 if __name__ == "__main__":
+    enable_from_args(sys.argv)
+    
     # Example usage - fetch Oslo toilets
     print("🚽 OpenStreetMap Toilet Data Fetcher")
     print("=" * 40)
@@ -136,9 +596,8 @@ if __name__ == "__main__":
         
         if fetch_norway in ['y', 'yes']:
             print("\nFetching Norway data (this may take longer)...")
-            norway_query = 'area["ISO3166-1"="NO"]'
-            norway_file, norway_data = fetch_toilet_data(
-                area_query=norway_query, 
+            norway_file, norway_data = fetch_toilet_data_tiled(
+                area_query=NORWAY_AREA,
                 output_file=f"toilets_norway_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
             )
             
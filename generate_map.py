@@ -1,14 +1,503 @@
 import json
 import os
+import shutil
+import sys
 from datetime import datetime
 
-def generate_toilet_map(json_file_path, output_file=None):
+from build_payload import DEFAULT_PRECISION, build_payload, dump_payload, project_element
+from display_rules import get_default_rules
+from geo import geohash_bounds, geohash_encode
+from instrumentation import enable_from_args, file_size, instrumented, stage
+from snapshot_catalog import describe_snapshot, list_snapshots
+from snapshot_format import load_snapshot
+from toilet_filters import BITSET_KEYS
+
+# Geohash length of the data tiles written in chunked mode (~39 x 20 km)
+TILE_PRECISION = 4
+# Below this zoom level the chunked page shows per-tile counts only
+MIN_MARKER_ZOOM = 9
+
+DECODE_SCRIPT = '''
+        // Function to expand a payload from build_payload.py into toilet objects
+        function decodePayload(payload) {
+            if (payload.format !== 'arrays' && payload.format !== 'delta') return payload.elements;
+            const scale = 10 ** payload.precision;
+            const { types, fields, keys, values } = payload;
+            let id = 0, lat = 0, lon = 0;
+            return payload.elements.map(row => {
+                if (payload.format === 'delta') {
+                    id += row[1]; lat += row[2]; lon += row[3];
+                } else {
+                    [id, lat, lon] = [row[1], row[2], row[3]];
+                }
+                const toilet = { type: types[row[0]], id, lat: lat / scale, lon: lon / scale, numberOfToilets: row[4] };
+                for (let i = 5; i < fields.length; i++) toilet[fields[i]] = values[row[i]];
+                toilet.tags = {};
+                for (let i = fields.length; i < row.length; i += 2) toilet.tags[keys[row[i]]] = values[row[i + 1]];
+                return toilet;
+            });
+        }
+'''
+
+BITSET_SCRIPT = '''
+        // Filter bitsets from toilet_filters.FilterIndex: bit i is toilet i,
+        // base64 little-endian bytes, decoded into 32-bit words
+        function decodeBitset(encoded, size) {
+            const bytes = Uint8Array.from(atob(encoded), c => c.charCodeAt(0));
+            const words = new Uint32Array(Math.ceil(size / 32));
+            bytes.forEach((byte, i) => { words[i >> 2] |= byte << ((i & 3) * 8); });
+            return words;
+        }
+
+        function filterBits(filters) {
+            const size = filters.size;
+            const everything = new Uint32Array(Math.ceil(size / 32)).fill(0xffffffff);
+            if (size % 32) everything[everything.length - 1] = (2 ** (size % 32)) - 1;
+            const decoded = {};
+            const bits = (key, value) => {
+                const encoded = (filters.bitsets[key] || {})[value];
+                if (!encoded) return new Uint32Array(everything.length);
+                decoded[`${key}=${value}`] = decoded[`${key}=${value}`] || decodeBitset(encoded, size);
+                return decoded[`${key}=${value}`];
+            };
+            const and = (a, b) => a.map((word, i) => word & b[i]);
+            const andNot = (a, b) => a.map((word, i) => word & ~b[i]);
+            return { everything, bits, and, andNot };
+        }
+
+        // Indices of the set bits, skipping empty words
+        function bitIndices(words) {
+            const indices = [];
+            words.forEach((word, w) => {
+                while (word) {
+                    const low = word & -word;
+                    indices.push(w * 32 + 31 - Math.clz32(low));
+                    word ^= low;
+                }
+            });
+            return indices;
+        }
+'''
+
+COMMON_SCRIPT = '''
+        // Initialize map
+        const map = L.map('map').setView([59.9139, 10.7522], 12);
+        
+        // Add tile layer
+        L.tileLayer('https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png', {
+            attribution: '© OpenStreetMap contributors'
+        }).addTo(map);
+
+        // Store markers and data
+        let markers = [];
+        let filteredToilets = [];
+        let selectedToiletId = null;
+        // Popup display strings from display_rules.py: {key: {value: text}}
+        let displayTable = {};
+
+        // Create custom icons
+        const toiletIcon = L.divIcon({
+            html: '🚽',
+            iconSize: [20, 20],
+            className: 'toilet-marker'
+        });
+
+        const wheelchairToiletIcon = L.divIcon({
+            html: '♿',
+            iconSize: [20, 20],
+            className: 'toilet-marker wheelchair'
+        });
+
+        const feeToiletIcon = L.divIcon({
+            html: '💰',
+            iconSize: [20, 20],
+            className: 'toilet-marker fee'
+        });
+
+        // Function to get appropriate icon
+        function getToiletIcon(toilet) {
+            const tags = toilet.tags;
+            if (tags.wheelchair === 'yes') return wheelchairToiletIcon;
+            if (tags.fee === 'yes') return feeToiletIcon;
+            return toiletIcon;
+        }
+
+        // Function to look up how a tag value is displayed
+        function displayValue(key, value) {
+            return (displayTable[key] || {})[value] ?? value;
+        }
+
+        // Function to create popup content
+        function createPopupContent(toilet) {
+            const tags = toilet.tags;
+            let content = `<div class="popup-header">Toilet #${toilet.id}</div>`;
+            
+            // Add features
+            if (tags.wheelchair) {
+                content += `<div class="popup-feature"><strong>Wheelchair:</strong> ${displayValue('wheelchair', tags.wheelchair)}</div>`;
+            }
+            if (tags.fee !== undefined) {
+                const feeText = tags.fee === 'yes' ? 'Paid' : 'Free';
+                content += `<div class="popup-feature"><strong>Fee:</strong> ${feeText}</div>`;
+            }
+            if (tags.access) {
+                content += `<div class="popup-feature"><strong>Access:</strong> ${displayValue('access', tags.access)}</div>`;
+            }
+            if (tags.opening_hours) {
+                content += `<div class="popup-feature"><strong>Hours:</strong> ${displayValue('opening_hours', tags.opening_hours)}</div>`;
+            }
+            if (tags['toilets:disposal']) {
+                content += `<div class="popup-feature"><strong>Type:</strong> ${tags['toilets:disposal']}</div>`;
+            }
+            if (tags.changing_table) {
+                content += `<div class="popup-feature"><strong>Changing table:</strong> ${displayValue('changing_table', tags.changing_table)}</div>`;
+            }
+            if (tags.unisex) {
+                content += `<div class="popup-feature"><strong>Unisex:</strong> ${displayValue('unisex', tags.unisex)}</div>`;
+            }
+            
+            content += `<div class="popup-feature"><strong>Coordinates:</strong> ${toilet.lat.toFixed(4)}, ${toilet.lon.toFixed(4)}</div>`;
+            
+            return content;
+        }
+
+        // Function to create sidebar item
+        function createSidebarItem(toilet) {
+            const tags = toilet.tags;
+            const item = document.createElement('div');
+            item.className = 'toilet-item';
+            item.dataset.toiletId = toilet.id;
+            
+            let features = [];
+            if (tags.wheelchair === 'yes') features.push('<span class="feature-tag wheelchair">♿ Wheelchair</span>');
+            if (tags.wheelchair === 'limited') features.push('<span class="feature-tag wheelchair">♿ Limited</span>');
+            if (tags.fee === 'no') features.push('<span class="feature-tag">Free</span>');
+            if (tags.fee === 'yes') features.push('<span class="feature-tag fee">Paid</span>');
+            if (tags.changing_table === 'yes') features.push('<span class="feature-tag">Baby change</span>');
+            if (tags.access === 'customers') features.push('<span class="feature-tag">Customers</span>');
+            if (tags.unisex === 'yes') features.push('<span class="feature-tag">Unisex</span>');
+            
+            item.innerHTML = `
+                <div class="toilet-id">ID: ${toilet.id}</div>
+                <div>📍 ${toilet.lat.toFixed(4)}, ${toilet.lon.toFixed(4)}</div>
+                <div class="toilet-features">${features.join('')}</div>
+            `;
+            
+            item.addEventListener('click', () => {
+                selectToilet(toilet.id);
+                map.setView([toilet.lat, toilet.lon], 16);
+            });
+            
+            return item;
+        }
+
+        // Function to select a toilet
+        function selectToilet(toiletId) {
+            // Remove previous selection
+            document.querySelectorAll('.toilet-item').forEach(item => {
+                item.classList.remove('selected');
+            });
+            
+            // Add selection to new item
+            const selectedItem = document.querySelector(`[data-toilet-id="${toiletId}"]`);
+            if (selectedItem) {
+                selectedItem.classList.add('selected');
+            }
+            
+            selectedToiletId = toiletId;
+        }
+        // Function to check a toilet against the sidebar filters
+        function matchesFilters(toilet) {
+            const wheelchairFilter = document.getElementById('wheelchairFilter').value;
+            const feeFilter = document.getElementById('feeFilter').value;
+            const accessFilter = document.getElementById('accessFilter').value;
+            
+            // Wheelchair filter
+            if (wheelchairFilter === 'yes' && toilet.tags.wheelchair !== 'yes') return false;
+            if (wheelchairFilter === 'no' && toilet.tags.wheelchair === 'yes') return false;
+            if (wheelchairFilter === 'limited' && toilet.tags.wheelchair !== 'limited') return false;
+            
+            // Fee filter
+            if (feeFilter === 'free' && toilet.tags.fee === 'yes') return false;
+            if (feeFilter === 'paid' && toilet.tags.fee !== 'yes') return false;
+            
+            // Access filter
+            if (accessFilter !== 'all' && toilet.tags.access !== accessFilter) return false;
+            
+            return true;
+        }
+
+        // Function to update sidebar
+        function updateSidebar() {
+            const toiletList = document.getElementById('toiletList');
+            toiletList.innerHTML = '';
+            
+            filteredToilets.forEach(toilet => {
+                toiletList.appendChild(createSidebarItem(toilet));
+            });
+        }
+
+        // Function to update statistics
+        function updateStats() {
+            const totalCount = filteredToilets.length;
+            const wheelchairCount = filteredToilets.filter(t => t.tags.wheelchair === 'yes').length;
+            
+            document.getElementById('totalCount').textContent = totalCount;
+            document.getElementById('wheelchairCount').textContent = wheelchairCount;
+        }
+
+        // Add event listeners for filters
+        document.getElementById('wheelchairFilter').addEventListener('change', filterToilets);
+        document.getElementById('feeFilter').addEventListener('change', filterToilets);
+        document.getElementById('accessFilter').addEventListener('change', filterToilets);
+'''
+
+INLINE_SCRIPT = '''
+        // Function to select the toilets matching the sidebar filters: the
+        // same rules as matchesFilters, as word operations on the bitsets
+        const filterSets = filterBits(toiletData.filters);
+        function selectedBits() {
+            const { everything, bits, and, andNot } = filterSets;
+            const wheelchairFilter = document.getElementById('wheelchairFilter').value;
+            const feeFilter = document.getElementById('feeFilter').value;
+            const accessFilter = document.getElementById('accessFilter').value;
+            let selected = everything;
+            if (wheelchairFilter === 'yes' || wheelchairFilter === 'limited') selected = and(selected, bits('wheelchair', wheelchairFilter));
+            if (wheelchairFilter === 'no') selected = andNot(selected, bits('wheelchair', 'yes'));
+            if (feeFilter === 'free') selected = andNot(selected, bits('fee', 'yes'));
+            if (feeFilter === 'paid') selected = and(selected, bits('fee', 'yes'));
+            if (accessFilter !== 'all') selected = and(selected, bits('access', accessFilter));
+            return selected;
+        }
+
+        // Function to filter toilets
+        function filterToilets() {
+            filteredToilets = bitIndices(selectedBits()).map(i => toiletData.elements[i]);
+            
+            updateMap();
+            updateSidebar();
+            updateStats();
+        }
+
+        // Function to update map markers
+        function updateMap() {
+            // Clear existing markers
+            markers.forEach(marker => map.removeLayer(marker));
+            markers = [];
+            
+            // Add filtered markers
+            filteredToilets.forEach(toilet => {
+                const marker = L.marker([toilet.lat, toilet.lon], {
+                    icon: getToiletIcon(toilet)
+                }).addTo(map);
+                
+                marker.bindPopup(createPopupContent(toilet));
+                marker.on('click', () => selectToilet(toilet.id));
+                
+                markers.push(marker);
+            });
+        }
+
+        // Initialize the map
+        filteredToilets = toiletData.elements;
+        updateMap();
+        updateSidebar();
+        updateStats();
+
+        // Fit map to show all toilets
+        if (filteredToilets.length > 0) {
+            const group = new L.featureGroup(markers);
+            map.fitBounds(group.getBounds().pad(0.1));
+        }
+'''
+
+CHUNKED_SCRIPT = '''
+        // Tiles are fetched as the map moves; below MIN_MARKER_ZOOM only
+        // the per-tile counts from the index are shown
+        const DATA_URL = '__DATA_URL__';
+        const MIN_MARKER_ZOOM = __MIN_MARKER_ZOOM__;
+        let tileIndex = null;
+        let refreshGeneration = 0;
+        const loadedTiles = new Map();
+        const pendingTiles = new Map();
+        const markersById = new Map();
+        const markerLayer = L.layerGroup().addTo(map);
+        const overviewLayer = L.layerGroup().addTo(map);
+
+        // Function to check whether an index entry overlaps the viewport
+        function tileInView(tile, bounds) {
+            const [count, wheelchair, south, west, north, east] = tile;
+            return !(north < bounds.getSouth() || south > bounds.getNorth() ||
+                     east < bounds.getWest() || west > bounds.getEast());
+        }
+
+        // Function to fetch a tile once, sharing in-flight requests
+        function loadTile(key) {
+            if (loadedTiles.has(key)) return Promise.resolve(loadedTiles.get(key));
+            if (!pendingTiles.has(key)) {
+                pendingTiles.set(key, fetch(`${DATA_URL}/tiles/${key}.json`)
+                    .then(response => response.json())
+                    .then(toilets => {
+                        loadedTiles.set(key, toilets);
+                        pendingTiles.delete(key);
+                        return toilets;
+                    }));
+            }
+            return pendingTiles.get(key);
+        }
+
+        // Function to create a toilet's marker the first time it is shown
+        function getMarker(toilet) {
+            const key = `${toilet.type}-${toilet.id}`;
+            let marker = markersById.get(key);
+            if (!marker) {
+                marker = L.marker([toilet.lat, toilet.lon], {
+                    icon: getToiletIcon(toilet)
+                });
+                marker.bindPopup(() => createPopupContent(toilet));
+                marker.on('click', () => selectToilet(toilet.id));
+                markersById.set(key, marker);
+            }
+            return marker;
+        }
+
+        // Function to show tile counts when zoomed out too far for markers
+        function showOverview(visibleKeys) {
+            markerLayer.clearLayers();
+            overviewLayer.clearLayers();
+            let totalCount = 0;
+            let wheelchairCount = 0;
+            
+            visibleKeys.forEach(key => {
+                const [count, wheelchair, south, west, north, east] = tileIndex.tiles[key];
+                const center = [(south + north) / 2, (west + east) / 2];
+                totalCount += count;
+                wheelchairCount += wheelchair;
+                L.marker(center, {
+                    icon: L.divIcon({
+                        html: `${count}`,
+                        iconSize: [32, 32],
+                        className: 'tile-count'
+                    })
+                }).on('click', () => map.setView(center, MIN_MARKER_ZOOM)).addTo(overviewLayer);
+            });
+            
+            filteredToilets = [];
+            updateSidebar();
+            document.getElementById('toiletList').innerHTML = '<p>Zoom in to see individual toilets.</p>';
+            document.getElementById('totalCount').textContent = totalCount;
+            document.getElementById('wheelchairCount').textContent = wheelchairCount;
+        }
+
+        // Function to filter toilets in view, loading missing tiles
+        async function filterToilets() {
+            if (!tileIndex) return;
+            const generation = ++refreshGeneration;
+            const bounds = map.getBounds();
+            const visibleKeys = Object.keys(tileIndex.tiles)
+                .filter(key => tileInView(tileIndex.tiles[key], bounds));
+            
+            if (map.getZoom() < MIN_MARKER_ZOOM) {
+                showOverview(visibleKeys);
+                return;
+            }
+            
+            const tiles = await Promise.all(visibleKeys.map(loadTile));
+            if (generation !== refreshGeneration) return;  // A newer refresh is running
+            overviewLayer.clearLayers();
+            
+            // Toggle existing markers instead of rebuilding all of them
+            const shown = new Set();
+            filteredToilets = [];
+            tiles.flat().forEach(toilet => {
+                if (!bounds.contains([toilet.lat, toilet.lon]) || !matchesFilters(toilet)) return;
+                filteredToilets.push(toilet);
+                const marker = getMarker(toilet);
+                shown.add(marker);
+                if (!markerLayer.hasLayer(marker)) markerLayer.addLayer(marker);
+            });
+            markerLayer.eachLayer(marker => {
+                if (!shown.has(marker)) markerLayer.removeLayer(marker);
+            });
+            
+            updateSidebar();
+            updateStats();
+        }
+
+        // Initialize the map from the tile index
+        map.on('moveend', filterToilets);
+        fetch(`${DATA_URL}/index.json`)
+            .then(response => response.json())
+            .then(index => {
+                tileIndex = index;
+                displayTable = index.display || {};
+                filterToilets();
+            })
+            .catch(error => {
+                document.getElementById('toiletList').innerHTML =
+                    `<p>Could not load ${DATA_URL}/index.json (${error}). Serve this folder over HTTP.</p>`;
+            });
+'''
+
+
+def write_data_tiles(toilet_data, data_dir, precision=TILE_PRECISION, display=None):
+    """
+    Write toilet data as geohash tiles plus a small index for chunked maps
+    
+    Each tile data_dir/tiles/<geohash>.json holds the toilets in that cell,
+    projected to the map's fields by build_payload.project_element. The index
+    data_dir/index.json lists every non-empty tile with its toilet count,
+    wheelchair-accessible count and bounds, so the page can decide which
+    tiles intersect the viewport without fetching them. With display rules,
+    the index also carries the popup display strings of the tag values.
+    
+    Returns:
+        The index dict
+    """
+    tiles = {}
+    projected = []
+    for element in toilet_data.get('elements', []):
+        toilet = project_element(element)
+        if not toilet:
+            continue
+        projected.append(toilet)
+        tiles.setdefault(geohash_encode(toilet['lat'], toilet['lon'], precision), []).append(toilet)
+    
+    tiles_dir = os.path.join(data_dir, 'tiles')
+    if os.path.isdir(tiles_dir):
+        shutil.rmtree(tiles_dir)  # Drop tiles left over from an older snapshot
+    os.makedirs(tiles_dir)
+    
+    index = {
+        'precision': precision,
+        'total': sum(len(toilets) for toilets in tiles.values()),
+        'timestamp': toilet_data.get('osm3s', {}).get('timestamp_osm_base'),
+        'tiles': {},
+    }
+    if display:
+        index['display'] = display.table(projected)
+    for key, toilets in sorted(tiles.items()):
+        with open(os.path.join(tiles_dir, f"{key}.json"), 'w', encoding='utf-8') as f:
+            json.dump(toilets, f, ensure_ascii=False, separators=(',', ':'))
+        wheelchair = sum(1 for toilet in toilets if toilet['tags'].get('wheelchair') == 'yes')
+        index['tiles'][key] = [len(toilets), wheelchair, *geohash_bounds(key)]
+    
+    with open(os.path.join(data_dir, 'index.json'), 'w', encoding='utf-8') as f:
+        json.dump(index, f, separators=(',', ':'))
+    return index
+
+@instrumented()
+def generate_toilet_map(json_file_path, output_file=None, chunked=False, tile_precision=TILE_PRECISION):
     """
     Generate an HTML map from toilet JSON data
     
     Args:
-        json_file_path: Path to the JSON file with toilet data
+        json_file_path: Path to the JSON file or columnar snapshot with toilet data
         output_file: Output HTML filename (optional, will auto-generate if not provided)
+        chunked: Instead of inlining the data, write it as geohash tiles to a
+            <output>_data folder next to the HTML file; the page fetches only
+            the tiles in view, so it must be served over HTTP
+        tile_precision: Geohash length of the tiles in chunked mode
     """
     
     # Check if JSON file exists
@@ -18,8 +507,9 @@ def generate_toilet_map(json_file_path, output_file=None):
     
     # Read the JSON data
     try:
-        with open(json_file_path, 'r', encoding='utf-8') as f:
-            toilet_data = json.load(f)
+        with stage('load') as s:
+            toilet_data = load_snapshot(json_file_path)
+            s.record(bytes_in=file_size(json_file_path), elements=len(toilet_data.get('elements', [])))
         print(f"✅ Successfully loaded data from {json_file_path}")
     except json.JSONDecodeError as e:
         print(f"❌ Error reading JSON file: {e}")
@@ -58,8 +548,38 @@ def generate_toilet_map(json_file_path, output_file=None):
         except:
             pass
     
+    # Build the page script, with the data inlined or loaded from tiles
+    if chunked:
+        data_dir = os.path.splitext(output_file)[0] + '_data'
+        try:
+            with stage('write_tiles') as s:
+                index = write_data_tiles(toilet_data, data_dir, tile_precision, get_default_rules())
+                s.record(elements=index['total'], files=len(index['tiles']))
+        except Exception as e:
+            print(f"❌ Error writing data tiles: {e}")
+            return None
+        print(f"🧩 Wrote {len(index['tiles'])} data tiles to {data_dir}")
+        script = COMMON_SCRIPT + CHUNKED_SCRIPT
+        script = script.replace('__DATA_URL__', os.path.basename(data_dir))
+        script = script.replace('__MIN_MARKER_ZOOM__', str(MIN_MARKER_ZOOM))
+    else:
+        with stage('encode_payload') as s:
+            payload = build_payload(toilet_data, 'delta', DEFAULT_PRECISION, BITSET_KEYS, get_default_rules())
+            encoded = dump_payload(payload)
+            s.record(elements=len(payload['elements']), bytes_out=len(encoded))
+        script = (
+            DECODE_SCRIPT + BITSET_SCRIPT
+            + "        // Toilet data from JSON file, in the compact payload layout\n"
+            f"        const payload = {encoded};\n"
+            "        const toiletData = { elements: decodePayload(payload), filters: payload.filters };\n"
+            + COMMON_SCRIPT
+            + "        displayTable = payload.display || {};\n"
+            + INLINE_SCRIPT
+        )
+    
     # Create the complete HTML content
-    html_content = f'''<!DOCTYPE html>
+    with stage('render') as render:
+        html_content = f'''<!DOCTYPE html>
 <html lang="en">
 <head>
     <meta charset="UTF-8">
@@ -243,6 +763,16 @@ def generate_toilet_map(json_file_path, output_file=None):
             color: #555;
         }}
         
+        .tile-count {{
+            background: rgba(102, 126, 234, 0.85);
+            color: white;
+            border-radius: 50%;
+            text-align: center;
+            line-height: 32px;
+            font-size: 0.8rem;
+            font-weight: bold;
+        }}
+        
         .data-info {{
             background: #fff3cd;
             border: 1px solid #ffeaa7;
@@ -335,249 +865,46 @@ def generate_toilet_map(json_file_path, output_file=None):
 
     <script src="https://cdnjs.cloudflare.com/ajax/libs/leaflet/1.9.4/leaflet.js"></script>
     <script>
-        // Toilet data from JSON file
-        const toiletData = {json.dumps(toilet_data, ensure_ascii=False)};
-
-        // Initialize map
-        const map = L.map('map').setView([59.9139, 10.7522], 12);
-        
-        // Add tile layer
-        L.tileLayer('https://{{s}}.tile.openstreetmap.org/{{z}}/{{x}}/{{y}}.png', {{
-            attribution: '© OpenStreetMap contributors'
-        }}).addTo(map);
-
-        // Store markers and data
-        let markers = [];
-        let filteredToilets = [];
-        let selectedToiletId = null;
-
-        // Create custom icons
-        const toiletIcon = L.divIcon({{
-            html: '🚽',
-            iconSize: [20, 20],
-            className: 'toilet-marker'
-        }});
-
-        const wheelchairToiletIcon = L.divIcon({{
-            html: '♿',
-            iconSize: [20, 20],
-            className: 'toilet-marker wheelchair'
-        }});
-
-        const feeToiletIcon = L.divIcon({{
-            html: '💰',
-            iconSize: [20, 20],
-            className: 'toilet-marker fee'
-        }});
-
-        // Function to get appropriate icon
-        function getToiletIcon(toilet) {{
-            const tags = toilet.tags;
-            if (tags.wheelchair === 'yes') return wheelchairToiletIcon;
-            if (tags.fee === 'yes') return feeToiletIcon;
-            return toiletIcon;
-        }}
-
-        // Function to create popup content
-        function createPopupContent(toilet) {{
-            const tags = toilet.tags;
-            let content = `<div class="popup-header">Toilet #${{toilet.id}}</div>`;
-            
-            // Add features
-            if (tags.wheelchair) {{
-                content += `<div class="popup-feature"><strong>Wheelchair:</strong> ${{tags.wheelchair}}</div>`;
-            }}
-            if (tags.fee !== undefined) {{
-                const feeText = tags.fee === 'yes' ? 'Paid' : 'Free';
-                content += `<div class="popup-feature"><strong>Fee:</strong> ${{feeText}}</div>`;
-            }}
-            if (tags.access) {{
-                content += `<div class="popup-feature"><strong>Access:</strong> ${{tags.access}}</div>`;
-            }}
-            if (tags.opening_hours) {{
-                content += `<div class="popup-feature"><strong>Hours:</strong> ${{tags.opening_hours}}</div>`;
-            }}
-            if (tags['toilets:disposal']) {{
-                content += `<div class="popup-feature"><strong>Type:</strong> ${{tags['toilets:disposal']}}</div>`;
-            }}
-            if (tags.changing_table) {{
-                content += `<div class="popup-feature"><strong>Changing table:</strong> ${{tags.changing_table}}</div>`;
-            }}
-            if (tags.unisex) {{
-                content += `<div class="popup-feature"><strong>Unisex:</strong> ${{tags.unisex}}</div>`;
-            }}
-            
-            content += `<div class="popup-feature"><strong>Coordinates:</strong> ${{toilet.lat.toFixed(4)}}, ${{toilet.lon.toFixed(4)}}</div>`;
-            
-            return content;
-        }}
-
-        // Function to create sidebar item
-        function createSidebarItem(toilet) {{
-            const tags = toilet.tags;
-            const item = document.createElement('div');
-            item.className = 'toilet-item';
-            item.dataset.toiletId = toilet.id;
-            
-            let features = [];
-            if (tags.wheelchair === 'yes') features.push('<span class="feature-tag wheelchair">♿ Wheelchair</span>');
-            if (tags.wheelchair === 'limited') features.push('<span class="feature-tag wheelchair">♿ Limited</span>');
-            if (tags.fee === 'no') features.push('<span class="feature-tag">Free</span>');
-            if (tags.fee === 'yes') features.push('<span class="feature-tag fee">Paid</span>');
-            if (tags.changing_table === 'yes') features.push('<span class="feature-tag">Baby change</span>');
-            if (tags.access === 'customers') features.push('<span class="feature-tag">Customers</span>');
-            if (tags.unisex === 'yes') features.push('<span class="feature-tag">Unisex</span>');
-            
-            item.innerHTML = `
-                <div class="toilet-id">ID: ${{toilet.id}}</div>
-                <div>📍 ${{toilet.lat.toFixed(4)}}, ${{toilet.lon.toFixed(4)}}</div>
-                <div class="toilet-features">${{features.join('')}}</div>
-            `;
-            
-            item.addEventListener('click', () => {{
-                selectToilet(toilet.id);
-                map.setView([toilet.lat, toilet.lon], 16);
-            }});
-            
-            return item;
-        }}
-
-        // Function to select a toilet
-        function selectToilet(toiletId) {{
-            // Remove previous selection
-            document.querySelectorAll('.toilet-item').forEach(item => {{
-                item.classList.remove('selected');
-            }});
-            
-            // Add selection to new item
-            const selectedItem = document.querySelector(`[data-toilet-id="${{toiletId}}"]`);
-            if (selectedItem) {{
-                selectedItem.classList.add('selected');
-            }}
-            
-            selectedToiletId = toiletId;
-        }}
-
-        // Function to filter toilets
-        function filterToilets() {{
-            const wheelchairFilter = document.getElementById('wheelchairFilter').value;
-            const feeFilter = document.getElementById('feeFilter').value;
-            const accessFilter = document.getElementById('accessFilter').value;
-            
-            filteredToilets = toiletData.elements.filter(toilet => {{
-                // Wheelchair filter
-                if (wheelchairFilter === 'yes' && toilet.tags.wheelchair !== 'yes') return false;
-                if (wheelchairFilter === 'no' && toilet.tags.wheelchair === 'yes') return false;
-                if (wheelchairFilter === 'limited' && toilet.tags.wheelchair !== 'limited') return false;
-                
-                // Fee filter
-                if (feeFilter === 'free' && toilet.tags.fee === 'yes') return false;
-                if (feeFilter === 'paid' && toilet.tags.fee !== 'yes') return false;
-                
-                // Access filter
-                if (accessFilter !== 'all' && toilet.tags.access !== accessFilter) return false;
-                
-                return true;
-            }});
-            
-            updateMap();
-            updateSidebar();
-            updateStats();
-        }}
-
-        // Function to update map markers
-        function updateMap() {{
-            // Clear existing markers
-            markers.forEach(marker => map.removeLayer(marker));
-            markers = [];
-            
-            // Add filtered markers
-            filteredToilets.forEach(toilet => {{
-                const marker = L.marker([toilet.lat, toilet.lon], {{
-                    icon: getToiletIcon(toilet)
-                }}).addTo(map);
-                
-                marker.bindPopup(createPopupContent(toilet));
-                marker.on('click', () => selectToilet(toilet.id));
-                
-                markers.push(marker);
-            }});
-        }}
-
-        // Function to update sidebar
-        function updateSidebar() {{
-            const toiletList = document.getElementById('toiletList');
-            toiletList.innerHTML = '';
-            
-            filteredToilets.forEach(toilet => {{
-                toiletList.appendChild(createSidebarItem(toilet));
-            }});
-        }}
-
-        // Function to update statistics
-        function updateStats() {{
-            const totalCount = filteredToilets.length;
-            const wheelchairCount = filteredToilets.filter(t => t.tags.wheelchair === 'yes').length;
-            
-            document.getElementById('totalCount').textContent = totalCount;
-            document.getElementById('wheelchairCount').textContent = wheelchairCount;
-        }}
-
-        // Add event listeners for filters
-        document.getElementById('wheelchairFilter').addEventListener('change', filterToilets);
-        document.getElementById('feeFilter').addEventListener('change', filterToilets);
-        document.getElementById('accessFilter').addEventListener('change', filterToilets);
-
-        // Initialize the map
-        filteredToilets = toiletData.elements;
-        updateMap();
-        updateSidebar();
-        updateStats();
-
-        // Fit map to show all toilets
-        if (filteredToilets.length > 0) {{
-            const group = new L.featureGroup(markers);
-            map.fitBounds(group.getBounds().pad(0.1));
-        }}
+{script}
     </script>
 </body>
 </html>'''
+        render.record(bytes_out=len(html_content))
     
     # Write HTML file
     try:
-        with open(output_file, 'w', encoding='utf-8') as f:
-            f.write(html_content)
+        with stage('write') as s:
+            with open(output_file, 'w', encoding='utf-8') as f:
+                f.write(html_content)
+            s.record(bytes_out=file_size(output_file))
         print(f"🗺️  Map generated successfully: {output_file}")
-        print(f"📱 Open {output_file} in your browser to view the map")
+        if chunked:
+            print(f"📱 Serve this folder over HTTP (python -m http.server) and open {output_file}")
+        else:
+            print(f"📱 Open {output_file} in your browser to view the map")
         return output_file
     except Exception as e:
         print(f"❌ Error writing HTML file: {e}")
         return None
 
-def find_json_files():
-    """Find JSON files in current directory that might contain toilet data"""
-    json_files = []
-    for file in os.listdir('.'):
-        if file.endswith('.json'):
-            try:
-                with open(file, 'r') as f:
-                    data = json.load(f)
-                    # Check if it looks like toilet data
-                    if ('elements' in data and 
-                        isinstance(data['elements'], list) and 
-                        len(data['elements']) > 0 and
-                        any('amenity' in elem.get('tags', {}) for elem in data['elements'][:5])):
-                        json_files.append(file)
-            except:
-                continue
-    return json_files
+def find_json_files(directory='.'):
+    """
+    Find toilet snapshots in a directory
+    
+    Uses the snapshot catalog written by the fetcher, falling back to a
+    bounded header sniff for files it does not know yet, so no snapshot is
+    loaded just to be listed.
+    """
+    return [entry['file'] for entry in list_snapshots(directory)]
 
 if __name__ == "__main__":
+    enable_from_args(sys.argv)
     print("🚽 Toilet Map Generator")
     print("=" * 40)
     
-    # Look for JSON files
-    json_files = find_json_files()
+    # Look for snapshots, described from the catalog
+    snapshots = {entry['file']: entry for entry in list_snapshots('.')}
+    json_files = list(snapshots)
     
     if not json_files:
         print("❌ No toilet JSON files found in current directory.")
@@ -587,11 +914,11 @@ if __name__ == "__main__":
             exit()
     elif len(json_files) == 1:
         json_file = json_files[0]
-        print(f"📁 Found toilet data file: {json_file}")
+        print(f"📁 Found toilet data file: {describe_snapshot(snapshots[json_file])}")
     else:
         print("📁 Found multiple JSON files:")
         for i, file in enumerate(json_files, 1):
-            print(f"   {i}. {file}")
+            print(f"   {i}. {describe_snapshot(snapshots[file])}")
         
         try:
             choice = int(input("Select file number: ")) - 1
@@ -600,8 +927,8 @@ if __name__ == "__main__":
             print("❌ Invalid selection")
             exit()
     
-    # Generate the map
-    output_file = generate_toilet_map(json_file)
+    # Generate the map; --chunked writes the data as tiles instead of inlining it
+    output_file = generate_toilet_map(json_file, chunked='--chunked' in sys.argv)
     
     if output_file:
         print(f"\n🎉 Success! Your toilet map is ready!")
@@ -0,0 +1,132 @@
+import math
+
+# Mean earth radius (IUGG) in metres
+EARTH_RADIUS_M = 6371008.8
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Great-circle distance in metres between two points given in degrees"""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def to_unit_vector(lat, lon):
+    """Convert degrees to a point on the unit sphere (x, y, z)"""
+    phi = math.radians(lat)
+    lam = math.radians(lon)
+    cos_phi = math.cos(phi)
+    return cos_phi * math.cos(lam), cos_phi * math.sin(lam), math.sin(phi)
+
+
+def chord_to_metres(chord):
+    """Great-circle distance in metres for a chord length on the unit sphere"""
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, chord / 2))
+
+
+def metres_to_chord(metres):
+    """Chord length on the unit sphere for a great-circle distance in metres"""
+    return 2 * math.sin(min(math.pi, metres / EARTH_RADIUS_M) / 2)
+
+
+def polygon_centroid(points):
+    """
+    Area-weighted centroid (lat, lon) of a way's geometry points
+
+    Closed rings are projected onto a local equirectangular plane around
+    their first point, which is accurate to well under a metre at building
+    scale, and reduced with the shoelace formula. Open ways and degenerate
+    rings (zero area) fall back to the mean of their points.
+
+    Args:
+        points: List of {'lat', 'lon'} dicts, as in Overpass 'out geom'
+    """
+    closed = len(points) >= 4 and points[0] == points[-1]
+    if closed:
+        lat0, lon0 = points[0]['lat'], points[0]['lon']
+        scale = math.cos(math.radians(lat0))
+        xy = [((point['lon'] - lon0) * scale, point['lat'] - lat0) for point in points]
+        area = cx = cy = 0.0
+        for (x1, y1), (x2, y2) in zip(xy, xy[1:]):
+            cross = x1 * y2 - x2 * y1
+            area += cross
+            cx += (x1 + x2) * cross
+            cy += (y1 + y2) * cross
+        if abs(area) > 1e-18:
+            return lat0 + cy / (3 * area), lon0 + cx / (3 * area * scale)
+
+    return (
+        sum(point['lat'] for point in points) / len(points),
+        sum(point['lon'] for point in points) / len(points),
+    )
+
+
+def element_coordinates(element):
+    """
+    Representative (lat, lon) of an Overpass element, or None
+
+    Nodes use their own position, ways the centroid of their geometry and
+    anything else the centre of its bounds.
+    """
+    if element.get('type') == 'node' and 'lat' in element and 'lon' in element:
+        return element['lat'], element['lon']
+
+    points = [point for point in element.get('geometry') or () if point]
+    if points:
+        return polygon_centroid(points)
+
+    bounds = element.get('bounds')
+    if bounds:
+        return (bounds['minlat'] + bounds['maxlat']) / 2, (bounds['minlon'] + bounds['maxlon']) / 2
+
+    return None
+
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def geohash_encode(lat, lon, precision=5):
+    """Encode a position as a geohash string of the given length"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        interval, coordinate = (lon_range, lon) if even else (lat_range, lat)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bits = 0
+            value = 0
+    return ''.join(chars)
+
+
+def geohash_bounds(geohash):
+    """Bounding box (south, west, north, east) of a geohash cell"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        value = GEOHASH_ALPHABET.index(char)
+        for shift in range(4, -1, -1):
+            interval = lon_range if even else lat_range
+            middle = (interval[0] + interval[1]) / 2
+            if value >> shift & 1:
+                interval[0] = middle
+            else:
+                interval[1] = middle
+            even = not even
+    return lat_range[0], lon_range[0], lat_range[1], lon_range[1]
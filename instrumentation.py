@@ -0,0 +1,266 @@
+import atexit
+import functools
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+
+# TOILETS_METRICS=json writes one JSON line per finished stage, =prom a
+# Prometheus text file (for node_exporter's textfile collector) at exit.
+# Unset, every hook below is a no-op
+METRICS_ENV = 'TOILETS_METRICS'
+METRICS_FILE_ENV = 'TOILETS_METRICS_FILE'
+# Also trace Python allocations for a per-stage peak (slows the run down)
+TRACEMALLOC_ENV = 'TOILETS_METRICS_TRACEMALLOC'
+
+FORMATS = ('json', 'prom')
+DEFAULT_PROM_FILE = 'toilets_metrics.prom'
+METRIC_PREFIX = 'toilets_stage'
+
+# ru_maxrss is in kilobytes on Linux and bytes on macOS
+_RSS_UNIT = 1 if sys.platform == 'darwin' else 1024
+
+_format = None
+_output = None
+_local = threading.local()
+_lock = threading.Lock()
+_totals = {}
+
+
+def enable(fmt, output=None):
+    """
+    Turn metrics on for this process
+
+    Args:
+        fmt: 'json' or 'prom'
+        output: File to write to (default: stderr for json,
+            toilets_metrics.prom for prom)
+    """
+    global _format, _output
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown metrics format '{fmt}', expected one of: {', '.join(FORMATS)}")
+    if _format is None and fmt == 'prom':
+        atexit.register(write_prometheus)
+    _format = fmt
+    _output = output or (DEFAULT_PROM_FILE if fmt == 'prom' else None)
+    if os.environ.get(TRACEMALLOC_ENV) and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def enabled():
+    return _format is not None
+
+
+def enable_from_args(argv):
+    """
+    Enable metrics from a --metrics=json|prom argument and return argv without it
+
+    For the scripts that read sys.argv directly. The output file still
+    comes from TOILETS_METRICS_FILE.
+    """
+    remaining = []
+    for arg in argv:
+        if arg.startswith('--metrics='):
+            enable(arg.split('=', 1)[1], os.environ.get(METRICS_FILE_ENV))
+        else:
+            remaining.append(arg)
+    return remaining
+
+
+def _stack():
+    """The running stages of the current thread, innermost last"""
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+
+class _Stage:
+    """A running stage; use through stage()"""
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        self.values = {}
+
+    def record(self, **values):
+        """Add counts (bytes_in, bytes_out, elements, ...) to this stage"""
+        for key, value in values.items():
+            if value is not None:
+                self.values[key] = self.values.get(key, 0) + value
+
+    def __enter__(self):
+        stack = _stack()
+        if stack:
+            self.name = f"{stack[-1].name}.{self.name}"
+            self.labels = {**stack[-1].labels, **self.labels}
+        stack.append(self)
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        _stack().pop()
+        event = {
+            'stage': self.name,
+            'labels': self.labels,
+            'ok': exc_type is None and self.values.pop('failed', 0) == 0,
+            'duration_s': round(duration, 6),
+            **self.values,
+            'peak_rss_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * _RSS_UNIT,
+        }
+        if tracemalloc.is_tracing():
+            event['traced_peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        _emit(event)
+        return False
+
+
+class _NullStage:
+    """Stand-in while metrics are off, so instrumented code costs a call"""
+
+    def record(self, **values):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+def stage(name, **labels):
+    """
+    Context manager timing one stage of a script
+
+    Stages nest: a stage opened inside another is named parent.child and
+    inherits its labels. On exit the duration, the recorded counts and the
+    process's peak RSS are emitted.
+
+        with stage('write') as s:
+            ...
+            s.record(bytes_out=size)
+    """
+    if _format is None:
+        return _NULL_STAGE
+    return _Stage(name, labels)
+
+
+def record(**values):
+    """Add counts to the innermost running stage"""
+    if _format is not None and _stack():
+        _stack()[-1].record(**values)
+
+
+def instrumented(name=None, **labels):
+    """
+    Decorator running a function as a stage
+
+    Scripts here return None (or (None, None)) on failure, so such a
+    result marks the stage as failed.
+    """
+    def decorate(function):
+        stage_name = name or function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _format is None:
+                return function(*args, **kwargs)
+            with stage(stage_name, **labels) as current:
+                result = function(*args, **kwargs)
+                if result is None or (isinstance(result, tuple) and result and result[0] is None):
+                    current.record(failed=1)
+                return result
+        return wrapper
+    return decorate
+
+
+def file_size(path):
+    """Size of a file in bytes, or None if it cannot be read"""
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return None
+
+
+def _emit(event):
+    with _lock:
+        if _format == 'json':
+            _write_json(event)
+        else:
+            _accumulate(event)
+
+
+def _write_json(event):
+    line = json.dumps(event, ensure_ascii=False)
+    if _output:
+        with open(_output, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+    else:
+        print(line, file=sys.stderr)
+
+
+def _accumulate(event):
+    key = (event['stage'], tuple(sorted(event['labels'].items())))
+    totals = _totals.setdefault(key, {'runs': 0, 'failures': 0})
+    totals['runs'] += 1
+    totals['failures'] += 0 if event['ok'] else 1
+    for metric, value in event.items():
+        if metric in ('stage', 'labels', 'ok') or not isinstance(value, (int, float)):
+            continue
+        if metric.startswith('peak_') or metric.startswith('traced_peak_'):
+            totals[metric] = max(totals.get(metric, 0), value)
+        else:
+            totals[metric] = totals.get(metric, 0) + value
+    totals['last_run_timestamp_seconds'] = time.time()
+
+
+def _prom_metric_name(metric):
+    name = metric[:-2] + '_seconds' if metric.endswith('_s') else metric
+    if not name.startswith('peak_') and not name.startswith('traced_peak_') and \
+            name != 'last_run_timestamp_seconds':
+        name += '_total'
+    return f"{METRIC_PREFIX}_{name}"
+
+
+def _prom_labels(stage_name, labels):
+    pairs = [('stage', stage_name)] + list(labels)
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for _, value in pairs)
+    return ','.join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped))
+
+
+def format_prometheus():
+    """The accumulated stage totals in the Prometheus text exposition format"""
+    by_metric = {}
+    for (stage_name, labels), totals in _totals.items():
+        for metric, value in totals.items():
+            by_metric.setdefault(_prom_metric_name(metric), []).append((stage_name, labels, value))
+    lines = []
+    for name in sorted(by_metric):
+        kind = 'counter' if name.endswith('_total') else 'gauge'
+        lines.append(f"# TYPE {name} {kind}")
+        for stage_name, labels, value in by_metric[name]:
+            lines.append(f"{name}{{{_prom_labels(stage_name, labels)}}} {value!r}")
+    return '\n'.join(lines) + '\n'
+
+
+def write_prometheus(path=None):
+    """Write the totals to the .prom file atomically, so the collector never reads half of it"""
+    path = path or _output
+    if not _totals or not path:
+        return
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(format_prometheus())
+    os.replace(temp_path, path)
+
+
+if os.environ.get(METRICS_ENV):
+    enable(os.environ[METRICS_ENV], os.environ.get(METRICS_FILE_ENV))
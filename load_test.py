@@ -0,0 +1,141 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+from urllib.parse import urlencode, urlsplit
+
+# Mainland-ish area where queries are generated; Svalbard and Jan Mayen
+# would mostly produce empty answers
+QUERY_BBOX = (58.0, 5.0, 70.0, 30.0)
+
+
+def random_query(rng, mix):
+    """Build a random API path for one of the endpoints in mix"""
+    south, west, north, east = QUERY_BBOX
+    lat = rng.uniform(south, north)
+    lon = rng.uniform(west, east)
+    endpoint = rng.choice(mix)
+    params = {}
+    if endpoint == 'nearest':
+        params = {'lat': lat, 'lon': lon, 'n': 5}
+    elif endpoint == 'radius':
+        params = {'lat': lat, 'lon': lon, 'r': rng.choice((500, 2000, 10000))}
+    elif endpoint == 'bbox':
+        size = rng.uniform(0.02, 0.5)
+        params = {'south': lat, 'west': lon, 'north': lat + size, 'east': lon + size * 2}
+    if rng.random() < 0.3:
+        params['wheelchair'] = 'yes'
+    if rng.random() < 0.2:
+        params['fee'] = 'free'
+    return f"/{endpoint}?{urlencode(params)}"
+
+
+async def _request(reader, writer, host, path):
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode('latin-1'))
+    await writer.drain()
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("Server closed the connection")
+    status = int(status_line.split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value.strip())
+    await reader.readexactly(length)
+    return status
+
+
+async def _worker(host, port, paths, latencies, errors):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while paths:
+            path = paths.pop()
+            start = time.perf_counter()
+            try:
+                status = await _request(reader, writer, host, path)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                errors.append('connection')
+                writer.close()
+                reader, writer = await asyncio.open_connection(host, port)
+                continue
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors.append(status)
+    finally:
+        writer.close()
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def run_load_test(url, total_requests=5000, concurrency=32, mix=('nearest', 'radius', 'bbox'), seed=1):
+    """
+    Send total_requests random queries over concurrency keep-alive connections
+
+    Returns a dict with throughput and p50/p90/p99 latency in milliseconds.
+    """
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    rng = random.Random(seed)
+    paths = [random_query(rng, mix) for _ in range(total_requests)]
+
+    latencies = []
+    errors = []
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        _worker(host, port, paths, latencies, errors) for _ in range(concurrency)
+    ))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'concurrency': concurrency,
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p90_ms': round(percentile(latencies, 0.90) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'max_ms': round(latencies[-1] * 1000, 2) if latencies else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test a running toilet_service.py")
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--mix', default='nearest,radius,bbox',
+                        help="Comma separated endpoints to query")
+    parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+    args = parser.parse_args()
+
+    mix = tuple(endpoint.strip() for endpoint in args.mix.split(',') if endpoint.strip())
+    report = asyncio.run(run_load_test(args.url, args.requests, args.concurrency, mix))
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print("🚽 Toilet service load test")
+    print("=" * 30)
+    print(f"Requests:    {report['requests']} ({report['errors']} errors)")
+    print(f"Concurrency: {report['concurrency']}")
+    print(f"Throughput:  {report['throughput_rps']} req/s")
+    print(f"Latency p50: {report['p50_ms']} ms")
+    print(f"Latency p90: {report['p90_ms']} ms")
+    print(f"Latency p99: {report['p99_ms']} ms")
+
+
+if __name__ == "__main__":
+    main()
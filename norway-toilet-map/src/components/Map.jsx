@@ -6,6 +6,7 @@ import L from 'leaflet'
 import MapContent from './map/MapContent'
 import MapStats from './map/MapStats'
 import LoadingOverlay from './map/LoadingOverlay'
+import { bitIndices, decodeFilters, decodePayload, displayLookup } from './map/payload'
 
 // -----------------------------------------------------------------------------
 // Leaflet icon fix (ensures default marker icons load correctly)
@@ -42,6 +43,8 @@ const createUserLocationIcon = () => {
 
 function Map({ sidebarOpen, filters }) {
   const [toilets, setToilets] = useState([])
+  const [filterIndex, setFilterIndex] = useState(null)
+  const [display, setDisplay] = useState(() => displayLookup())
   const [loading, setLoading] = useState(true)
   const [visibleCount, setVisibleCount] = useState(0)
   const [userLocation, setUserLocation] = useState(null)
@@ -81,6 +84,19 @@ function Map({ sidebarOpen, filters }) {
       return toilets
     }
 
+    // Combine the precomputed bitsets instead of testing every toilet
+    if (filterIndex) {
+      const { everything, bits, and, andNot } = filterIndex
+      let selected = everything
+      if (filters.wheelchairOnly) {
+        selected = and(selected, bits('wheelchair', 'yes'))
+      }
+      if (filters.freeOnly) {
+        selected = andNot(selected, bits('fee', 'yes'))
+      }
+      return bitIndices(selected).map(i => toilets[i])
+    }
+
     return toilets.filter(toilet => {
       if (filters.wheelchairOnly && toilet.wheelchair !== 'yes') {
         return false
@@ -92,61 +108,26 @@ function Map({ sidebarOpen, filters }) {
 
       return true
     })
-  }, [toilets, filters])
+  }, [toilets, filterIndex, filters])
 
   // ---------------------------------------------------------------------------
-  // Load toilet GeoJSON (or Overpass) once on mount
+  // Load the prebuilt toilets.json once on mount
   // ---------------------------------------------------------------------------
   useEffect(() => {
     const loadToilets = async () => {
       try {
-        const response = await fetch('/toilets.json')
+        // The manifest is revalidated on every load; the hashed file it
+        // points to never changes, so the browser and CDN may keep it forever
+        const manifestResponse = await fetch('/data/manifest.json', { cache: 'no-cache' })
+        const manifest = await manifestResponse.json()
+        const response = await fetch(`/data/${manifest.assets['toilets.json'].file}`)
         const data = await response.json()
 
-        const processed = data.elements
-          .map((toilet) => {
-            let lat, lon
-
-            if (toilet.type === 'node') {
-              lat = toilet.lat
-              lon = toilet.lon
-            } else if (toilet.type === 'way' && toilet.geometry?.length) {
-              const lats = toilet.geometry.map((p) => p.lat)
-              const lons = toilet.geometry.map((p) => p.lon)
-              lat = lats.reduce((sum, x) => sum + x, 0) / lats.length
-              lon = lons.reduce((sum, x) => sum + x, 0) / lons.length
-            } else if (toilet.bounds) {
-              lat = (toilet.bounds.minlat + toilet.bounds.maxlat) / 2
-              lon = (toilet.bounds.minlon + toilet.bounds.maxlon) / 2
-            } else {
-              return null
-            }
-
-            const access = toilet.tags?.access || 'unknown'
-            if (access === 'no' || access === 'private') {
-              return null
-            }
-
-            const numberOfToilets =
-              toilet.type === 'node' ? 1 :
-              (toilet.geometry?.length || 1)
-
-            return {
-              ...toilet,
-              lat,
-              lon,
-              numberOfToilets,
-              access,
-              fee: toilet.tags?.fee || 'unknown',
-              wheelchair: toilet.tags?.wheelchair || 'unknown',
-              unisex: toilet.tags?.unisex || 'unknown',
-              disposal: toilet.tags?.['toilets:disposal'] || 'unknown',
-              building: toilet.tags?.building || 'unknown',
-            }
-          })
-          .filter(Boolean)
-
-        setToilets(processed)
+        // toilets.json is built by build_toilets.py: positions, counts and
+        // normalized fields are precomputed and hidden toilets removed
+        setToilets(decodePayload(data))
+        setFilterIndex(data.filters ? decodeFilters(data.filters) : null)
+        setDisplay(() => displayLookup(data.display))
       } catch (err) {
         console.error('Error loading toilet data:', err)
       } finally {
@@ -186,7 +167,7 @@ function Map({ sidebarOpen, filters }) {
           zoomOffset={-1}
         />
 
-        <MapContent toilets={filteredToilets} onStatsUpdate={setVisibleCount} />
+        <MapContent toilets={filteredToilets} display={display} onStatsUpdate={setVisibleCount} />
 
         {userLocation && (
           <>
@@ -4,7 +4,7 @@ import Supercluster from 'supercluster'
 import { createClusterIcon, createToiletIcon } from './MapIcons'
 import ToiletPopup from './ToiletPopup'
 
-function MapContent({ toilets, onStatsUpdate }) {
+function MapContent({ toilets, display, onStatsUpdate }) {
   const [clusters, setClusters] = useState([])
   const [supercluster, setSupercluster] = useState(null)
 
@@ -95,7 +95,7 @@ function MapContent({ toilets, onStatsUpdate }) {
             icon={createToiletIcon(cluster.properties.toilet)}
           >
             <Popup>
-              <ToiletPopup toilet={cluster.properties.toilet} />
+              <ToiletPopup toilet={cluster.properties.toilet} display={display} />
             </Popup>
           </Marker>
         )
@@ -1,18 +1,9 @@
 import React from 'react'
+import { displayLookup } from './payload'
 
-const capitalize = (str) => {
-  if (!str) return ''
-  return str.charAt(0).toUpperCase() + str.slice(1)
-}
-
-const formatCurrency = (value) => {
-  if (!value) return ''
-  return value.toLowerCase().includes('nok')
-    ? value.replace(/nok/gi, 'NOK')
-    : capitalize(value)
-}
-
-const ToiletPopup = ({ toilet }) => {
+// Values are formatted at build time by display_rules.py (see
+// display_rules.json); display() only looks the strings up
+const ToiletPopup = ({ toilet, display = displayLookup() }) => {
   const tags = toilet.tags || {}
 
   const openDirections = () => {
@@ -29,25 +20,25 @@ const ToiletPopup = ({ toilet }) => {
 
         {toilet.access !== 'unknown' && (
           <p>
-            <strong>Access:</strong> {capitalize(toilet.access)}
+            <strong>Access:</strong> {display('access', toilet.access)}
           </p>
         )}
 
         {toilet.fee !== 'unknown' && (
           <p>
-            <strong>Fee:</strong> {formatCurrency(toilet.fee)}
+            <strong>Fee:</strong> {display('fee', toilet.fee)}
           </p>
         )}
 
         {toilet.wheelchair !== 'unknown' && (
           <p>
-            <strong>Wheelchair:</strong> {capitalize(toilet.wheelchair)}
+            <strong>Wheelchair:</strong> {display('wheelchair', toilet.wheelchair)}
           </p>
         )}
 
         {toilet.changing_table && (
           <p>
-            <strong>Changing Table:</strong> {capitalize(toilet.changing_table)}
+            <strong>Changing Table:</strong> {display('changing_table', toilet.changing_table)}
           </p>
         )}
 
@@ -59,37 +50,37 @@ const ToiletPopup = ({ toilet }) => {
 
         {toilet.unisex !== 'unknown' && (
           <p>
-            <strong>Unisex:</strong> {capitalize(toilet.unisex)}
+            <strong>Unisex:</strong> {display('unisex', toilet.unisex)}
           </p>
         )}
 
         {tags.opening_hours && (
           <p>
-            <strong>Opening Hours:</strong> {tags.opening_hours}
+            <strong>Opening Hours:</strong> {display('opening_hours', tags.opening_hours)}
           </p>
         )}
 
         {tags.operator && (
           <p>
-            <strong>Operator:</strong> {capitalize(tags.operator)}
+            <strong>Operator:</strong> {display('operator', tags.operator)}
           </p>
         )}
 
         {tags.charge && (
           <p>
-            <strong>Charge:</strong> {formatCurrency(tags.charge)}
+            <strong>Charge:</strong> {display('charge', tags.charge)}
           </p>
         )}
 
         {tags.description && (
           <p>
-            <strong>Description:</strong> {tags.description}
+            <strong>Description:</strong> {display('description', tags.description)}
           </p>
         )}
 
         {tags.note && (
           <p>
-            <strong>Note:</strong> {capitalize(tags.note)}
+            <strong>Note:</strong> {display('note', tags.note)}
           </p>
         )}
 
@@ -0,0 +1,113 @@
+// -----------------------------------------------------------------------------
+// Helper: expand a payload written by build_payload.py into toilet objects.
+// Plain Overpass JSON (and the 'objects' layout) is returned unchanged.
+// -----------------------------------------------------------------------------
+export const decodePayload = (payload) => {
+  if (payload.format !== 'arrays' && payload.format !== 'delta') {
+    return payload.elements
+  }
+
+  const scale = 10 ** payload.precision
+  const { types, fields, keys, values } = payload
+  let id = 0
+  let lat = 0
+  let lon = 0
+
+  return payload.elements.map((row) => {
+    if (payload.format === 'delta') {
+      id += row[1]
+      lat += row[2]
+      lon += row[3]
+    } else {
+      ;[id, lat, lon] = [row[1], row[2], row[3]]
+    }
+
+    const toilet = {
+      type: types[row[0]],
+      id,
+      lat: lat / scale,
+      lon: lon / scale,
+      numberOfToilets: row[4],
+    }
+
+    // Extra fields written by build_toilets.py, e.g. the normalized access
+    for (let i = 5; i < fields.length; i++) {
+      toilet[fields[i]] = values[row[i]]
+    }
+
+    toilet.tags = {}
+    for (let i = fields.length; i < row.length; i += 2) {
+      toilet.tags[keys[row[i]]] = values[row[i + 1]]
+    }
+
+    return toilet
+  })
+}
+
+// -----------------------------------------------------------------------------
+// Helper: filter bitsets written by build_toilets.py (toilet_filters.FilterIndex).
+// Bit i is toilet i; each bitset is base64 little-endian bytes, decoded into
+// 32-bit words so a filter costs a few word operations per 32 toilets.
+// -----------------------------------------------------------------------------
+const decodeBitset = (encoded, words) => {
+  const bytes = Uint8Array.from(atob(encoded), (c) => c.charCodeAt(0))
+  const bits = new Uint32Array(words)
+  bytes.forEach((byte, i) => {
+    bits[i >> 2] |= byte << ((i & 3) * 8)
+  })
+  return bits
+}
+
+export const decodeFilters = (filters) => {
+  const words = Math.ceil(filters.size / 32)
+  const everything = new Uint32Array(words).fill(0xffffffff)
+  if (filters.size % 32) {
+    everything[words - 1] = 2 ** (filters.size % 32) - 1
+  }
+
+  const bitsets = {}
+  for (const [key, values] of Object.entries(filters.bitsets)) {
+    bitsets[key] = {}
+    for (const [value, encoded] of Object.entries(values)) {
+      bitsets[key][value] = decodeBitset(encoded, words)
+    }
+  }
+
+  return {
+    everything,
+    // OR of the toilets having any of the values
+    bits: (key, ...values) => {
+      const result = new Uint32Array(words)
+      for (const value of values) {
+        const bits = bitsets[key]?.[value]
+        if (bits) {
+          result.forEach((word, i) => {
+            result[i] = word | bits[i]
+          })
+        }
+      }
+      return result
+    },
+    and: (a, b) => a.map((word, i) => word & b[i]),
+    andNot: (a, b) => a.map((word, i) => word & ~b[i]),
+  }
+}
+
+// Indices of the set bits, skipping empty words
+export const bitIndices = (bits) => {
+  const indices = []
+  bits.forEach((word, w) => {
+    while (word) {
+      const low = word & -word
+      indices.push(w * 32 + 31 - Math.clz32(low))
+      word ^= low
+    }
+  })
+  return indices
+}
+
+// -----------------------------------------------------------------------------
+// Helper: popup display strings written by build_toilets.py (display_rules.py).
+// Values without an entry are shown as they are.
+// -----------------------------------------------------------------------------
+export const displayLookup = (display = {}) => (key, value) => display[key]?.[value] ?? value
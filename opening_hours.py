@@ -0,0 +1,301 @@
+import functools
+import re
+import sys
+from collections import namedtuple
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from toilet_filters import bitset_of, toilet_value
+
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+WEEK_BITS = (1 << MINUTES_PER_WEEK) - 1
+
+# opening_hours are local times; the data is Norwegian
+LOCAL_TIMEZONE = ZoneInfo('Europe/Oslo')
+
+WEEKDAYS = {'mo': 0, 'tu': 1, 'we': 2, 'th': 3, 'fr': 4, 'sa': 5, 'su': 6}
+MONTHS = {name: number for number, name in
+          enumerate(('jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'), 1)}
+DAYS_IN_MONTH = {1: 31, 2: 29, 3: 31, 4: 30, 5: 31, 6: 30, 7: 31, 8: 31, 9: 30, 10: 31, 11: 30, 12: 31}
+
+# There is no holiday calendar here: holidays are dropped from day lists
+# like 'Sa,Su,PH', and rules that only apply on holidays ('PH off') are
+# skipped, leaving the weekday rules
+HOLIDAYS = ('ph', 'sh')
+
+_WEEK = re.compile(r'week\s*(\d{1,2})(?:\s*-\s*(\d{1,2}))?\s*:?\s*', re.I)
+_MONTH = r'(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)'
+_DATES = re.compile(rf'{_MONTH}(?:\s+(\d{{1,2}})(?![\d:]))?(?:\s*-\s*(?:{_MONTH}\s*)?(?:(\d{{1,2}})(?![\d:]))?)?(?![a-z])\s*:?\s*', re.I)
+_DAY = r'(mo|tu|we|th|fr|sa|su|ph|sh)[a-z]?(?![a-z])'
+_DAYS = re.compile(rf'{_DAY}(?:\s*-\s*{_DAY})?\s*:?\s*', re.I)
+_SPAN = re.compile(r'(\d{1,2}):(\d{2})\s*-\s*(\d{1,2}):(\d{2})\s*', re.I)
+_STATE = re.compile(r'(24/7|off|closed|open)\s*', re.I)
+
+# One rule of an opening_hours string. dates: (kind, start, end) or None for
+# every date; days: weekday numbers (Mo = 0) or None for all; spans: minute
+# ranges or None for the whole day; additive: joined with ',' instead of ';'
+Rule = namedtuple('Rule', ['dates', 'days', 'spans', 'open', 'additive'])
+
+
+def _spans_bits(days, spans):
+    """Week bitmask of minute spans on the given days; spans past midnight spill into the next day"""
+    bits = 0
+    for day in days:
+        for start, end in spans:
+            first = day * MINUTES_PER_DAY + start
+            length = end - start if end > start else MINUTES_PER_DAY - start + end
+            span = ((1 << length) - 1) << first
+            bits |= (span | span >> MINUTES_PER_WEEK) & WEEK_BITS  # Sunday night continues on Monday
+    return bits
+
+
+def _day_bits(days):
+    return _spans_bits(days, [(0, MINUTES_PER_DAY)])
+
+
+def _parse_piece(piece):
+    """Split one comma-separated piece into its date, day, time and state parts"""
+    dates = days = spans = state = None
+    text = piece.strip()
+    match = _WEEK.match(text)
+    if match:
+        first = int(match.group(1))
+        dates = ('week', first, int(match.group(2) or first))
+        text = text[match.end():]
+    else:
+        match = _DATES.match(text)
+        if match:
+            start_month, start_day, end_month, end_day = match.groups()
+            start = (MONTHS[start_month.lower()], int(start_day or 1))
+            if end_month or end_day:
+                month = MONTHS[(end_month or start_month).lower()]
+                end = (month, int(end_day) if end_day else DAYS_IN_MONTH[month])
+            else:
+                end = (start[0], int(start_day) if start_day else DAYS_IN_MONTH[start[0]])
+            dates = ('date', start, end)
+            text = text[match.end():]
+
+    match = _DAYS.match(text)
+    if match:
+        first, last = match.group(1).lower(), (match.group(2) or match.group(1)).lower()
+        if first in HOLIDAYS or last in HOLIDAYS:
+            days = [first] if first == last else None
+            if days is None:
+                raise ValueError(f"holiday range in '{piece}'")
+        else:
+            start, end = WEEKDAYS[first], WEEKDAYS[last]
+            days = [(start + offset) % 7 for offset in range((end - start) % 7 + 1)]
+        text = text[match.end():]
+
+    while text:
+        match = _SPAN.match(text)
+        if match:
+            start_hour, start_minute, end_hour, end_minute = map(int, match.groups())
+            start, end = start_hour * 60 + start_minute, end_hour * 60 + end_minute
+            if start >= MINUTES_PER_DAY or end > MINUTES_PER_DAY or start_minute > 59 or end_minute > 59:
+                raise ValueError(f"bad time in '{piece}'")
+            spans = (spans or []) + [(start, end)]
+            text = text[match.end():]
+            continue
+        match = _STATE.match(text)
+        if match and state is None:
+            state = match.group(1).lower()
+            text = text[match.end():]
+            continue
+        raise ValueError(f"cannot read '{text}'")
+    return dates, days, spans, state
+
+
+def parse_rules(text):
+    """
+    Parse an opening_hours string into Rules, raising ValueError when it
+    uses syntax this compiler does not handle
+
+    Covers the forms found on toilets: 24/7, weekday ranges and lists, time
+    spans (also past midnight), off/closed, month and date ranges, ISO week
+    ranges, and rules joined by ';' (override) or ',' (additive).
+    """
+    rules = []
+    for group in text.split(';'):
+        if not group.strip():
+            continue
+        pending_days = []
+        pending_dates = None
+        group_rules = []
+        for piece in group.split(','):
+            dates, days, spans, state = _parse_piece(piece)
+            if spans is not None and dates is None and days is None and state is None and group_rules:
+                # 'Sa 00:00-01:00, 09:30-24:00': more spans for the rule before
+                previous = group_rules[-1]
+                group_rules[-1] = previous._replace(spans=(previous.spans or ()) + tuple(spans))
+                continue
+            if spans is None and state is None and days is not None:
+                # 'Sa, Su 10:00-18:00': the day list continues in the next piece
+                pending_days += days
+                pending_dates = pending_dates or dates
+                continue
+            if pending_days:
+                days = pending_days + (days or [])
+                dates = dates or pending_dates
+                pending_days, pending_dates = [], None
+            rule = _make_rule(dates, days, spans, state, additive=bool(group_rules))
+            if rule:
+                group_rules.append(rule)
+        if pending_days:
+            rule = _make_rule(pending_dates, pending_days, None, None, additive=bool(group_rules))
+            if rule:
+                group_rules.append(rule)
+        rules.extend(group_rules)
+    if not rules:
+        raise ValueError("empty opening_hours")
+    return rules
+
+
+def _make_rule(dates, days, spans, state, additive):
+    """A Rule from the parts of a piece, or None for a holiday-only rule"""
+    if days is not None:
+        weekdays = [day for day in days if day not in HOLIDAYS]
+        if not weekdays:
+            return None
+        days = tuple(sorted(set(weekdays)))
+    if state == '24/7':
+        if spans or days is not None:
+            raise ValueError("24/7 with days or times")
+        spans = None
+    return Rule(dates, days, tuple(spans) if spans else None, state not in ('off', 'closed'), additive)
+
+
+def _applies(dates, day):
+    """Whether a rule's date selector covers a date"""
+    if dates is None:
+        return True
+    kind, start, end = dates
+    if kind == 'week':
+        week = day.isocalendar()[1]
+        return start <= week <= end if start <= end else week >= start or week <= end
+    current = (day.month, day.day)
+    return start <= current <= end if start <= end else current >= start or current <= end
+
+
+class OpeningHours:
+    """
+    An opening_hours string compiled into weekly minute bitmasks
+
+    Bit day * 1440 + minute of a mask (Monday = day 0) is set when open.
+    Strings without date selectors compile to a single mask; seasonal
+    ones get a mask per combination of rules in effect, built on first use.
+    parsed is False when the string could not be read; such hours are
+    never open.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        try:
+            self.rules = parse_rules(text)
+            self.parsed = True
+        except ValueError:
+            self.rules = []
+            self.parsed = False
+        self.seasonal = any(rule.dates for rule in self.rules)
+        self._masks = {}
+        self.weekly = None if self.seasonal else self._mask(tuple(range(len(self.rules))))
+
+    def _mask(self, active):
+        """The weekly mask with only the rules at the active indexes in effect"""
+        if active not in self._masks:
+            mask = 0
+            for index in active:
+                rule = self.rules[index]
+                days = rule.days if rule.days is not None else range(7)
+                bits = _spans_bits(days, rule.spans or [(0, MINUTES_PER_DAY)])
+                if not rule.additive:
+                    mask &= ~_day_bits(days)  # A new rule replaces what earlier ones said about its days
+                mask = mask | bits if rule.open else mask & ~bits
+            self._masks[active] = mask
+        return self._masks[active]
+
+    def mask_on(self, day):
+        """The weekly mask in effect on a date"""
+        if not self.seasonal:
+            return self.weekly
+        return self._mask(tuple(i for i, rule in enumerate(self.rules) if _applies(rule.dates, day)))
+
+    def is_open(self, when):
+        """Whether open at a (local) datetime"""
+        if not self.parsed:
+            return False
+        minute = when.weekday() * MINUTES_PER_DAY + when.hour * 60 + when.minute
+        return bool(self.mask_on(when.date()) >> minute & 1)
+
+
+@functools.lru_cache(maxsize=4096)
+def compile_opening_hours(text):
+    """Compile an opening_hours string; identical strings share one OpeningHours"""
+    return OpeningHours(text.strip())
+
+
+class OpeningHoursIndex:
+    """
+    Opening hours of every toilet, for "open at" queries over the dataset
+
+    Toilets are grouped by their opening_hours string, so a query evaluates
+    each distinct string once and ORs the groups' bitsets. The bitsets use
+    the toilet order of the input, like toilet_filters.FilterIndex, so the
+    two combine with &.
+
+    Args:
+        size: Number of toilets
+        groups: opening_hours string -> bitset of the toilets carrying it
+    """
+
+    def __init__(self, size, groups):
+        self.size = size
+        self.groups = groups
+        self.compiled = {text: compile_opening_hours(text) for text in groups}
+        self.unparsed = 0
+        for text, bits in groups.items():
+            if not self.compiled[text].parsed:
+                self.unparsed |= bits
+        self.known = 0
+        for bits in groups.values():
+            self.known |= bits
+        self.known &= ~self.unparsed
+
+    @classmethod
+    def from_toilets(cls, toilets):
+        members = {}
+        size = 0
+        for i, toilet in enumerate(toilets):
+            text = toilet_value(toilet, 'opening_hours')
+            if text:
+                members.setdefault(text, []).append(i)
+            size = i + 1
+        return cls(size, {text: bitset_of(indices, size) for text, indices in members.items()})
+
+    def open_at(self, when):
+        """Bitset of the toilets whose hours say they are open at a local datetime"""
+        result = 0
+        for text, bits in self.groups.items():
+            if self.compiled[text].is_open(when):
+                result |= bits
+        return result
+
+
+def main():
+    """Compile opening_hours strings given as arguments and show whether they are open now"""
+    if len(sys.argv) < 2:
+        print('Usage: python opening_hours.py "<opening_hours>" ...')
+        print('Example: python opening_hours.py "Mo-Fr 08:00-22:00; Sa, Su 09:00-20:00"')
+        return
+    now = datetime.now(LOCAL_TIMEZONE)
+    for text in sys.argv[1:]:
+        hours = compile_opening_hours(text)
+        if not hours.parsed:
+            print(f"❓ {text}: could not be parsed")
+        else:
+            print(f"{'🟢 open' if hours.is_open(now) else '🔴 closed'} now: {text}")
+
+
+if __name__ == "__main__":
+    main()
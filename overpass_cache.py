@@ -0,0 +1,345 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+from collections import namedtuple
+
+from overpass_stream import CHUNK_SIZE
+
+CACHE_ENV = 'OVERPASS_CACHE'
+CACHE_MAX_MB_ENV = 'OVERPASS_CACHE_MAX_MB'
+DEFAULT_CACHE_DIR = '.overpass_cache'
+INDEX_FILE = 'index.json'
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Seconds a response is served without asking the interpreter again.
+# Countries change slowly relative to how expensive they are to fetch
+DEFAULT_TTL = 3600
+REGION_TTLS = {
+    'norway': 6 * 3600,
+    'sweden': 6 * 3600,
+    'denmark': 6 * 3600,
+    'finland': 6 * 3600,
+}
+
+# Overpass puts its remark (e.g. a runtime error) at the end of the document
+TAIL_BYTES = 4096
+INCOMPLETE = b'runtime error'
+
+_QUOTED = re.compile(r'("(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\')')
+_WHITESPACE = re.compile(r'\s+')
+_AROUND_PUNCTUATION = re.compile(r' ?([^\w\s]) ?')
+
+CacheEntry = namedtuple('CacheEntry', ['key', 'path', 'meta'])
+
+
+def normalize_query(query):
+    """
+    Canonical form of an Overpass QL query, insensitive to layout
+
+    Outside string literals, whitespace runs become one space and spaces
+    next to punctuation are dropped, so re-indenting a query (or writing
+    'out geom ;') keeps its cache key. Quoted strings are left alone.
+    """
+    parts = _QUOTED.split(query)
+    for i in range(0, len(parts), 2):
+        parts[i] = _AROUND_PUNCTUATION.sub(r'\1', _WHITESPACE.sub(' ', parts[i]))
+    return ''.join(parts).strip()
+
+
+def cache_key(query, endpoint):
+    """Cache key of a query sent to an endpoint"""
+    text = f"{endpoint.rstrip('/')}\n{normalize_query(query)}"
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def is_incomplete(tail):
+    """Whether the end of an Overpass document reports a runtime error"""
+    return INCOMPLETE in tail
+
+
+class ResponseCache:
+    """
+    gzip-compressed Overpass responses on disk with TTL and LRU eviction
+
+    Bodies are stored as <directory>/<key[:2]>/<key>.json.gz, described in
+    index.json with the region, store time, last use, compressed size and
+    the validators (ETag / Last-Modified) the interpreter sent. Expired
+    entries with validators can be revalidated with a conditional request
+    instead of downloaded again. When the stored bodies exceed max_bytes
+    the least recently used are deleted.
+
+    Args:
+        directory: Cache folder
+        max_bytes: Disk budget for the compressed bodies
+        ttl: Seconds an entry stays fresh unless its region has its own
+        region_ttls: Region name -> TTL in seconds (default: REGION_TTLS)
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, ttl=DEFAULT_TTL,
+                 region_ttls=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.region_ttls = REGION_TTLS if region_ttls is None else region_ttls
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.index = self._load_index()
+
+    def _index_path(self):
+        return os.path.join(self.directory, INDEX_FILE)
+
+    def _load_index(self):
+        try:
+            with open(self._index_path(), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_index(self):
+        temp_path = self._index_path() + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.index, f)
+        os.replace(temp_path, self._index_path())
+
+    def _body_path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json.gz")
+
+    def ttl_for(self, region):
+        return self.region_ttls.get(region, self.ttl)
+
+    def get(self, query, endpoint):
+        """The entry for a query, fresh or not, or None"""
+        key = cache_key(query, endpoint)
+        with self._lock:
+            meta = self.index.get(key)
+            path = self._body_path(key)
+            if meta and not os.path.exists(path):
+                del self.index[key]
+                meta = None
+        return CacheEntry(key, path, dict(meta)) if meta else None
+
+    def is_fresh(self, entry, now=None):
+        return (now or time.time()) - entry.meta['stored'] < entry.meta['ttl']
+
+    def validators(self, entry):
+        """Headers for a conditional request revalidating an entry"""
+        headers = {}
+        if entry.meta.get('etag'):
+            headers['If-None-Match'] = entry.meta['etag']
+        if entry.meta.get('last_modified'):
+            headers['If-Modified-Since'] = entry.meta['last_modified']
+        return headers
+
+    def _touch(self, key, **updates):
+        with self._lock:
+            if key in self.index:
+                self.index[key].update(last_used=time.time(), **updates)
+                self._save_index()
+
+    def read(self, entry):
+        """The decompressed body of an entry"""
+        with gzip.open(entry.path, 'rb') as f:
+            body = f.read()
+        self._touch(entry.key)
+        return body
+
+    def extract(self, entry, output_file):
+        """Decompress an entry into a file, in chunks"""
+        with gzip.open(entry.path, 'rb') as source, open(output_file, 'wb') as target:
+            shutil.copyfileobj(source, target, CHUNK_SIZE)
+        self._touch(entry.key)
+        return output_file
+
+    def revalidated(self, entry):
+        """Restart an entry's TTL after the interpreter answered 304 Not Modified"""
+        self._touch(entry.key, stored=time.time())
+
+    def store(self, query, endpoint, region, body=None, source_file=None, headers=None):
+        """
+        Store a response body, given as bytes or as a file to compress in chunks
+
+        Responses reporting a runtime error are incomplete and not stored.
+
+        Returns:
+            The new CacheEntry, or None if it was not stored
+        """
+        if body is not None:
+            tail = body[-TAIL_BYTES:]
+        else:
+            with open(source_file, 'rb') as f:
+                f.seek(max(0, os.path.getsize(source_file) - TAIL_BYTES))
+                tail = f.read()
+        if is_incomplete(tail):
+            return None
+
+        key = cache_key(query, endpoint)
+        path = self._body_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with gzip.open(temp_path, 'wb', compresslevel=6) as target:
+            if body is not None:
+                target.write(body)
+            else:
+                with open(source_file, 'rb') as source:
+                    shutil.copyfileobj(source, target, CHUNK_SIZE)
+        os.replace(temp_path, path)
+
+        headers = headers or {}
+        now = time.time()
+        meta = {
+            'endpoint': endpoint,
+            'region': region,
+            'stored': now,
+            'last_used': now,
+            'ttl': self.ttl_for(region),
+            'size': os.path.getsize(path),
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+        }
+        with self._lock:
+            self.index[key] = meta
+            self._evict(keep=key)
+            self._save_index()
+        return CacheEntry(key, path, dict(meta))
+
+    def _evict(self, keep=None):
+        """Delete least recently used bodies until the cache fits its budget"""
+        total = sum(meta['size'] for meta in self.index.values())
+        for key in sorted(self.index, key=lambda key: self.index[key]['last_used']):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            total -= self.index.pop(key)['size']
+            try:
+                os.remove(self._body_path(key))
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            now = time.time()
+            return {
+                'entries': len(self.index),
+                'bytes': sum(meta['size'] for meta in self.index.values()),
+                'fresh': sum(1 for meta in self.index.values() if now - meta['stored'] < meta['ttl']),
+                'max_bytes': self.max_bytes,
+            }
+
+    def clear(self):
+        with self._lock:
+            for key in list(self.index):
+                try:
+                    os.remove(self._body_path(key))
+                except OSError:
+                    pass
+            self.index = {}
+            self._save_index()
+
+
+def _serve(cache, entry, output_file):
+    if output_file:
+        cache.extract(entry, output_file)
+        return None
+    return cache.read(entry)
+
+
+def query_overpass(client, query, region=None, cache=None, output_file=None, **post_kwargs):
+    """
+    Run a query through the response cache
+
+    A fresh entry is served from disk. A stale one is revalidated with a
+    conditional request when it has validators (a 304 answer serves it
+    again), otherwise the query is sent as usual and the answer stored.
+
+    Args:
+        client: OverpassClient
+        query: Overpass QL query
+        region: Region name, for its TTL
+        cache: ResponseCache, or None to always ask the interpreter
+        output_file: Write the body (from the network or the cache) to this
+            file in chunks instead of returning it, for large responses
+        **post_kwargs: Passed on to client.post
+
+    Returns:
+        (body, source): body is the response bytes (None with output_file),
+        source is 'cache', 'revalidated' or 'network'
+    """
+    endpoint = client.endpoint
+    entry = cache.get(query, endpoint) if cache else None
+    if entry and cache.is_fresh(entry):
+        return _serve(cache, entry, output_file), 'cache'
+
+    headers = cache.validators(entry) if entry else None
+    response = client.post(query, headers=headers, stream=bool(output_file), **post_kwargs)
+    if entry and response.status_code == 304:
+        response.close()
+        cache.revalidated(entry)
+        return _serve(cache, entry, output_file), 'revalidated'
+
+    # Stored under the endpoint that answered, which after a failover is the
+    # one the client prefers from now on. Not response.url: after a redirect
+    # the lookup above would otherwise never find the entry
+    endpoint = response.endpoint
+    if output_file:
+        with open(output_file, 'wb') as f:
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                f.write(chunk)
+        response.close()
+        if cache:
+            cache.store(query, endpoint, region, source_file=output_file, headers=response.headers)
+        return None, 'network'
+
+    body = response.content
+    if cache:
+        cache.store(query, endpoint, region, body=body, headers=response.headers)
+    return body, 'network'
+
+
+_default_cache = None
+
+
+def get_default_cache():
+    """
+    The cache configured by the OVERPASS_CACHE environment variable, or None
+
+    OVERPASS_CACHE=1 uses .overpass_cache, any other value is taken as the
+    cache folder; OVERPASS_CACHE_MAX_MB sets the disk budget.
+    """
+    global _default_cache
+    setting = os.environ.get(CACHE_ENV, '').strip()
+    if not setting or setting == '0':
+        return None
+    if _default_cache is None:
+        directory = DEFAULT_CACHE_DIR if setting == '1' else setting
+        max_mb = os.environ.get(CACHE_MAX_MB_ENV)
+        max_bytes = int(float(max_mb) * 1024 * 1024) if max_mb else DEFAULT_MAX_BYTES
+        _default_cache = ResponseCache(directory, max_bytes)
+    return _default_cache
+
+
+def main():
+    """Show or clear a response cache"""
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    cache = ResponseCache(args[0] if args else DEFAULT_CACHE_DIR)
+    if '--clear' in sys.argv:
+        cache.clear()
+        print(f"🧹 Cleared {cache.directory}")
+        return
+    stats = cache.stats()
+    print(f"🗄️  {cache.directory}: {stats['entries']} responses ({stats['fresh']} fresh), "
+          f"{stats['bytes'] / 1024 / 1024:.1f} of {stats['max_bytes'] / 1024 / 1024:.0f} MB")
+    for key, meta in sorted(cache.index.items(), key=lambda item: -item[1]['last_used']):
+        age = time.time() - meta['stored']
+        print(f"   {key[:12]} {meta.get('region') or '?':<12} {meta['size'] / 1024:>8.1f} KB  "
+              f"age {age / 60:.0f} min, ttl {meta['ttl'] / 60:.0f} min")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+import os
+import random
+import re
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_ENDPOINTS = [
+    "https://overpass-api.de/api/interpreter",
+    "https://overpass.kumi.systems/api/interpreter",
+    "https://overpass.private.coffee/api/interpreter",
+]
+
+# Statuses Overpass uses for "busy, try again later"
+RETRY_STATUSES = {429, 502, 503, 504}
+
+
+class OverpassError(Exception):
+    """Raised when no endpoint could answer a query"""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class OverpassTimeout(OverpassError):
+    """Raised when a query timed out and the caller asked not to retry timeouts"""
+
+
+def status_url(endpoint):
+    """Turn an interpreter URL into the matching /api/status URL"""
+    return re.sub(r'/interpreter/?$', '/status', endpoint)
+
+
+def parse_status(text):
+    """
+    Parse the plain-text answer of Overpass' /api/status
+
+    Returns a dict with the rate limit, the number of free query slots and
+    the number of seconds until the next slot frees up (0 if one is free).
+    """
+    rate_limit = None
+    match = re.search(r'Rate limit:\s*(\d+)', text)
+    if match:
+        rate_limit = int(match.group(1))
+
+    slots_available = 0
+    match = re.search(r'(\d+) slots? available now', text)
+    if match:
+        slots_available = int(match.group(1))
+
+    waits = [int(seconds) for seconds in re.findall(r'Slot available after:.*?in (-?\d+) seconds', text)]
+    next_slot_in = 0 if slots_available else (max(0, min(waits)) if waits else 0)
+
+    return {
+        'rate_limit': rate_limit,
+        'slots_available': slots_available,
+        'next_slot_in': next_slot_in,
+    }
+
+
+class OverpassClient:
+    """
+    Reusable Overpass client with connection pooling, retries and failover
+
+    Queries go to the preferred endpoint through one persistent
+    requests.Session. When an endpoint answers 429/502/503/504 or the
+    connection fails, the client moves on to the next endpoint and waits
+    before retrying: for 429 it asks /api/status how long until a query slot
+    frees up, otherwise it uses exponential backoff with full jitter (or the
+    server's Retry-After header when present).
+
+    Args:
+        endpoints: Interpreter URLs to fail over across (default: the
+            OVERPASS_ENDPOINTS environment variable, comma separated, or
+            DEFAULT_ENDPOINTS)
+        max_retries: Retries after the first attempt before giving up
+        backoff: Base delay in seconds for exponential backoff
+        max_backoff: Upper bound for a single wait in seconds
+        pool_size: Connections kept open per endpoint host
+        timeout: Default client-side timeout per request in seconds
+    """
+
+    def __init__(self, endpoints=None, max_retries=4, backoff=1.0, max_backoff=60.0,
+                 pool_size=8, timeout=30):
+        if endpoints is None:
+            configured = os.environ.get('OVERPASS_ENDPOINTS', '')
+            endpoints = [url.strip() for url in configured.split(',') if url.strip()] or DEFAULT_ENDPOINTS
+        self.endpoints = list(endpoints)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(self.endpoints), pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._preferred = 0
+        self._lock = threading.Lock()
+
+    def _failover(self, index):
+        """Move the preferred endpoint past a failing one"""
+        with self._lock:
+            if self._preferred == index:
+                self._preferred = (index + 1) % len(self.endpoints)
+
+    def _wait_before_retry(self, index, tried, attempt, delay):
+        """
+        Fail over to the next endpoint, sleeping only once every endpoint
+        has been tried for this query
+        """
+        self._failover(index)
+        if attempt < self.max_retries and self.endpoints[self._preferred] in tried:
+            time.sleep(delay)
+
+    def _backoff_delay(self, attempt):
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    @property
+    def endpoint(self):
+        """The interpreter URL the next query goes to"""
+        return self.endpoints[self._preferred]
+
+    def status(self, endpoint=None):
+        """Fetch and parse the rate-limit status of an endpoint"""
+        endpoint = endpoint or self.endpoints[self._preferred]
+        response = self.session.get(status_url(endpoint), timeout=self.timeout)
+        response.raise_for_status()
+        return parse_status(response.text)
+
+    def _retry_delay(self, response, endpoint, attempt):
+        """Work out how long to wait before retrying after a busy answer"""
+        retry_after = response.headers.get('Retry-After')
+        if retry_after and retry_after.isdigit():
+            return min(self.max_backoff, int(retry_after))
+
+        if response.status_code == 429:
+            try:
+                next_slot_in = self.status(endpoint)['next_slot_in']
+                if next_slot_in:
+                    return min(self.max_backoff, next_slot_in + random.uniform(0, 1))
+            except requests.exceptions.RequestException:
+                pass
+
+        return self._backoff_delay(attempt)
+
+    def post(self, query, timeout=None, retry_on_timeout=True, stream=False, headers=None):
+        """
+        Run an Overpass query and return the successful requests.Response
+
+        After a failover the answer comes from another interpreter than the
+        one preferred when the query was sent; response.endpoint says which.
+
+        Args:
+            query: Overpass QL query
+            timeout: Client-side timeout for this request (default: self.timeout)
+            retry_on_timeout: When False, a client-side timeout or a 504 raises
+                OverpassTimeout right away instead of being retried
+            stream: Passed on to requests, to read the body incrementally
+            headers: Extra request headers, e.g. validators for a conditional
+                request (a 304 answer is returned like any other)
+
+        Raises:
+            OverpassError: when every attempt failed or the query was rejected
+        """
+        timeout = timeout or self.timeout
+        request_headers = {'Content-Type': 'application/x-www-form-urlencoded', **(headers or {})}
+        last_error = None
+        tried = set()
+
+        for attempt in range(self.max_retries + 1):
+            index = self._preferred
+            endpoint = self.endpoints[index]
+            tried.add(endpoint)
+            try:
+                response = self.session.post(
+                    endpoint,
+                    data={'data': query},
+                    headers=request_headers,
+                    timeout=timeout,
+                    stream=stream
+                )
+            except requests.exceptions.Timeout as e:
+                if not retry_on_timeout:
+                    raise OverpassTimeout(f"{endpoint} timed out: {e}")
+                last_error = OverpassError(f"{endpoint} timed out: {e}")
+                self._wait_before_retry(index, tried, attempt, self._backoff_delay(attempt))
+                continue
+            except requests.exceptions.ConnectionError as e:
+                last_error = OverpassError(f"Could not connect to {endpoint}: {e}")
+                self._wait_before_retry(index, tried, attempt, self._backoff_delay(attempt))
+                continue
+
+            if response.status_code in RETRY_STATUSES:
+                if response.status_code == 504 and not retry_on_timeout:
+                    response.close()
+                    raise OverpassTimeout(f"{endpoint} answered 504", status_code=504)
+                last_error = OverpassError(
+                    f"{endpoint} answered {response.status_code}", status_code=response.status_code
+                )
+                delay = self._retry_delay(response, endpoint, attempt)
+                response.close()
+                self._wait_before_retry(index, tried, attempt, delay)
+                continue
+
+            if response.status_code >= 400:
+                message = f"{endpoint} answered {response.status_code}: {response.text[:200]}"
+                response.close()
+                raise OverpassError(message, status_code=response.status_code)
+
+            response.endpoint = endpoint
+            return response
+
+        raise last_error or OverpassError("No Overpass endpoint configured")
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+_default_client = None
+
+
+def get_default_client():
+    """Return the shared client used when a caller does not pass its own"""
+    global _default_client
+    if _default_client is None:
+        _default_client = OverpassClient()
+    return _default_client
@@ -0,0 +1,120 @@
+import json
+
+CHUNK_SIZE = 64 * 1024
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+
+
+class _Reader:
+    """Buffered character reader over a text file, refilled in chunks"""
+
+    def __init__(self, f, chunk_size):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.pos = 0
+
+    def fill(self):
+        """Read another chunk into the buffer, returning False at end of file"""
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Return the next non-whitespace character without consuming it"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise json.JSONDecodeError(f"Expecting '{char}'", self.buffer, self.pos)
+        self.pos += 1
+
+    def value(self):
+        """Decode the next complete JSON value, reading more input as needed"""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+            # A number at the very end of the buffer may continue in the next chunk
+            if end == len(self.buffer) and self.fill():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_overpass(file_path, chunk_size=CHUNK_SIZE):
+    """
+    Incrementally parse an Overpass JSON document
+
+    Yields ('header', key, value) for every top-level key other than
+    'elements' and ('element', element) for each entry of the elements
+    array, in file order. Only one element is held in memory at a time, so
+    the memory used does not depend on the size of the file.
+    """
+    with open(file_path, 'r', encoding='utf-8') as f:
+        reader = _Reader(f, chunk_size)
+        reader.expect('{')
+        if reader.peek() == '}':
+            return
+        while True:
+            key = reader.value()
+            reader.expect(':')
+            if key == 'elements':
+                reader.expect('[')
+                if reader.peek() == ']':
+                    reader.pos += 1
+                else:
+                    while True:
+                        yield 'element', reader.value()
+                        if reader.peek() == ',':
+                            reader.pos += 1
+                            continue
+                        reader.expect(']')
+                        break
+            else:
+                yield 'header', key, reader.value()
+
+            if reader.peek() == ',':
+                reader.pos += 1
+                continue
+            reader.expect('}')
+            return
+
+
+def iter_elements(file_path, chunk_size=CHUNK_SIZE):
+    """Yield the elements of an Overpass JSON file one at a time"""
+    for item in iter_overpass(file_path, chunk_size):
+        if item[0] == 'element':
+            yield item[1]
+
+
+def summarize(file_path, chunk_size=CHUNK_SIZE):
+    """
+    Count elements per type in an Overpass JSON file without loading it
+
+    Returns a dict with the document's header fields (version, generator,
+    osm3s, remark, ...) and 'counts', a dict of element type to count.
+    """
+    summary = {'counts': {}}
+    counts = summary['counts']
+    for item in iter_overpass(file_path, chunk_size):
+        if item[0] == 'element':
+            element_type = item[1].get('type')
+            counts[element_type] = counts.get(element_type, 0) + 1
+        else:
+            summary[item[1]] = item[2]
+    return summary
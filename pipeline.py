@@ -0,0 +1,453 @@
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from snapshot_catalog import file_sha256, list_snapshots
+
+CACHE_DIR = '.pipeline_cache'
+HASHES_FILE = 'hashes.json'
+MANIFEST_FILE = 'manifest.json'
+
+# Bump to invalidate every cached stage, e.g. after changing the cache layout
+PIPELINE_VERSION = 1
+
+# A fetched snapshot younger than this is reused instead of fetching again
+DEFAULT_MAX_AGE_HOURS = 20
+
+Stage = namedtuple('Stage', 'name func deps params outputs modules')
+Stage.__doc__ = """
+One pipeline step
+
+name: Stage name, also its cache folder
+func: Top-level function (so it can run in a worker process) called as
+    func(inputs, outputs, **params); inputs are the dependencies' first
+    outputs (or the snapshot for stages without dependencies) and outputs
+    are the paths it must write
+deps: Names of the stages whose first outputs it reads
+params: Keyword arguments, part of the cache key
+outputs: Destination paths the results are copied to
+modules: Source files whose contents are part of the cache key, so a
+    code change reruns the stage
+"""
+
+
+# ---------------------------------------------------------------------------
+# Stage functions. Imports are local so that a fully cached run does not
+# pay for importing numpy and friends.
+# ---------------------------------------------------------------------------
+
+def normalize_stage(inputs, outputs):
+    from snapshot_format import is_snapshot, json_to_snapshot
+    if is_snapshot(inputs[0]):
+        shutil.copyfile(inputs[0], outputs[0])
+    else:
+        json_to_snapshot(inputs[0], outputs[0])
+
+
+def dedup_stage(inputs, outputs, distance_m):
+    from dedup_toilets import dedup_snapshot
+    if dedup_snapshot(inputs[0], outputs[0], outputs[1], distance_m) is None:
+        raise RuntimeError("dedup_snapshot failed")
+
+
+def tag_stats_stage(inputs, outputs, top_k):
+    from tags_analysis import compute_tag_stats
+    with open(outputs[0], 'w', encoding='utf-8') as f:
+        json.dump(compute_tag_stats(inputs[0], top_k).to_dict(), f, indent=2, ensure_ascii=False)
+
+
+def areas_stage(inputs, outputs):
+    from way_area_size import compute_area_stats
+    with open(outputs[0], 'w', encoding='utf-8') as f:
+        json.dump(compute_area_stats(inputs[0]).to_dict(top=20), f, indent=2, ensure_ascii=False)
+
+
+def toilets_stage(inputs, outputs, layout, precision):
+    from build_toilets import build_toilets
+    if not build_toilets(inputs[0], outputs[0], layout, precision):
+        raise RuntimeError("build_toilets failed")
+
+
+def clusters_stage(inputs, outputs, radius, max_zoom):
+    from cluster_tiles import build_cluster_tiles
+    if not build_cluster_tiles(inputs[0], outputs[0], radius, max_zoom):
+        raise RuntimeError("build_cluster_tiles failed")
+
+
+def map_stage(inputs, outputs, chunked):
+    from generate_map import generate_toilet_map
+    if not generate_toilet_map(inputs[0], outputs[0], chunked=chunked):
+        raise RuntimeError("generate_toilet_map failed")
+
+
+def default_stages(snapshot_file, out_dir='build', toilets_dir=None, chunked=False, clusters=False):
+    """
+    The standard normalize -> dedup -> analyze -> build stages for one snapshot
+
+    Everything after dedup only depends on the deduplicated snapshot, so
+    tag stats, areas, the app payload and the HTML map run concurrently.
+    The cluster tiles have no consumer in the app yet and are only built
+    with clusters=True.
+    """
+    base = os.path.splitext(os.path.basename(snapshot_file))[0]
+    toilets_dir = toilets_dir or os.path.join('norway-toilet-map', 'public', 'data')
+    map_outputs = [os.path.join(out_dir, f"{base}_map.html")]
+    if chunked:
+        map_outputs.append(os.path.join(out_dir, f"{base}_map_data"))
+    stages = [
+        Stage('normalize', normalize_stage, (), {}, [os.path.join(out_dir, f"{base}.tsnap")],
+              ('snapshot_format.py', 'overpass_stream.py')),
+        Stage('dedup', dedup_stage, ('normalize',), {'distance_m': 10.0},
+              [os.path.join(out_dir, f"{base}_dedup.tsnap"), os.path.join(out_dir, f"{base}_conflation.json")],
+              ('dedup_toilets.py', 'geo.py', 'snapshot_format.py')),
+        Stage('tag_stats', tag_stats_stage, ('dedup',), {'top_k': 64},
+              [os.path.join(out_dir, f"{base}_tag_stats.json")], ('tags_analysis.py',)),
+        Stage('areas', areas_stage, ('dedup',), {},
+              [os.path.join(out_dir, f"{base}_areas.json")], ('way_area_size.py', 'geo.py')),
+        Stage('toilets', toilets_stage, ('dedup',), {'layout': 'delta', 'precision': 5},
+              [toilets_dir], ('build_toilets.py', 'build_payload.py', 'geo.py', 'static_assets.py',
+                              'display_rules.py', 'display_rules.json', 'toilet_filters.py',
+                              'snapshot_format.py')),
+        Stage('map', map_stage, ('dedup',), {'chunked': chunked}, map_outputs,
+              ('generate_map.py', 'build_payload.py', 'geo.py', 'display_rules.py', 'display_rules.json',
+               'toilet_filters.py', 'snapshot_format.py')),
+    ]
+    if clusters:
+        stages.append(Stage('clusters', clusters_stage, ('dedup',), {'radius': 80, 'max_zoom': 16},
+                            [os.path.join(out_dir, f"{base}_clusters")],
+                            ('cluster_tiles.py', 'build_toilets.py', 'build_payload.py', 'geo.py')))
+    return stages
+
+
+# ---------------------------------------------------------------------------
+# Hashing
+# ---------------------------------------------------------------------------
+
+class HashCache:
+    """
+    Content hashes of files, reused while their size and mtime are unchanged
+
+    Rehashing a large snapshot on every run would dominate a run where
+    nothing changed, so hashes are stored by path with the stat they were
+    computed for. Only the paths hashed during a run are saved, so files
+    that are deleted or no longer part of the pipeline drop out.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.changed = False
+        self.used = set()
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def file_hash(self, path):
+        if os.path.isdir(path):
+            return self.tree_hash(path)
+        stat = os.stat(path)
+        key = os.path.abspath(path)
+        self.used.add(key)
+        entry = self.entries.get(key)
+        if entry and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+            return entry[2]
+        digest = file_sha256(path)
+        self.entries[key] = [stat.st_size, stat.st_mtime_ns, digest]
+        self.changed = True
+        return digest
+
+    def tree_hash(self, path):
+        digest = hashlib.sha256()
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                file_path = os.path.join(root, name)
+                digest.update(os.path.relpath(file_path, path).encode('utf-8'))
+                digest.update(self.file_hash(file_path).encode('ascii'))
+        return digest.hexdigest()
+
+    def save(self):
+        if len(self.used) < len(self.entries):
+            self.entries = {key: entry for key, entry in self.entries.items() if key in self.used}
+            self.changed = True
+        if self.changed:
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f)
+            self.changed = False
+
+
+def stage_key(stage, input_hashes, hashes):
+    """Cache key of a stage: its code, parameters and input contents"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    description = {
+        'version': PIPELINE_VERSION,
+        'stage': stage.name,
+        'func': stage.func.__name__,
+        'params': stage.params,
+        'code': {module: hashes.file_hash(os.path.join(here, module)) for module in stage.modules},
+        'inputs': input_hashes,
+        'outputs': [os.path.basename(output) for output in stage.outputs],
+    }
+    encoded = json.dumps(description, sort_keys=True).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()[:32]
+
+
+# ---------------------------------------------------------------------------
+# Running
+# ---------------------------------------------------------------------------
+
+def _run_stage(func, inputs, outputs, params, log_path):
+    """Worker entry point: run a stage with its output captured in a log"""
+    start = time.perf_counter()
+    with open(log_path, 'w', encoding='utf-8') as log, \
+            contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        func(inputs, outputs, **params)
+    return time.perf_counter() - start
+
+
+def _is_asset_dir(path):
+    """Whether a stage output is a folder of static_assets.publish() files"""
+    from static_assets import MANIFEST_FILE as ASSETS_MANIFEST
+    return os.path.isfile(os.path.join(path, ASSETS_MANIFEST))
+
+
+def _copy(source, destination):
+    parent = os.path.dirname(destination)
+    if parent:
+        os.makedirs(parent, exist_ok=True)
+    if _is_asset_dir(source):
+        # Keep the previous generations for clients holding the old manifest
+        from static_assets import copy_published
+        copy_published(source, destination)
+    elif os.path.isdir(source):
+        if os.path.exists(destination):
+            shutil.rmtree(destination)
+        shutil.copytree(source, destination)
+    else:
+        shutil.copy2(source, destination)
+
+
+class Pipeline:
+    """
+    Runs stages in dependency order with content-hash caching
+
+    A stage's results live in CACHE_DIR/<stage>/<key>/, where the key
+    hashes its code, parameters and the content of its inputs. When the
+    key is already there the stage is skipped and its cached outputs are
+    copied to their destinations (only if those differ). Folders of
+    published assets are merged into their destination instead, leaving
+    static_assets to prune old generations. Stages whose dependencies are
+    done run concurrently in a process pool.
+    """
+
+    def __init__(self, stages, cache_dir=CACHE_DIR, max_workers=None, force=False):
+        self.stages = {stage.name: stage for stage in stages}
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self.force = force
+        os.makedirs(cache_dir, exist_ok=True)
+        self.hashes = HashCache(os.path.join(cache_dir, HASHES_FILE))
+        self.output_hashes = {}
+        self.results = {}
+
+    def _stage_dir(self, stage, key):
+        return os.path.join(self.cache_dir, stage.name, key)
+
+    def _cached_outputs(self, stage, key):
+        return [os.path.join(self._stage_dir(stage, key), os.path.basename(output))
+                for output in stage.outputs]
+
+    def _prepare(self, stage, snapshot_file):
+        """Return (key, inputs) for a stage whose dependencies are done"""
+        if stage.deps:
+            inputs = [self._cached_outputs(self.stages[dep], self.results[dep]['key'])[0]
+                      for dep in stage.deps]
+            input_hashes = [self.output_hashes[dep] for dep in stage.deps]
+        else:
+            inputs = [snapshot_file]
+            input_hashes = [self.hashes.file_hash(snapshot_file)]
+        return stage_key(stage, input_hashes, self.hashes), inputs
+
+    def _finish(self, stage, key, seconds, cached):
+        """Record a finished stage and copy its outputs into place"""
+        stage_dir = self._stage_dir(stage, key)
+        manifest_path = os.path.join(stage_dir, MANIFEST_FILE)
+        if cached:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        else:
+            manifest = {
+                'stage': stage.name,
+                'key': key,
+                'seconds': round(seconds, 3),
+                'outputs': {os.path.basename(path): self.hashes.file_hash(path)
+                            for path in self._cached_outputs(stage, key)},
+            }
+            with open(manifest_path, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, indent=2)
+
+        self.output_hashes[stage.name] = manifest['outputs'][os.path.basename(stage.outputs[0])]
+        for cached_path, destination in zip(self._cached_outputs(stage, key), stage.outputs):
+            if _is_asset_dir(cached_path):
+                from static_assets import is_published
+                if not is_published(cached_path, destination):
+                    _copy(cached_path, destination)
+                continue
+            expected = manifest['outputs'][os.path.basename(destination)]
+            if not os.path.exists(destination) or self.hashes.file_hash(destination) != expected:
+                _copy(cached_path, destination)
+                self.hashes.file_hash(destination)
+        self.results[stage.name] = {'key': key, 'cached': cached, 'seconds': seconds}
+
+    def run(self, snapshot_file):
+        """
+        Run every stage for a snapshot
+
+        Returns:
+            dict of stage name -> {'key', 'cached', 'seconds'}
+        """
+        pending = dict(self.stages)
+        running = {}
+        start = time.perf_counter()
+        executor = None
+        try:
+            while pending or running:
+                ready = [stage for stage in pending.values()
+                         if all(dep in self.results for dep in stage.deps)]
+                for stage in ready:
+                    del pending[stage.name]
+                    key, inputs = self._prepare(stage, snapshot_file)
+                    stage_dir = self._stage_dir(stage, key)
+                    if not self.force and os.path.exists(os.path.join(stage_dir, MANIFEST_FILE)):
+                        self._finish(stage, key, 0.0, cached=True)
+                        print(f"✅ {stage.name}: cached")
+                        continue
+                    if os.path.exists(stage_dir):
+                        shutil.rmtree(stage_dir)  # Leftovers of a failed or forced run
+                    os.makedirs(stage_dir)
+                    if executor is None:
+                        executor = ProcessPoolExecutor(max_workers=self.max_workers)
+                    print(f"🔨 {stage.name}: running")
+                    future = executor.submit(_run_stage, stage.func, inputs,
+                                             self._cached_outputs(stage, key), stage.params,
+                                             os.path.join(stage_dir, 'log.txt'))
+                    running[future] = (stage, key)
+
+                if ready and not running:
+                    continue  # Cached stages may have unblocked others
+                if not running:
+                    if pending:
+                        raise ValueError(f"Unsatisfiable dependencies: {', '.join(pending)}")
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage, key = running.pop(future)
+                    try:
+                        seconds = future.result()
+                    except Exception as e:
+                        log = os.path.join(self._stage_dir(stage, key), 'log.txt')
+                        raise RuntimeError(f"Stage '{stage.name}' failed: {e} (see {log})") from e
+                    self._finish(stage, key, seconds, cached=False)
+                    print(f"✅ {stage.name}: done in {seconds:.2f}s")
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+            self.hashes.save()
+
+        self.elapsed = time.perf_counter() - start
+        return self.results
+
+
+# ---------------------------------------------------------------------------
+# Fetching
+# ---------------------------------------------------------------------------
+
+def newest_snapshot(directory='.', region=None):
+    """Newest catalogued snapshot in a directory, optionally of one region"""
+    snapshots = [entry for entry in list_snapshots(directory)
+                 if entry['file'].endswith('.json') and (region is None or entry.get('region') == region)]
+    if not snapshots:
+        return None
+    newest = max(snapshots, key=lambda entry: entry['mtime_ns'])
+    return os.path.join(directory, newest['file'])
+
+
+def fetch_if_stale(region, max_age_hours=DEFAULT_MAX_AGE_HOURS, directory='.'):
+    """
+    Return a snapshot of region no older than max_age_hours, fetching one if needed
+
+    Countries in fetch_toilets.REGIONS are fetched in tiles, cities with a
+    single query.
+    """
+    current = newest_snapshot(directory, region)
+    if current and time.time() - os.path.getmtime(current) < max_age_hours * 3600:
+        print(f"📁 Using {current} (younger than {max_age_hours}h)")
+        return current
+
+    from fetch_toilets import REGIONS, fetch_toilet_data, fetch_toilet_data_tiled
+    if region not in REGIONS:
+        raise ValueError(f"Unknown region '{region}', expected one of: {', '.join(REGIONS)}")
+    output_file = os.path.join(directory, f"toilets_{region}_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    bbox, area_query = REGIONS[region]
+    if area_query:
+        snapshot, data = fetch_toilet_data_tiled(bbox=bbox, area_query=area_query, output_file=output_file)
+    else:
+        snapshot, data = fetch_toilet_data(bbox=bbox, output_file=output_file)
+    if not data:
+        raise RuntimeError(f"Fetching {region} failed")
+    return snapshot
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the fetch -> normalize -> dedup -> analyze -> build pipeline")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--snapshot', help="Snapshot to build from (default: newest in the current directory)")
+    source.add_argument('--fetch', metavar='REGION',
+                        help="Fetch a fresh snapshot of REGION (see batch_fetch.py --list) first, "
+                             "unless a recent one exists")
+    parser.add_argument('--max-age', type=float, default=DEFAULT_MAX_AGE_HOURS,
+                        help="Hours a fetched snapshot stays fresh (with --fetch)")
+    parser.add_argument('--out', default='build', help="Directory for analysis and map outputs")
+    parser.add_argument('--toilets-dir', help="Where to publish the app's toilets.json and manifest")
+    parser.add_argument('--chunked', action='store_true', help="Write the map's data as tiles")
+    parser.add_argument('--clusters', action='store_true', help="Also precompute the cluster tiles")
+    parser.add_argument('--workers', type=int, help="Worker processes for concurrent stages")
+    parser.add_argument('--force', action='store_true', help="Rerun every stage, ignoring the cache")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    print("🚽 Toilet data pipeline")
+    print("=" * 30)
+    try:
+        if args.fetch:
+            snapshot_file = fetch_if_stale(args.fetch, args.max_age)
+        else:
+            snapshot_file = args.snapshot or newest_snapshot('.')
+        if not snapshot_file or not os.path.exists(snapshot_file):
+            print("❌ No snapshot found; pass --snapshot or --fetch")
+            sys.exit(1)
+        print(f"📁 Snapshot: {snapshot_file}")
+
+        stages = default_stages(snapshot_file, args.out, args.toilets_dir, args.chunked, args.clusters)
+        pipeline = Pipeline(stages, max_workers=args.workers, force=args.force)
+        results = pipeline.run(snapshot_file)
+    except (RuntimeError, ValueError) as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+    ran = [name for name, result in results.items() if not result['cached']]
+    print(f"\n🎉 Pipeline finished in {time.perf_counter() - start:.2f}s "
+          f"({len(ran)} of {len(results)} stages ran)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+import hashlib
+import json
+import os
+import re
+import sys
+
+from overpass_stream import summarize
+from snapshot_format import ELEMENT_TYPES, SNAPSHOT_EXTENSION, ColumnarSnapshot, is_snapshot
+
+CATALOG_FILE = 'snapshot_catalog.json'
+CATALOG_VERSION = 1
+
+# Bytes read from the start of an uncatalogued JSON file to decide whether
+# it is a toilet snapshot. Overpass writes its header and the first
+# elements well within this
+SNIFF_BYTES = 16 * 1024
+
+SNAPSHOT_NAME = re.compile(r'^toilets_(?P<region>.+?)_\d{8}_\d{6}(?:\.json|\.tsnap)$')
+ELEMENTS_START = re.compile(r'"elements"\s*:\s*\[')
+TOILETS_TAG = re.compile(r'"amenity"\s*:\s*"toilets"')
+TIMESTAMP = re.compile(r'"timestamp_osm_base"\s*:\s*"([^"]+)"')
+
+
+def region_from_name(file_path):
+    """Region part of a toilets_<region>_<date>_<time> snapshot filename, or None"""
+    match = SNAPSHOT_NAME.match(os.path.basename(file_path))
+    return match.group('region') if match else None
+
+
+def file_sha256(file_path, chunk_size=1024 * 1024):
+    """Content hash of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def sniff_snapshot(file_path, max_bytes=SNIFF_BYTES):
+    """
+    Check whether a JSON file looks like a toilet snapshot from its first bytes
+
+    Only max_bytes are read however large the file is, so this is cheap
+    enough to run on every file in a directory.
+
+    Returns:
+        Dict with 'timestamp' (or None) if it looks like toilet data, else None
+    """
+    try:
+        with open(file_path, 'rb') as f:
+            head = f.read(max_bytes).decode('utf-8', errors='ignore')
+    except OSError:
+        return None
+    elements = ELEMENTS_START.search(head)
+    if not elements or not TOILETS_TAG.search(head, elements.end()):
+        return None
+    timestamp = TIMESTAMP.search(head, 0, elements.start())
+    return {'timestamp': timestamp.group(1) if timestamp else None}
+
+
+def sniff_columnar(file_path):
+    """Like sniff_snapshot for .tsnap files, reading only the magic and header"""
+    if not is_snapshot(file_path):
+        return None
+    with ColumnarSnapshot(file_path) as snapshot:
+        return {'timestamp': snapshot.meta.get('osm3s', {}).get('timestamp_osm_base')}
+
+
+def catalog_entry(file_path, data=None, region=None):
+    """
+    Describe a snapshot for the catalog
+
+    Counts come from data when the caller already has the document in
+    memory, otherwise from a streaming pass over the file (or the columns
+    of a .tsnap), so the whole document is never loaded here.
+
+    Args:
+        file_path: Snapshot file
+        data: The parsed Overpass document, if available
+        region: Region name (default: from the filename)
+    """
+    stat = os.stat(file_path)
+    if data is not None:
+        counts = {}
+        for element in data.get('elements', []):
+            counts[element.get('type')] = counts.get(element.get('type'), 0) + 1
+        osm3s, remark = data.get('osm3s', {}), data.get('remark')
+    elif file_path.endswith(SNAPSHOT_EXTENSION):
+        with ColumnarSnapshot(file_path) as snapshot:
+            counts = {}
+            for code in snapshot.type:
+                counts[ELEMENT_TYPES[code]] = counts.get(ELEMENT_TYPES[code], 0) + 1
+            osm3s, remark = snapshot.meta.get('osm3s', {}), snapshot.meta.get('remark')
+    else:
+        summary = summarize(file_path)
+        counts, osm3s, remark = summary['counts'], summary.get('osm3s', {}), summary.get('remark')
+
+    return {
+        'file': os.path.basename(file_path),
+        'snapshot': True,
+        'region': region or region_from_name(file_path),
+        'timestamp': osm3s.get('timestamp_osm_base'),
+        'elements': sum(counts.values()),
+        'counts': counts,
+        'complete': not (remark and 'runtime error' in remark),
+        'sha256': file_sha256(file_path),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+    }
+
+
+def catalog_path(directory):
+    return os.path.join(directory or '.', CATALOG_FILE)
+
+
+def load_catalog(directory='.'):
+    """Read a directory's catalog; a missing or unreadable one is empty"""
+    try:
+        with open(catalog_path(directory), 'r', encoding='utf-8') as f:
+            catalog = json.load(f)
+    except (OSError, ValueError):
+        return {'version': CATALOG_VERSION, 'files': {}}
+    if catalog.get('version') != CATALOG_VERSION:
+        return {'version': CATALOG_VERSION, 'files': {}}
+    return catalog
+
+
+def save_catalog(catalog, directory='.'):
+    """Write the catalog atomically, so readers never see half a file"""
+    path = catalog_path(directory)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(catalog, f, indent=2, ensure_ascii=False)
+    os.replace(temp_path, path)
+
+
+def record_snapshot(file_path, data=None, region=None):
+    """
+    Add or update a snapshot in the catalog of the directory it is in
+
+    Called by the fetcher after every snapshot it writes. Failures are
+    reported but never fail the fetch, since the catalog is only a cache.
+    """
+    try:
+        directory = os.path.dirname(file_path)
+        catalog = load_catalog(directory)
+        entry = catalog_entry(file_path, data, region)
+        catalog['files'][entry['file']] = entry
+        save_catalog(catalog, directory)
+        return entry
+    except Exception as e:
+        print(f"⚠️  Could not update {CATALOG_FILE}: {e}")
+        return None
+
+
+def _is_current(entry, stat):
+    return entry and entry.get('size') == stat.st_size and entry.get('mtime_ns') == stat.st_mtime_ns
+
+
+def list_snapshots(directory='.'):
+    """
+    List the toilet snapshots in a directory without loading any of them
+
+    Files whose size and mtime match their catalog entry are taken from
+    the catalog. Anything else gets a bounded header sniff (or the magic
+    check for .tsnap files), and the verdict, including "not a snapshot"
+    for files like *_tags_analysis.json, is cached in the catalog so the
+    next listing skips it.
+
+    Returns:
+        Catalog entries of the snapshots, sorted by filename
+    """
+    catalog = load_catalog(directory)
+    files = catalog['files']
+    changed = False
+    snapshots = []
+
+    names = sorted(os.listdir(directory or '.'))
+    for name in names:
+        if name == CATALOG_FILE or not name.endswith(('.json', SNAPSHOT_EXTENSION)):
+            continue
+        path = os.path.join(directory or '.', name)
+        stat = os.stat(path)
+        entry = files.get(name)
+        if not _is_current(entry, stat):
+            if name.endswith(SNAPSHOT_EXTENSION):
+                sniffed = sniff_columnar(path)
+            else:
+                sniffed = sniff_snapshot(path)
+            entry = {'file': name, 'snapshot': sniffed is not None,
+                     'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+            if sniffed is not None:
+                entry.update(region=region_from_name(name), **sniffed)
+            files[name] = entry
+            changed = True
+        if entry['snapshot']:
+            snapshots.append(entry)
+
+    # Forget files that are gone
+    for name in [name for name in files if name not in names]:
+        del files[name]
+        changed = True
+
+    if changed:
+        try:
+            save_catalog(catalog, directory)
+        except OSError:
+            pass  # A read-only directory can still be listed
+    return snapshots
+
+
+def describe_snapshot(entry):
+    """One-line description of a catalog entry for file pickers"""
+    details = [entry.get('region') or 'unknown region']
+    if entry.get('timestamp'):
+        details.append(entry['timestamp'])
+    if 'elements' in entry:
+        details.append(f"{entry['elements']} elements")
+    if entry.get('complete') is False:
+        details.append('incomplete')
+    return f"{entry['file']} ({', '.join(details)})"
+
+
+def rebuild_catalog(directory='.'):
+    """Fully describe every snapshot in a directory, hashing and counting each"""
+    catalog = {'version': CATALOG_VERSION, 'files': {}}
+    for entry in list_snapshots(directory):
+        path = os.path.join(directory, entry['file'])
+        catalog['files'][entry['file']] = catalog_entry(path)
+    save_catalog(catalog, directory)
+    # Record the non-snapshots again so they stay skipped
+    return list_snapshots(directory)
+
+
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    directory = args[0] if args else '.'
+    if '--rebuild' in sys.argv:
+        snapshots = rebuild_catalog(directory)
+    else:
+        snapshots = list_snapshots(directory)
+    print(f"📚 {len(snapshots)} snapshots in {os.path.abspath(directory)}")
+    for entry in snapshots:
+        print(f"   {describe_snapshot(entry)}")
@@ -0,0 +1,379 @@
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from overpass_stream import iter_overpass
+
+MAGIC = b'TSNAP1\n\x00'
+FORMAT_VERSION = 1
+SNAPSHOT_EXTENSION = '.tsnap'
+
+ELEMENT_TYPES = ['node', 'way', 'relation']
+TYPE_CODES = {name: code for code, name in enumerate(ELEMENT_TYPES)}
+
+# Per-element flags, so that absent keys round-trip as absent
+HAS_TAGS = 1
+HAS_BOUNDS = 2
+HAS_NODES = 4
+HAS_GEOMETRY = 8
+
+# Keys stored in dedicated columns; anything else goes to the 'extra' blob
+COLUMN_KEYS = {'type', 'id', 'lat', 'lon', 'tags', 'bounds', 'nodes', 'geometry'}
+
+# Column name -> array typecode, in file order
+COLUMNS = [
+    ('type', 'B'),
+    ('flags', 'B'),
+    ('id', 'q'),
+    ('lat', 'd'),
+    ('lon', 'd'),
+    ('minlat', 'd'),
+    ('minlon', 'd'),
+    ('maxlat', 'd'),
+    ('maxlon', 'd'),
+    ('tag_offsets', 'q'),
+    ('tag_keys', 'i'),
+    ('tag_values', 'i'),
+    ('value_offsets', 'q'),
+    ('value_blob', 'B'),
+    ('geom_offsets', 'q'),
+    ('geom_lat', 'd'),
+    ('geom_lon', 'd'),
+    ('geom_nodes', 'q'),
+    ('extra_offsets', 'q'),
+    ('extra_blob', 'B'),
+]
+
+NAN = float('nan')
+
+
+def is_snapshot(file_path):
+    """Check whether a file is a columnar snapshot by its magic bytes"""
+    try:
+        with open(file_path, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+class _SnapshotBuilder:
+    """Accumulates elements into column arrays"""
+
+    def __init__(self):
+        self.columns = {name: array(typecode) for name, typecode in COLUMNS}
+        self.keys = {}
+        self.values = {}
+        self.columns['tag_offsets'].append(0)
+        self.columns['value_offsets'].append(0)
+        self.columns['geom_offsets'].append(0)
+        self.columns['extra_offsets'].append(0)
+
+    def _value_code(self, value):
+        code = self.values.get(value)
+        if code is None:
+            code = self.values[value] = len(self.values)
+            self.columns['value_blob'].frombytes(value.encode('utf-8'))
+            self.columns['value_offsets'].append(len(self.columns['value_blob']))
+        return code
+
+    def add(self, element):
+        c = self.columns
+        flags = 0
+        c['type'].append(TYPE_CODES[element['type']])
+        c['id'].append(element['id'])
+        c['lat'].append(element.get('lat', NAN))
+        c['lon'].append(element.get('lon', NAN))
+
+        bounds = element.get('bounds')
+        if bounds is not None:
+            flags |= HAS_BOUNDS
+            bounds_values = (bounds.get(key, NAN) for key in ('minlat', 'minlon', 'maxlat', 'maxlon'))
+        else:
+            bounds_values = (NAN, NAN, NAN, NAN)
+        for key, value in zip(('minlat', 'minlon', 'maxlat', 'maxlon'), bounds_values):
+            c[key].append(value)
+
+        tags = element.get('tags')
+        if tags is not None:
+            flags |= HAS_TAGS
+            for key, value in tags.items():
+                key_code = self.keys.get(key)
+                if key_code is None:
+                    key_code = self.keys[key] = len(self.keys)
+                c['tag_keys'].append(key_code)
+                c['tag_values'].append(self._value_code(str(value)))
+        c['tag_offsets'].append(len(c['tag_keys']))
+
+        nodes = element.get('nodes')
+        geometry = element.get('geometry')
+        if nodes is not None:
+            flags |= HAS_NODES
+        if geometry is not None:
+            flags |= HAS_GEOMETRY
+        length = max(len(nodes or ()), len(geometry or ()))
+        for i in range(length):
+            point = geometry[i] if geometry and i < len(geometry) else None
+            c['geom_lat'].append(point['lat'] if point else NAN)
+            c['geom_lon'].append(point['lon'] if point else NAN)
+            c['geom_nodes'].append(nodes[i] if nodes and i < len(nodes) else -1)
+        c['geom_offsets'].append(len(c['geom_lat']))
+
+        extra = {key: value for key, value in element.items() if key not in COLUMN_KEYS}
+        if extra:
+            c['extra_blob'].frombytes(json.dumps(extra, ensure_ascii=False).encode('utf-8'))
+        c['extra_offsets'].append(len(c['extra_blob']))
+
+        c['flags'].append(flags)
+
+    def write(self, file_path, meta):
+        header = {
+            'format_version': FORMAT_VERSION,
+            'meta': meta,
+            'count': len(self.columns['id']),
+            'keys': list(self.keys),
+            'columns': {},
+        }
+        # Column offsets depend on the header length, so lay out the columns
+        # relative to the data section and fix them up once the header is known
+        layout = []
+        position = 0
+        for name, typecode in COLUMNS:
+            column = self.columns[name]
+            position = (position + 7) // 8 * 8
+            nbytes = len(column) * column.itemsize
+            layout.append((name, typecode, position, len(column)))
+            position += nbytes
+
+        data_start = None
+        next_start = 0
+        while next_start != data_start:
+            data_start = next_start
+            header['columns'] = {
+                name: {'typecode': typecode, 'offset': data_start + offset, 'length': length}
+                for name, typecode, offset, length in layout
+            }
+            header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+            next_start = (len(MAGIC) + 8 + len(header_bytes) + 7) // 8 * 8
+
+        with open(file_path, 'wb') as f:
+            f.write(MAGIC)
+            f.write(struct.pack('<Q', len(header_bytes)))
+            f.write(header_bytes)
+            for name, typecode, offset, length in layout:
+                f.write(b'\x00' * (data_start + offset - f.tell()))
+                self.columns[name].tofile(f)
+
+
+def write_snapshot(data, file_path):
+    """Write an Overpass document (dict with 'elements') as a columnar snapshot"""
+    builder = _SnapshotBuilder()
+    for element in data.get('elements', []):
+        builder.add(element)
+    meta = {key: value for key, value in data.items() if key != 'elements'}
+    builder.write(file_path, meta)
+    return file_path
+
+
+def json_to_snapshot(json_file_path, snapshot_file_path=None):
+    """
+    Convert an Overpass JSON file to a columnar snapshot
+
+    The JSON is parsed incrementally, so only the compact column arrays are
+    held in memory during conversion.
+    """
+    if not snapshot_file_path:
+        snapshot_file_path = os.path.splitext(json_file_path)[0] + SNAPSHOT_EXTENSION
+
+    builder = _SnapshotBuilder()
+    meta = {}
+    for item in iter_overpass(json_file_path):
+        if item[0] == 'element':
+            builder.add(item[1])
+        else:
+            meta[item[1]] = item[2]
+    builder.write(snapshot_file_path, meta)
+    return snapshot_file_path
+
+
+def snapshot_to_json(snapshot_file_path, json_file_path=None):
+    """Convert a columnar snapshot back to Overpass JSON"""
+    if not json_file_path:
+        json_file_path = os.path.splitext(snapshot_file_path)[0] + '.json'
+
+    with ColumnarSnapshot(snapshot_file_path) as snapshot:
+        data = snapshot.to_overpass()
+    with open(json_file_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    return json_file_path
+
+
+class ColumnarSnapshot:
+    """
+    Memory-mapped, read-only view of a columnar snapshot
+
+    Every column is exposed as a typed memoryview over the mapped file, e.g.
+    snapshot.id[i], snapshot.lat[i] or snapshot.tag_keys[start:end], so
+    opening a snapshot costs only the header parse and pages are read in as
+    they are touched. Tag values are dictionary encoded: value(code) decodes
+    one on demand. Element i's tags are tag_keys/tag_values in the range
+    tag_offsets[i]:tag_offsets[i + 1], and its way geometry is geom_lat/
+    geom_lon in geom_offsets[i]:geom_offsets[i + 1].
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self._file = open(file_path, 'rb')
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Zero-length files cannot be mapped
+            self._file.close()
+            raise ValueError(f"'{file_path}' is not a columnar snapshot")
+
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"'{file_path}' is not a columnar snapshot")
+
+        (header_length,) = struct.unpack_from('<Q', self._mmap, len(MAGIC))
+        header_start = len(MAGIC) + 8
+        header = json.loads(self._mmap[header_start:header_start + header_length].decode('utf-8'))
+
+        self.meta = header['meta']
+        self.count = header['count']
+        self.keys = header['keys']
+        self._buffer = memoryview(self._mmap)
+        self._columns = []
+        for name, spec in header['columns'].items():
+            typecode = spec['typecode']
+            nbytes = spec['length'] * array(typecode).itemsize
+            view = self._buffer[spec['offset']:spec['offset'] + nbytes].cast(typecode)
+            setattr(self, name, view)
+            self._columns.append(view)
+        self._values = {}
+
+    def value(self, code):
+        """Decode a dictionary-encoded tag value"""
+        value = self._values.get(code)
+        if value is None:
+            start, end = self.value_offsets[code], self.value_offsets[code + 1]
+            value = self._values[code] = bytes(self.value_blob[start:end]).decode('utf-8')
+        return value
+
+    def type_name(self, i):
+        return ELEMENT_TYPES[self.type[i]]
+
+    def tags(self, i):
+        """Tags of element i as a dict, or None if the element has no tags"""
+        if not self.flags[i] & HAS_TAGS:
+            return None
+        keys = self.keys
+        start, end = self.tag_offsets[i], self.tag_offsets[i + 1]
+        return {
+            keys[self.tag_keys[j]]: self.value(self.tag_values[j])
+            for j in range(start, end)
+        }
+
+    def element(self, i):
+        """Rebuild element i in Overpass JSON shape"""
+        element = {'type': ELEMENT_TYPES[self.type[i]], 'id': self.id[i]}
+        flags = self.flags[i]
+
+        lat, lon = self.lat[i], self.lon[i]
+        if not math.isnan(lat):
+            element['lat'] = lat
+        if not math.isnan(lon):
+            element['lon'] = lon
+
+        if flags & HAS_BOUNDS:
+            bounds = {}
+            for key in ('minlat', 'minlon', 'maxlat', 'maxlon'):
+                value = getattr(self, key)[i]
+                if not math.isnan(value):
+                    bounds[key] = value
+            element['bounds'] = bounds
+
+        start, end = self.geom_offsets[i], self.geom_offsets[i + 1]
+        if flags & HAS_NODES:
+            element['nodes'] = [ref for ref in self.geom_nodes[start:end] if ref != -1]
+        if flags & HAS_GEOMETRY:
+            element['geometry'] = [
+                None if math.isnan(lat) else {'lat': lat, 'lon': lon}
+                for lat, lon in zip(self.geom_lat[start:end], self.geom_lon[start:end])
+            ]
+
+        if flags & HAS_TAGS:
+            element['tags'] = self.tags(i)
+
+        start, end = self.extra_offsets[i], self.extra_offsets[i + 1]
+        if end > start:
+            element.update(json.loads(bytes(self.extra_blob[start:end]).decode('utf-8')))
+        return element
+
+    def iter_elements(self):
+        for i in range(self.count):
+            yield self.element(i)
+
+    def to_overpass(self):
+        """Rebuild the full Overpass document"""
+        data = {key: value for key, value in self.meta.items() if key != 'remark'}
+        data['elements'] = list(self.iter_elements())
+        if 'remark' in self.meta:
+            data['remark'] = self.meta['remark']
+        return data
+
+    def close(self):
+        for view in self._columns:
+            view.release()
+        self._columns = []
+        if getattr(self, '_buffer', None) is not None:
+            self._buffer.release()
+            self._buffer = None
+        self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def load_snapshot(file_path):
+    """
+    Load toilet data as an Overpass document from either format
+
+    Columnar snapshots are detected by their magic bytes; anything else is
+    read as Overpass JSON.
+    """
+    if is_snapshot(file_path):
+        with ColumnarSnapshot(file_path) as snapshot:
+            return snapshot.to_overpass()
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def main():
+    """Convert between Overpass JSON and columnar snapshots"""
+    if len(sys.argv) not in (3, 4) or sys.argv[1] not in ('to-snapshot', 'to-json'):
+        print("Usage: python snapshot_format.py to-snapshot <json_file_path> [snapshot_file_path]")
+        print("       python snapshot_format.py to-json <snapshot_file_path> [json_file_path]")
+        print("Example: python snapshot_format.py to-snapshot toilets_norway_20250623_151225.json")
+        return
+
+    command, source = sys.argv[1], sys.argv[2]
+    target = sys.argv[3] if len(sys.argv) == 4 else None
+    if command == 'to-snapshot':
+        target = json_to_snapshot(source, target)
+    else:
+        target = snapshot_to_json(source, target)
+
+    print(f"✅ Converted {source} -> {target}")
+    print(f"📏 {os.path.getsize(source)} bytes -> {os.path.getsize(target)} bytes")
+
+
+if __name__ == "__main__":
+    main()
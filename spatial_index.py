@@ -0,0 +1,435 @@
+import heapq
+import json
+import math
+import os
+import random
+import struct
+import sys
+import tempfile
+import time
+from array import array
+from collections import namedtuple
+
+from geo import (chord_to_metres, element_coordinates, haversine_m, metres_to_chord, polygon_centroid,
+                 to_unit_vector)
+from overpass_stream import iter_elements
+from snapshot_format import ELEMENT_TYPES, TYPE_CODES, ColumnarSnapshot, is_snapshot
+
+INDEX_MAGIC = b'TSIDX1\n\x00'
+INDEX_EXTENSION = '.tsidx'
+
+# Ranges this small are scanned instead of split further
+LEAF_SIZE = 8
+
+Neighbor = namedtuple('Neighbor', ['distance_m', 'type', 'id', 'lat', 'lon', 'element_index'])
+
+# Array name -> typecode, in file order
+_ARRAYS = [
+    ('x', 'd'), ('y', 'd'), ('z', 'd'),
+    ('lat', 'd'), ('lon', 'd'),
+    ('types', 'B'), ('ids', 'q'), ('element_index', 'i'),
+    ('axis', 'B'),
+]
+
+
+def iter_points(file_path):
+    """
+    Yield (element_index, type, id, lat, lon) for every locatable element
+
+    Works on Overpass JSON (streamed) and columnar snapshots. Ways are
+    placed with element_coordinates' rules.
+    """
+    if is_snapshot(file_path):
+        with ColumnarSnapshot(file_path) as snapshot:
+            node_code = TYPE_CODES['node']
+            for i in range(snapshot.count):
+                lat, lon = snapshot.lat[i], snapshot.lon[i]
+                if snapshot.type[i] != node_code or math.isnan(lat):
+                    start, end = snapshot.geom_offsets[i], snapshot.geom_offsets[i + 1]
+                    points = [{'lat': point_lat, 'lon': point_lon}
+                              for point_lat, point_lon in zip(snapshot.geom_lat[start:end],
+                                                              snapshot.geom_lon[start:end])
+                              if not math.isnan(point_lat)]
+                    if points:
+                        lat, lon = polygon_centroid(points)
+                    elif not math.isnan(snapshot.minlat[i]):
+                        lat = (snapshot.minlat[i] + snapshot.maxlat[i]) / 2
+                        lon = (snapshot.minlon[i] + snapshot.maxlon[i]) / 2
+                    else:
+                        continue
+                yield i, ELEMENT_TYPES[snapshot.type[i]], snapshot.id[i], lat, lon
+        return
+
+    yield from iter_element_points(iter_elements(file_path))
+
+
+def iter_element_points(elements):
+    """Yield (element_index, type, id, lat, lon) for already loaded elements"""
+    for i, element in enumerate(elements):
+        coordinates = element_coordinates(element)
+        if coordinates:
+            yield (i, element['type'], element['id']) + tuple(coordinates)
+
+
+class SpatialIndex:
+    """
+    KD-tree over toilet positions for nearest, radius and bbox lookups
+
+    Points are stored as unit vectors on the sphere, where straight-line
+    (chord) distance grows monotonically with great-circle distance, so
+    nearest-neighbour and radius searches are exact haversine queries with
+    no special cases at high latitudes. The tree is implicit: points are
+    reordered so that the median of every range [lo, hi) sits at its middle
+    and 'axis' records the split dimension, which keeps the whole index in a
+    handful of flat arrays that save and load without rebuilding.
+
+    Build with SpatialIndex.from_points(...) or SpatialIndex.from_file(path),
+    persist with save() and SpatialIndex.load().
+    """
+
+    def __init__(self, arrays, source=None):
+        for name, _ in _ARRAYS:
+            setattr(self, name, arrays[name])
+        self.source = source
+        self._coords = (self.x, self.y, self.z)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def from_points(cls, points, source=None):
+        """Build an index from (element_index, type, id, lat, lon) tuples"""
+        points = list(points)
+        vectors = [to_unit_vector(lat, lon) for _, _, _, lat, lon in points]
+        order = list(range(len(points)))
+        axis = array('B', bytes(len(points)))
+
+        # Iterative median split; every range is sorted on its widest axis
+        stack = [(0, len(order))]
+        while stack:
+            lo, hi = stack.pop()
+            if hi - lo <= LEAF_SIZE:
+                continue
+            segment = order[lo:hi]
+            spreads = [
+                max(vectors[p][dim] for p in segment) - min(vectors[p][dim] for p in segment)
+                for dim in range(3)
+            ]
+            dim = spreads.index(max(spreads))
+            segment.sort(key=lambda p: vectors[p][dim])
+            order[lo:hi] = segment
+            mid = (lo + hi) // 2
+            axis[mid] = dim
+            stack.append((lo, mid))
+            stack.append((mid + 1, hi))
+
+        arrays = {
+            'x': array('d', (vectors[p][0] for p in order)),
+            'y': array('d', (vectors[p][1] for p in order)),
+            'z': array('d', (vectors[p][2] for p in order)),
+            'lat': array('d', (points[p][3] for p in order)),
+            'lon': array('d', (points[p][4] for p in order)),
+            'types': array('B', (TYPE_CODES[points[p][1]] for p in order)),
+            'ids': array('q', (points[p][2] for p in order)),
+            'element_index': array('i', (points[p][0] for p in order)),
+            'axis': axis,
+        }
+        return cls(arrays, source=source)
+
+    @classmethod
+    def from_file(cls, file_path):
+        """Build an index from an Overpass JSON file or columnar snapshot"""
+        return cls.from_points(iter_points(file_path), source=os.path.basename(file_path))
+
+    def save(self, file_path):
+        """Write the index to disk so it can be loaded without rebuilding"""
+        header = json.dumps({
+            'count': len(self),
+            'source': self.source,
+            'leaf_size': LEAF_SIZE,
+            'arrays': [name for name, _ in _ARRAYS],
+        }).encode('utf-8')
+        with open(file_path, 'wb') as f:
+            f.write(INDEX_MAGIC)
+            f.write(struct.pack('<Q', len(header)))
+            f.write(header)
+            for name, _ in _ARRAYS:
+                getattr(self, name).tofile(f)
+        return file_path
+
+    @classmethod
+    def load(cls, file_path):
+        """Load an index written by save()"""
+        with open(file_path, 'rb') as f:
+            if f.read(len(INDEX_MAGIC)) != INDEX_MAGIC:
+                raise ValueError(f"'{file_path}' is not a spatial index")
+            (header_length,) = struct.unpack('<Q', f.read(8))
+            header = json.loads(f.read(header_length).decode('utf-8'))
+            if header.get('leaf_size') != LEAF_SIZE:
+                raise ValueError(f"'{file_path}' was built with a different leaf size, rebuild it")
+            arrays = {}
+            for name, typecode in _ARRAYS:
+                column = array(typecode)
+                column.fromfile(f, header['count'])
+                arrays[name] = column
+        return cls(arrays, source=header.get('source'))
+
+    def _neighbor(self, position, chord):
+        return Neighbor(
+            chord_to_metres(chord), ELEMENT_TYPES[self.types[position]], self.ids[position],
+            self.lat[position], self.lon[position], self.element_index[position]
+        )
+
+    def _distance2(self, position, qx, qy, qz):
+        dx = self.x[position] - qx
+        dy = self.y[position] - qy
+        dz = self.z[position] - qz
+        return dx * dx + dy * dy + dz * dz
+
+    def nearest(self, lat, lon, k=1, max_distance_m=None, accept=None):
+        """
+        The k toilets closest to (lat, lon), nearest first
+
+        Args:
+            lat, lon: Query position in degrees
+            k: Number of neighbours to return
+            max_distance_m: Ignore toilets further away than this
+            accept: Optional predicate called with a point's element_index;
+                points it rejects are skipped, so filtered queries still
+                return the k nearest matching toilets
+
+        Returns:
+            List of Neighbor(distance_m, type, id, lat, lon, element_index)
+        """
+        if not len(self) or k <= 0:
+            return []
+        query = to_unit_vector(lat, lon)
+        qx, qy, qz = query
+        coords = self._coords
+        axis = self.axis
+        element_index = self.element_index
+
+        # Max-heap of (-distance², position) holding the best k so far
+        best = []
+        bound = metres_to_chord(max_distance_m) ** 2 if max_distance_m is not None else math.inf
+
+        # Ranges to visit with a lower bound on their squared distance
+        stack = [(0, len(self), 0.0)]
+        while stack:
+            lo, hi, min_d2 = stack.pop()
+            if min_d2 > bound:
+                continue
+            if hi - lo <= LEAF_SIZE:
+                for position in range(lo, hi):
+                    d2 = self._distance2(position, qx, qy, qz)
+                    if d2 <= bound and (accept is None or accept(element_index[position])):
+                        if len(best) < k:
+                            heapq.heappush(best, (-d2, position))
+                        elif d2 < -best[0][0]:
+                            heapq.heapreplace(best, (-d2, position))
+                        if len(best) == k:
+                            bound = min(bound, -best[0][0])
+                continue
+
+            mid = (lo + hi) // 2
+            d2 = self._distance2(mid, qx, qy, qz)
+            if d2 <= bound and (accept is None or accept(element_index[mid])):
+                if len(best) < k:
+                    heapq.heappush(best, (-d2, mid))
+                elif d2 < -best[0][0]:
+                    heapq.heapreplace(best, (-d2, mid))
+                if len(best) == k:
+                    bound = min(bound, -best[0][0])
+
+            dim = axis[mid]
+            diff = query[dim] - coords[dim][mid]
+            if diff < 0:
+                near, far = (lo, mid), (mid + 1, hi)
+            else:
+                near, far = (mid + 1, hi), (lo, mid)
+            # Push the far side first so the near side is searched first
+            stack.append(far + (diff * diff,))
+            stack.append(near + (0.0,))
+
+        result = sorted((-negative_d2, position) for negative_d2, position in best)
+        return [self._neighbor(position, math.sqrt(d2)) for d2, position in result]
+
+    def within_radius(self, lat, lon, radius_m, sort=True):
+        """
+        All toilets within radius_m metres (haversine) of (lat, lon)
+
+        Returns:
+            List of Neighbor, nearest first unless sort is False
+        """
+        if not len(self):
+            return []
+        query = to_unit_vector(lat, lon)
+        qx, qy, qz = query
+        coords = self._coords
+        axis = self.axis
+        chord = metres_to_chord(radius_m)
+        bound = chord * chord
+
+        hits = []
+        stack = [(0, len(self))]
+        while stack:
+            lo, hi = stack.pop()
+            if hi - lo <= LEAF_SIZE:
+                for position in range(lo, hi):
+                    d2 = self._distance2(position, qx, qy, qz)
+                    if d2 <= bound:
+                        hits.append((d2, position))
+                continue
+
+            mid = (lo + hi) // 2
+            d2 = self._distance2(mid, qx, qy, qz)
+            if d2 <= bound:
+                hits.append((d2, mid))
+
+            diff = query[axis[mid]] - coords[axis[mid]][mid]
+            if diff <= chord:
+                stack.append((lo, mid))
+            if diff >= -chord:
+                stack.append((mid + 1, hi))
+
+        if sort:
+            hits.sort()
+        return [self._neighbor(position, math.sqrt(d2)) for d2, position in hits]
+
+    def in_bbox(self, south, west, north, east):
+        """
+        All toilets inside a lat/lon bounding box, in no particular order
+
+        The tree is searched with the circle around the bbox, and the hits are
+        then filtered on latitude and longitude.
+        """
+        center_lat = (south + north) / 2
+        center_lon = (west + east) / 2
+        radius = max(
+            haversine_m(center_lat, center_lon, lat, lon)
+            for lat in (south, north) for lon in (west, center_lon, east)
+        )
+        return [
+            hit for hit in self.within_radius(center_lat, center_lon, radius * 1.0001, sort=False)
+            if south <= hit.lat <= north and west <= hit.lon <= east
+        ]
+
+    def nearest_batch(self, points, k=1, max_distance_m=None, accept=None):
+        """nearest() for many (lat, lon) query points, returned in input order"""
+        return [self.nearest(lat, lon, k, max_distance_m, accept) for lat, lon in points]
+
+    def within_radius_batch(self, points, radius_m, sort=True):
+        """within_radius() for many (lat, lon) query points, returned in input order"""
+        return [self.within_radius(lat, lon, radius_m, sort) for lat, lon in points]
+
+
+def linear_nearest(points, lat, lon, k=1):
+    """Reference k-nearest by scanning every point, used by the benchmark"""
+    distances = [(haversine_m(lat, lon, p[3], p[4]), p) for p in points]
+    return heapq.nsmallest(k, distances, key=lambda item: item[0])
+
+
+def linear_within_radius(points, lat, lon, radius_m):
+    """Reference radius query by scanning every point, used by the benchmark"""
+    return [p for p in points if haversine_m(lat, lon, p[3], p[4]) <= radius_m]
+
+
+def benchmark(file_path, num_queries=1000, k=5, radius_m=1000, seed=42):
+    """
+    Compare the KD-tree with a linear scan over all points
+
+    Query points are drawn near random toilets, so they fall where people
+    actually search. Prints build/load times and per-query latencies, and
+    checks that both methods agree.
+    """
+    points = list(iter_points(file_path))
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(num_queries):
+        _, _, _, lat, lon = rng.choice(points)
+        queries.append((lat + rng.uniform(-0.05, 0.05), lon + rng.uniform(-0.1, 0.1)))
+
+    start = time.perf_counter()
+    index = SpatialIndex.from_points(points, source=os.path.basename(file_path))
+    build_time = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as directory:
+        index_path = index.save(os.path.join(directory, 'bench' + INDEX_EXTENSION))
+        start = time.perf_counter()
+        SpatialIndex.load(index_path)
+        load_time = time.perf_counter() - start
+
+    def timed(function):
+        start = time.perf_counter()
+        results = [function(lat, lon) for lat, lon in queries]
+        return results, (time.perf_counter() - start) / len(queries)
+
+    tree_knn, tree_knn_time = timed(lambda lat, lon: index.nearest(lat, lon, k))
+    scan_knn, scan_knn_time = timed(lambda lat, lon: linear_nearest(points, lat, lon, k))
+    tree_radius, tree_radius_time = timed(lambda lat, lon: index.within_radius(lat, lon, radius_m))
+    scan_radius, scan_radius_time = timed(lambda lat, lon: linear_within_radius(points, lat, lon, radius_m))
+
+    knn_match = all(
+        [round(hit.distance_m, 3) for hit in tree] == [round(item[0], 3) for item in scan]
+        for tree, scan in zip(tree_knn, scan_knn)
+    )
+    radius_match = all(
+        sorted((hit.type, hit.id) for hit in tree) == sorted((p[1], p[2]) for p in scan)
+        for tree, scan in zip(tree_radius, scan_radius)
+    )
+
+    print(f"📊 {len(points)} points, {num_queries} queries")
+    print(f"   Build: {build_time * 1000:.1f} ms, load from disk: {load_time * 1000:.1f} ms")
+    print(f"   {k}-nearest: tree {tree_knn_time * 1e6:.1f} µs, "
+          f"scan {scan_knn_time * 1e6:.1f} µs ({scan_knn_time / tree_knn_time:.0f}x)")
+    print(f"   radius {radius_m} m: tree {tree_radius_time * 1e6:.1f} µs, "
+          f"scan {scan_radius_time * 1e6:.1f} µs ({scan_radius_time / tree_radius_time:.0f}x)")
+    print(f"   Results match linear scan: {'✅' if knn_match and radius_match else '❌'}")
+
+    return {
+        'points': len(points),
+        'queries': num_queries,
+        'build_s': build_time,
+        'load_s': load_time,
+        'knn_tree_s': tree_knn_time,
+        'knn_scan_s': scan_knn_time,
+        'radius_tree_s': tree_radius_time,
+        'radius_scan_s': scan_radius_time,
+        'results_match': knn_match and radius_match,
+    }
+
+
+def main():
+    """Build, query or benchmark a spatial index"""
+    usage = [
+        "Usage: python spatial_index.py build <snapshot_path> [index_path]",
+        "       python spatial_index.py nearest <index_path> <lat> <lon> [k]",
+        "       python spatial_index.py bench <snapshot_path> [num_queries]",
+        "Example: python spatial_index.py nearest toilets_norway_20250623_151225.tsidx 59.91 10.75 5",
+    ]
+    if len(sys.argv) < 3 or sys.argv[1] not in ('build', 'nearest', 'bench'):
+        print("\n".join(usage))
+        return
+
+    command = sys.argv[1]
+    if command == 'build':
+        source = sys.argv[2]
+        target = sys.argv[3] if len(sys.argv) > 3 else os.path.splitext(source)[0] + INDEX_EXTENSION
+        index = SpatialIndex.from_file(source)
+        index.save(target)
+        print(f"✅ Indexed {len(index)} toilets -> {target}")
+    elif command == 'nearest':
+        if len(sys.argv) < 5:
+            print("\n".join(usage))
+            return
+        index = SpatialIndex.load(sys.argv[2])
+        k = int(sys.argv[5]) if len(sys.argv) > 5 else 1
+        for hit in index.nearest(float(sys.argv[3]), float(sys.argv[4]), k):
+            print(f"🚽 {hit.type}/{hit.id} at {hit.lat:.5f}, {hit.lon:.5f}: {hit.distance_m:.0f} m")
+    else:
+        num_queries = int(sys.argv[3]) if len(sys.argv) > 3 else 1000
+        benchmark(sys.argv[2], num_queries=num_queries)
+
+
+if __name__ == "__main__":
+    main()
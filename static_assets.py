@@ -0,0 +1,224 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+import sys
+
+from instrumentation import stage
+
+try:
+    import brotli
+except ImportError:  # Optional: without it only gzip variants are written
+    brotli = None
+
+MANIFEST_FILE = 'manifest.json'
+
+# Hex digits of the content hash put in file names
+HASH_LENGTH = 12
+
+# Generations of each asset kept on disk, the current one included, so a
+# client holding the previous manifest can still load what it points to
+KEEP_GENERATIONS = 2
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+
+
+def hashed_name(name, digest):
+    """toilets.json -> toilets.<digest>.json"""
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.{digest}{ext}"
+
+
+def _write_atomic(path, data):
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+
+def load_manifest(output_dir):
+    """The manifest in output_dir, or an empty one"""
+    try:
+        with open(os.path.join(output_dir, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'assets': {}}
+
+
+def _touch_current(manifest, output_dir):
+    """Mark the files the manifest points at as newer than any other old generation"""
+    for entry in manifest['assets'].values():
+        for suffix in ('', '.gz', '.br'):
+            path = os.path.join(output_dir, entry['file'] + suffix)
+            if os.path.exists(path):
+                os.utime(path)
+
+
+def publish_asset(data, name, output_dir):
+    """
+    Write an asset under its content-hashed name with precompressed variants
+
+    Next to <stem>.<hash><ext> come .gz and (with the brotli package) .br
+    copies, for servers that serve precompressed files. gzip output has no
+    timestamp, so the same content always gives the same bytes. Files
+    already there under the same hash are not rewritten, only touched.
+
+    Args:
+        data: Asset contents (bytes)
+        name: Logical name, e.g. 'toilets.json'
+        output_dir: Folder the files go to
+
+    Returns:
+        Manifest entry: file name, ETag and the size of every variant
+    """
+    digest = content_hash(data)
+    file_name = hashed_name(name, digest)
+    path = os.path.join(output_dir, file_name)
+    os.makedirs(output_dir, exist_ok=True)
+
+    variants = {'identity': (path, lambda: data),
+                'gzip': (path + '.gz', lambda: gzip.compress(data, compresslevel=9, mtime=0))}
+    if brotli:
+        variants['br'] = (path + '.br', lambda: brotli.compress(data, quality=11))
+
+    sizes = {}
+    for encoding, (variant_path, compress) in variants.items():
+        if os.path.exists(variant_path):
+            os.utime(variant_path)  # The newest generation again for prune_assets
+        else:
+            _write_atomic(variant_path, compress())
+        sizes[encoding] = os.path.getsize(variant_path)
+
+    return {
+        'file': file_name,
+        'etag': f'"{digest}"',
+        'bytes': sizes,
+    }
+
+
+def prune_assets(output_dir, name, keep=KEEP_GENERATIONS):
+    """Delete all but the newest keep generations of an asset's hashed files"""
+    stem, ext = os.path.splitext(name)
+    pattern = re.compile(rf'^{re.escape(stem)}\.([0-9a-f]{{{HASH_LENGTH}}}){re.escape(ext)}(\.gz|\.br)?$')
+    generations = {}
+    for file_name in os.listdir(output_dir):
+        match = pattern.match(file_name)
+        if match:
+            path = os.path.join(output_dir, file_name)
+            newest = generations.get(match.group(1), 0)
+            generations[match.group(1)] = max(newest, os.path.getmtime(path))
+
+    removed = 0
+    for digest in sorted(generations, key=generations.get, reverse=True)[keep:]:
+        for suffix in ('', '.gz', '.br'):
+            path = os.path.join(output_dir, hashed_name(name, digest) + suffix)
+            if os.path.exists(path):
+                os.remove(path)
+                removed += 1
+    return removed
+
+
+def publish(assets, output_dir, keep=KEEP_GENERATIONS):
+    """
+    Publish assets and point the manifest at them
+
+    The manifest is written last and atomically, so it never names a file
+    that is not there yet. Entries for other assets already in the
+    manifest are kept.
+
+    Args:
+        assets: Logical name -> contents (bytes)
+        output_dir: Folder for the files and manifest.json
+        keep: Generations of each asset kept on disk
+
+    Returns:
+        The manifest dict
+    """
+    manifest = load_manifest(output_dir)
+    _touch_current(manifest, output_dir)  # The generation clients may still hold is kept
+    with stage('publish') as s:
+        for name, data in assets.items():
+            entry = publish_asset(data, name, output_dir)
+            manifest['assets'][name] = entry
+            s.record(bytes_out=entry['bytes']['identity'], bytes_gzip=entry['bytes']['gzip'],
+                     bytes_br=entry['bytes'].get('br'))
+        _write_atomic(os.path.join(output_dir, MANIFEST_FILE),
+                      json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+        for name in assets:
+            prune_assets(output_dir, name, keep)
+    return manifest
+
+
+def is_published(source_dir, output_dir):
+    """Whether output_dir's manifest already points at every asset published in source_dir"""
+    assets = load_manifest(output_dir)['assets']
+    return all(
+        assets.get(name) == entry and os.path.exists(os.path.join(output_dir, entry['file']))
+        for name, entry in load_manifest(source_dir)['assets'].items()
+    )
+
+
+def copy_published(source_dir, output_dir, keep=KEEP_GENERATIONS):
+    """
+    Move assets published into one folder over to another
+
+    For builds written to a scratch folder: output_dir is updated in place,
+    not replaced, so the generations already there stay until prune_assets
+    drops them. Files already there under the same hashed name are only
+    touched, and the manifest is merged and written last, like in publish().
+
+    Returns:
+        The manifest dict
+    """
+    source_manifest = load_manifest(source_dir)
+    manifest = load_manifest(output_dir)
+    _touch_current(manifest, output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    for file_name in sorted(os.listdir(source_dir)):
+        if file_name == MANIFEST_FILE:
+            continue
+        path = os.path.join(output_dir, file_name)
+        if os.path.exists(path):
+            os.utime(path)  # The newest generation again for prune_assets
+        else:
+            with open(os.path.join(source_dir, file_name), 'rb') as f:
+                _write_atomic(path, f.read())
+
+    manifest['assets'].update(source_manifest['assets'])
+    _write_atomic(os.path.join(output_dir, MANIFEST_FILE),
+                  json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    for name in source_manifest['assets']:
+        prune_assets(output_dir, name, keep)
+    return manifest
+
+
+def print_size_report(manifest, names=None):
+    """Print each asset's size per encoding"""
+    for name in names or sorted(manifest['assets']):
+        entry = manifest['assets'][name]
+        sizes = entry['bytes']
+        line = f"   {name}: {sizes['identity'] / 1024:,.1f} KB, gzip {sizes['gzip'] / 1024:,.1f} KB"
+        if 'br' in sizes:
+            line += f", brotli {sizes['br'] / 1024:,.1f} KB"
+        print(line + f" ({entry['file']})")
+
+
+def main():
+    """Show the size report of a published folder"""
+    if len(sys.argv) < 2:
+        print("Usage: python static_assets.py <published_dir>")
+        print("Example: python static_assets.py norway-toilet-map/public/data")
+        return
+    manifest = load_manifest(sys.argv[1])
+    if not manifest['assets']:
+        print(f"❌ No {MANIFEST_FILE} in {sys.argv[1]}")
+        sys.exit(1)
+    print(f"📦 {sys.argv[1]}")
+    print_size_report(manifest)
+
+
+if __name__ == "__main__":
+    main()
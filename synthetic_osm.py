@@ -0,0 +1,258 @@
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+
+from geo import EARTH_RADIUS_M, element_coordinates
+from snapshot_format import is_snapshot
+
+# Where points are spread when there are no anchor toilets to cluster around
+DEFAULT_BBOX = (58.0, 5.0, 71.0, 31.0)
+
+# Share of ways among the elements, as in the Norway snapshot (613 of 3421)
+DEFAULT_WAY_FRACTION = 0.18
+
+# Coverage assumed for keys of a _tags_analysis.json model, which only lists
+# values. Keys not named here are assumed rare
+LEGACY_COVERAGE = {
+    'amenity': 1.0, 'access': 0.5, 'fee': 0.5, 'wheelchair': 0.45,
+    'unisex': 0.15, 'changing_table': 0.15, 'toilets:disposal': 0.2,
+    'building': 0.15, 'opening_hours': 0.1, 'operator': 0.1,
+}
+LEGACY_RARE_COVERAGE = 0.01
+
+# Keys at least this common are drawn one by one; rarer keys are drawn
+# together, which keeps generation fast with hundreds of keys
+COMMON_COVERAGE = 0.05
+
+# Anchor toilets are jittered by up to this many metres
+ANCHOR_JITTER_M = 2000
+
+OSM3S = {
+    'timestamp_osm_base': '2025-06-23T13:11:31Z',
+    'copyright': 'Synthetic data generated by synthetic_osm.py, modelled on OpenStreetMap data (ODbL).',
+}
+
+
+class TagModel:
+    """
+    Tag distribution to draw synthetic toilets' tags from
+
+    Each key has a coverage (share of toilets carrying it) and weighted
+    values. Values a _tag_stats.json counts but does not list (the long
+    tail of keys like check_date) are drawn as fresh made-up values, so
+    synthetic data keeps the real key cardinalities.
+    """
+
+    def __init__(self, keys):
+        # key -> (coverage, values, weights, tail weight)
+        self.keys = keys
+        self.common = [key for key, spec in keys.items() if spec[0] >= COMMON_COVERAGE]
+        self.rare = [key for key, spec in keys.items() if spec[0] < COMMON_COVERAGE]
+        self.rare_weights = [keys[key][0] for key in self.rare]
+        self.rare_expected = sum(self.rare_weights)
+
+    @classmethod
+    def from_tag_stats(cls, report):
+        """Model from a TagStats report (the _tag_stats.json format)"""
+        keys = {}
+        for key, info in report['keys'].items():
+            values = [entry[0] for entry in info['values']]
+            weights = [entry[1] for entry in info['values']]
+            tail = max(0, info['count'] - sum(weights))
+            keys[key] = (info['coverage'], values, weights, tail)
+        return cls(keys)
+
+    @classmethod
+    def from_distinct_values(cls, tag_values):
+        """Model from a key -> distinct values dict (the _tags_analysis.json format)"""
+        keys = {}
+        for key, values in tag_values.items():
+            coverage = LEGACY_COVERAGE.get(key, LEGACY_RARE_COVERAGE)
+            keys[key] = (coverage, list(values), [1] * len(values), 0)
+        return cls(keys)
+
+    @classmethod
+    def load(cls, file_path):
+        """
+        Load a model from a _tag_stats.json, a _tags_analysis.json or a snapshot
+
+        A snapshot (Overpass JSON or .tsnap) is analyzed with
+        tags_analysis.compute_tag_stats first.
+        """
+        if not is_snapshot(file_path):
+            with open(file_path, 'r', encoding='utf-8') as f:
+                head = f.read(4096)
+            if '"elements"' not in head:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if 'keys' in data and 'elements' in data:
+                    return cls.from_tag_stats(data)
+                return cls.from_distinct_values(data)
+        from tags_analysis import compute_tag_stats
+        return cls.from_tag_stats(compute_tag_stats(file_path).to_dict())
+
+    def _value(self, rng, key):
+        _, values, weights, tail = self.keys[key]
+        if tail and rng.random() * (sum(weights) + tail) >= sum(weights):
+            return f"{key}-{rng.randrange(1_000_000)}"
+        return rng.choices(values, weights)[0]
+
+    def sample(self, rng):
+        """Draw one toilet's tags"""
+        tags = {'amenity': 'toilets'}
+        for key in self.common:
+            if key not in tags and rng.random() < self.keys[key][0]:
+                tags[key] = self._value(rng, key)
+        if self.rare:
+            # Poisson number of rare keys, each picked by its coverage
+            count, threshold, product = 0, math.exp(-self.rare_expected), rng.random()
+            while product > threshold:
+                count += 1
+                product *= rng.random()
+            for key in rng.choices(self.rare, self.rare_weights, k=count):
+                if key not in tags:
+                    tags[key] = self._value(rng, key)
+        return tags
+
+
+def load_anchors(file_path):
+    """Positions of the toilets in a snapshot, to place synthetic ones around"""
+    from snapshot_format import load_snapshot
+    return [position for position in map(element_coordinates, load_snapshot(file_path)['elements'])
+            if position]
+
+
+def _offset(lat, lon, north_m, east_m):
+    """Move a point by metres north and east on a local plane"""
+    lat_step = north_m / EARTH_RADIUS_M * 180 / math.pi
+    lon_step = east_m / (EARTH_RADIUS_M * math.cos(math.radians(lat))) * 180 / math.pi
+    return round(lat + lat_step, 7), round(lon + lon_step, 7)
+
+
+def _building(rng, lat, lon):
+    """Geometry of a small building around (lat, lon): a rotated rectangle or a polygon"""
+    angle = rng.uniform(0, math.pi)
+    if rng.random() < 0.8:
+        width, depth = rng.uniform(2, 25), rng.uniform(2, 15)
+        corners = [(-width / 2, -depth / 2), (width / 2, -depth / 2), (width / 2, depth / 2), (-width / 2, depth / 2)]
+    else:
+        radius = rng.uniform(3, 20)
+        sides = rng.randint(5, 12)
+        corners = [(radius * math.cos(2 * math.pi * i / sides) * rng.uniform(0.8, 1.2),
+                    radius * math.sin(2 * math.pi * i / sides) * rng.uniform(0.8, 1.2))
+                   for i in range(sides)]
+    points = []
+    for x, y in corners:
+        east = x * math.cos(angle) - y * math.sin(angle)
+        north = x * math.sin(angle) + y * math.cos(angle)
+        points.append(_offset(lat, lon, north, east))
+    if rng.random() < 0.98:
+        points.append(points[0])  # Closed, apart from the odd open way
+    return points
+
+
+def generate_elements(count, model, seed=42, anchors=None, way_fraction=DEFAULT_WAY_FRACTION,
+                      bbox=DEFAULT_BBOX):
+    """
+    Yield count synthetic toilet elements in Overpass 'out geom' form
+
+    Args:
+        count: Number of elements
+        model: TagModel to draw tags from
+        seed: Random seed; the same seed and inputs give the same data
+        anchors: (lat, lon) positions to scatter toilets around (default:
+            uniformly over bbox)
+        way_fraction: Share of elements that are building ways
+        bbox: (south, west, north, east) used without anchors
+    """
+    rng = random.Random(seed)
+    next_node_id = 10_000_000_000
+    for i in range(count):
+        if anchors:
+            lat, lon = rng.choice(anchors)
+            lat, lon = _offset(lat, lon, rng.gauss(0, ANCHOR_JITTER_M), rng.gauss(0, ANCHOR_JITTER_M))
+        else:
+            lat, lon = round(rng.uniform(bbox[0], bbox[2]), 7), round(rng.uniform(bbox[1], bbox[3]), 7)
+        tags = model.sample(rng)
+
+        if rng.random() >= way_fraction:
+            yield {'type': 'node', 'id': 20_000_000_000 + i, 'lat': lat, 'lon': lon, 'tags': tags}
+            continue
+
+        points = _building(rng, lat, lon)
+        closed = points[0] == points[-1]
+        distinct = len(points) - 1 if closed else len(points)
+        nodes = list(range(next_node_id, next_node_id + distinct))
+        next_node_id += distinct
+        if closed:
+            nodes.append(nodes[0])
+        yield {
+            'type': 'way',
+            'id': 30_000_000_000 + i,
+            'bounds': {
+                'minlat': min(point[0] for point in points), 'minlon': min(point[1] for point in points),
+                'maxlat': max(point[0] for point in points), 'maxlon': max(point[1] for point in points),
+            },
+            'nodes': nodes,
+            'geometry': [{'lat': point[0], 'lon': point[1]} for point in points],
+            'tags': tags,
+        }
+
+
+def write_synthetic_snapshot(output_file, count, model, seed=42, anchors=None,
+                             way_fraction=DEFAULT_WAY_FRACTION):
+    """
+    Write a synthetic Overpass JSON snapshot, one element at a time
+
+    Elements are written as they are generated, so million-element files
+    take no more memory than small ones.
+
+    Returns:
+        output_file
+    """
+    header = {
+        'version': 0.6,
+        'generator': 'synthetic_osm.py',
+        'osm3s': OSM3S,
+    }
+    with open(output_file, 'w', encoding='utf-8') as f:
+        f.write(json.dumps(header, ensure_ascii=False)[:-1] + ',\n"elements": [\n')
+        for i, element in enumerate(generate_elements(count, model, seed, anchors, way_fraction)):
+            if i:
+                f.write(',\n')
+            f.write(json.dumps(element, ensure_ascii=False, separators=(',', ':')))
+        f.write('\n]\n}\n')
+    return output_file
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic toilet snapshot for benchmarks")
+    parser.add_argument('output', help="Overpass JSON file to write")
+    parser.add_argument('-n', '--elements', type=int, default=100_000, help="Number of elements")
+    parser.add_argument('--tags', default='toilets_norway_20250623_151225.json',
+                        help="Tag model: a snapshot, _tag_stats.json or _tags_analysis.json")
+    parser.add_argument('--anchors', help="Snapshot whose toilets the synthetic ones cluster around")
+    parser.add_argument('--way-fraction', type=float, default=DEFAULT_WAY_FRACTION)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    try:
+        model = TagModel.load(args.tags)
+        anchors = load_anchors(args.anchors) if args.anchors else None
+    except (OSError, ValueError, KeyError) as e:
+        print(f"❌ Could not load the tag model or anchors: {e}")
+        sys.exit(1)
+
+    start = time.perf_counter()
+    write_synthetic_snapshot(args.output, args.elements, model, args.seed, anchors, args.way_fraction)
+    size_mb = os.path.getsize(args.output) / 1024 / 1024
+    print(f"✅ Wrote {args.elements:,} synthetic toilets to {args.output} "
+          f"({size_mb:.1f} MB in {time.perf_counter() - start:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,276 @@
+import copy
+import hashlib
+import heapq
 import json
+import math
+import os
 import sys
 from collections import defaultdict
+from itertools import combinations
 
+from instrumentation import enable_from_args, file_size, instrumented, stage
+from overpass_stream import iter_elements
+from snapshot_format import ColumnarSnapshot, is_snapshot
+
+# Values tracked exactly per key; past this, the least frequent are evicted
+# (Space-Saving) and the distinct count becomes a HyperLogLog estimate
+DEFAULT_TOP_K = 64
+
+# Keys whose value combinations are counted together
+CO_OCCURRENCE_KEYS = ('wheelchair', 'fee', 'access')
+
+# Placeholder for an absent key in co-occurrence counts
+MISSING = '(missing)'
+
+# HyperLogLog registers are 2**HLL_PRECISION bytes per key (~1.6% error)
+HLL_PRECISION = 12
+
+class HyperLogLog:
+    """
+    Approximate distinct counter in a fixed 2**precision bytes
+    
+    Values are hashed with blake2b rather than hash(), so sketches built in
+    different processes can be merged.
+    """
+    
+    def __init__(self, precision=HLL_PRECISION):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+    
+    def add(self, value):
+        digest = hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest()
+        hashed = int.from_bytes(digest, 'big')
+        index = hashed >> (64 - self.precision)
+        rest = hashed & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+    
+    def merge(self, other):
+        self.registers = bytearray(map(max, self.registers, other.registers))
+    
+    def estimate(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        if raw <= 2.5 * m and zeros:
+            return round(m * math.log(m / zeros))  # Linear counting for small sets
+        return round(raw)
+
+class ValueCounter:
+    """
+    Counts of one key's values in bounded memory
+    
+    Up to capacity distinct values are counted exactly. Beyond that the
+    Space-Saving algorithm replaces the least frequent value, so the
+    counters always hold the heavy hitters, each with an upper bound on how
+    much it may be overcounted. The distinct count is exact until the first
+    eviction and a HyperLogLog estimate afterwards.
+    """
+    
+    def __init__(self, capacity=DEFAULT_TOP_K):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        self.sketch = None
+    
+    def add(self, value):
+        if value in self.counts:
+            self.counts[value] += 1
+        elif len(self.counts) < self.capacity:
+            self.counts[value] = 1
+            self.errors[value] = 0
+        else:
+            if self.sketch is None:
+                self._start_sketch()
+            evicted = min(self.counts, key=self.counts.get)
+            floor = self.counts.pop(evicted)
+            del self.errors[evicted]
+            self.counts[value] = floor + 1
+            self.errors[value] = floor
+        if self.sketch is not None:
+            self.sketch.add(value)
+    
+    def _start_sketch(self):
+        # Nothing was evicted yet, so the counters hold every value seen
+        self.sketch = HyperLogLog()
+        for value in self.counts:
+            self.sketch.add(value)
+    
+    @property
+    def exact(self):
+        return self.sketch is None
+    
+    def distinct(self):
+        return len(self.counts) if self.exact else max(self.sketch.estimate(), len(self.counts))
+    
+    def merge(self, other):
+        """Combine with another counter (mergeable Space-Saving summaries)"""
+        if self.exact and other.exact and len(set(self.counts) | set(other.counts)) <= self.capacity:
+            for value, count in other.counts.items():
+                self.counts[value] = self.counts.get(value, 0) + count
+                self.errors[value] = self.errors.get(value, 0) + other.errors[value]
+            return
+        
+        # A value missing from a full summary may have occurred up to its
+        # smallest count times there
+        floor = min(self.counts.values()) if len(self.counts) >= self.capacity else 0
+        other_floor = min(other.counts.values()) if len(other.counts) >= other.capacity else 0
+        counts, errors = {}, {}
+        for value in set(self.counts) | set(other.counts):
+            counts[value] = self.counts.get(value, floor) + other.counts.get(value, other_floor)
+            errors[value] = (self.errors.get(value, floor) +
+                             other.errors.get(value, other_floor))
+        kept = heapq.nlargest(self.capacity, counts, key=counts.get)
+        
+        if self.sketch is None:
+            self._start_sketch()
+        if other.sketch is None:
+            other_sketch = HyperLogLog()
+            for value in other.counts:
+                other_sketch.add(value)
+        else:
+            other_sketch = other.sketch
+        self.sketch.merge(other_sketch)
+        self.counts = {value: counts[value] for value in kept}
+        self.errors = {value: errors[value] for value in kept}
+    
+    def most_common(self, n=None):
+        return sorted(self.counts.items(), key=lambda item: (-item[1], item[0]))[:n]
+
+class TagStats:
+    """
+    Single-pass tag statistics with bounded memory per key
+    
+    Tracks how many elements carry each key (coverage), how often each
+    value occurs, and how the values of CO_OCCURRENCE_KEYS combine. Feed it
+    tags with add() and combine partial results with merge().
+    """
+    
+    def __init__(self, top_k=DEFAULT_TOP_K, co_keys=CO_OCCURRENCE_KEYS):
+        self.top_k = top_k
+        self.co_keys = tuple(co_keys)
+        self.elements = 0
+        self.tagged = 0
+        self.key_counts = {}
+        self.values = {}
+        self.co_occurrence = {pair: ValueCounter(top_k) for pair in combinations(self.co_keys, 2)}
+    
+    def add(self, tags):
+        """Count one element's tags (None or {} for untagged elements)"""
+        self.elements += 1
+        if not tags:
+            tags = {}
+        else:
+            self.tagged += 1
+        for key, value in tags.items():
+            self.key_counts[key] = self.key_counts.get(key, 0) + 1
+            counter = self.values.get(key)
+            if counter is None:
+                counter = self.values[key] = ValueCounter(self.top_k)
+            counter.add(str(value))
+        for (first, second), counter in self.co_occurrence.items():
+            counter.add(f"{tags.get(first, MISSING)}|{tags.get(second, MISSING)}")
+    
+    def add_elements(self, elements):
+        for element in elements:
+            self.add(element.get('tags'))
+        return self
+    
+    def merge(self, other):
+        """Add another TagStats' counts to this one"""
+        self.elements += other.elements
+        self.tagged += other.tagged
+        for key, count in other.key_counts.items():
+            self.key_counts[key] = self.key_counts.get(key, 0) + count
+            if key in self.values:
+                self.values[key].merge(other.values[key])
+            else:
+                # Copied, so later merges never change the other stats
+                self.values[key] = copy.deepcopy(other.values[key])
+        for pair, counter in other.co_occurrence.items():
+            if pair in self.co_occurrence:
+                self.co_occurrence[pair].merge(counter)
+        return self
+    
+    def to_dict(self, top_values=None):
+        """
+        JSON-ready report
+        
+        Args:
+            top_values (int): Values listed per key (default: all tracked)
+        """
+        keys = {}
+        for key in sorted(self.key_counts, key=lambda key: (-self.key_counts[key], key)):
+            counter = self.values[key]
+            keys[key] = {
+                'count': self.key_counts[key],
+                'coverage': round(self.key_counts[key] / self.elements, 4) if self.elements else 0.0,
+                'distinct': counter.distinct(),
+                'exact': counter.exact,
+                'values': [
+                    [value, count, counter.errors[value]] if counter.errors[value] else [value, count]
+                    for value, count in counter.most_common(top_values)
+                ],
+            }
+        co_occurrence = {}
+        for (first, second), counter in self.co_occurrence.items():
+            co_occurrence[f"{first}|{second}"] = dict(counter.most_common())
+        return {
+            'elements': self.elements,
+            'tagged': self.tagged,
+            'keys': keys,
+            'co_occurrence': co_occurrence,
+        }
+
+def compute_tag_stats(file_path, top_k=DEFAULT_TOP_K):
+    """
+    Compute TagStats for a snapshot in one pass
+    
+    Overpass JSON files are streamed element by element and columnar
+    snapshots are read from their tag columns, so memory does not grow with
+    the file.
+    
+    Args:
+        file_path (str): Path to the JSON file or columnar snapshot
+        top_k (int): Values tracked exactly per key
+    
+    Returns:
+        TagStats: The statistics
+    """
+    stats = TagStats(top_k)
+    if is_snapshot(file_path):
+        with ColumnarSnapshot(file_path) as snapshot:
+            for i in range(snapshot.count):
+                stats.add(snapshot.tags(i))
+    else:
+        stats.add_elements(iter_elements(file_path))
+    return stats
+
+@instrumented()
 def extract_tags_and_values(file_path):
     """
     Extract all unique tags and their possible values from a JSON file.
     
+    Columnar snapshots are read straight from their dictionary-encoded tag
+    columns, without rebuilding the elements.
+    
     Args:
-        file_path (str): Path to the JSON file
+        file_path (str): Path to the JSON file or columnar snapshot
     
     Returns:
         dict: Dictionary with tags as keys and lists of unique values as values
     """
     try:
+        if is_snapshot(file_path):
+            return extract_tags_from_snapshot(file_path)
+        
         # Read the JSON file
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        with stage('read') as s:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            s.record(bytes_in=file_size(file_path))
         
         # Check if 'elements' key exists
         if 'elements' not in data:
@@ -29,10 +284,12 @@ def extract_tags_and_values(file_path):
         tag_values = defaultdict(set)
         
         # Process each element
-        for element in elements:
-            if 'tags' in element:
-                for tag, value in element['tags'].items():
-                    tag_values[tag].add(str(value))
+        with stage('collect') as s:
+            for element in elements:
+                if 'tags' in element:
+                    for tag, value in element['tags'].items():
+                        tag_values[tag].add(str(value))
+            s.record(elements=len(elements))
         
         # Convert sets to sorted lists for better readability
         result = {}
@@ -51,6 +308,27 @@ def extract_tags_and_values(file_path):
         print(f"Error processing file: {e}")
         return None
 
+def extract_tags_from_snapshot(file_path):
+    """
+    Extract unique tags and values from a columnar snapshot.
+    
+    Args:
+        file_path (str): Path to the columnar snapshot
+    
+    Returns:
+        dict: Dictionary with tags as keys and lists of unique values as values
+    """
+    with ColumnarSnapshot(file_path) as snapshot:
+        print(f"Processing {snapshot.count} elements...")
+        
+        # Distinct (key, value) code pairs, decoded once each
+        tag_values = defaultdict(set)
+        for key_code, value_code in set(zip(snapshot.tag_keys, snapshot.tag_values)):
+            tag_values[snapshot.keys[key_code]].add(snapshot.value(value_code))
+    
+    # Keep the key order of the first occurrence, like the JSON path does
+    return {tag: sorted(tag_values[tag]) for tag in snapshot.keys if tag in tag_values}
+
 def print_tags_summary(tag_values):
     """
     Print a summary of tags and their values.
@@ -97,34 +375,73 @@ def save_results_to_file(tag_values, output_file):
     except Exception as e:
         print(f"Error saving results: {e}")
 
+def print_tag_stats(stats, top_values=5):
+    """
+    Print key coverage, the most common values and filter co-occurrence.
+    
+    Args:
+        stats (TagStats): Statistics to print
+        top_values (int): Values shown per key
+    """
+    report = stats.to_dict(top_values)
+    print("\n" + "="*60)
+    print("TAG STATISTICS")
+    print("="*60)
+    print(f"Elements: {report['elements']} ({report['tagged']} tagged), {len(report['keys'])} keys")
+    
+    print("\nKeys sorted by coverage:")
+    print("-" * 40)
+    for key, info in report['keys'].items():
+        distinct = f"{info['distinct']}" if info['exact'] else f"~{info['distinct']}"
+        print(f"\n{key}: {info['count']} elements ({info['coverage']:.1%}), {distinct} distinct values")
+        for value, count, *error in info['values']:
+            bound = f" (±{error[0]})" if error else ""
+            print(f"  - {value}: {count}{bound}")
+    
+    for pair, counts in report['co_occurrence'].items():
+        print(f"\n{pair} combinations:")
+        for combination, count in list(counts.items())[:10]:
+            print(f"  - {combination}: {count}")
+
 def main():
     """Main function to run the script."""
-    if len(sys.argv) != 2:
-        print("Usage: python script.py <json_file_path>")
-        print("Example: python script.py toilets_norway_20250623_151225.json")
+    args = [arg for arg in enable_from_args(sys.argv)[1:] if not arg.startswith('--')]
+    if len(args) != 1:
+        print("Usage: python tags_analysis.py <json_file_path> [--stats-only]")
+        print("Example: python tags_analysis.py toilets_norway_20250623_151225.json")
+        print("  --stats-only  skip the full list of distinct values per tag (unbounded memory)")
         return
     
-    file_path = sys.argv[1]
+    file_path = args[0]
+    base_path = os.path.splitext(file_path)[0]
     
     print("JSON Tag and Value Extractor")
     print("=" * 30)
     print(f"Processing file: {file_path}")
     
-    # Extract tags and values
-    tag_values = extract_tags_and_values(file_path)
-    
-    if tag_values is None:
+    # Count keys and values in one pass
+    try:
+        stats = compute_tag_stats(file_path)
+    except FileNotFoundError:
+        print(f"Error: File '{file_path}' not found.")
+        return
+    except Exception as e:
+        print(f"Error processing file: {e}")
         return
     
-    # Print summary
-    print_tags_summary(tag_values)
+    print_tag_stats(stats)
+    save_results_to_file(stats.to_dict(), base_path + '_tag_stats.json')
     
-    # Save results to file
-    output_file = file_path.replace('.json', '_tags_analysis.json')
-    save_results_to_file(tag_values, output_file)
+    # The full list of distinct values per tag, which existing tools read
+    if '--stats-only' not in sys.argv:
+        tag_values = extract_tags_and_values(file_path)
+        if tag_values is None:
+            return
+        print_tags_summary(tag_values)
+        save_results_to_file(tag_values, base_path + '_tags_analysis.json')
     
     print("\n" + "="*60)
     print("Analysis complete!")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,84 @@
+import pytest
+
+from dedup_toilets import dedup_elements, find_duplicates
+from geo import EARTH_RADIUS_M
+
+LAT, LON = 60.0, 10.0
+DEGREES_PER_METRE = 180 / (3.141592653589793 * EARTH_RADIUS_M)
+
+
+def node(id, north_m=0.0, **tags):
+    """A toilet node north_m metres north of (LAT, LON)"""
+    return {'type': 'node', 'id': id, 'lat': LAT + north_m * DEGREES_PER_METRE, 'lon': LON,
+            'tags': {'amenity': 'toilets', **tags}}
+
+
+def building(id, **tags):
+    """A closed toilet way about 30 x 20 m around (LAT, LON)"""
+    south, north = LAT - 15 * DEGREES_PER_METRE, LAT + 15 * DEGREES_PER_METRE
+    west, east = LON - 0.0002, LON + 0.0002
+    ring = [(south, west), (north, west), (north, east), (south, east), (south, west)]
+    return {'type': 'way', 'id': id, 'nodes': [1, 2, 3, 4, 1],
+            'geometry': [{'lat': lat, 'lon': lon} for lat, lon in ring],
+            'tags': {'amenity': 'toilets', 'building': 'yes', **tags}}
+
+
+def test_find_duplicates_reports_near_and_inside_pairs():
+    elements = [node(1), node(2, north_m=6), node(3, north_m=500), building(10), node(4, north_m=13)]
+    pairs, positions = find_duplicates(elements, distance_m=10)
+
+    assert [(i, j, reason) for i, j, reason, _ in pairs] == [
+        (0, 1, 'near'), (0, 3, 'inside'), (1, 3, 'inside'), (1, 4, 'near'), (3, 4, 'inside'),
+    ]
+    assert pairs[0][3] == pytest.approx(6, abs=0.01)
+    assert positions[2] == pytest.approx((LAT + 500 * DEGREES_PER_METRE, LON))
+
+
+def test_find_duplicates_ignores_unlocated_elements():
+    elements = [node(1), {'type': 'way', 'id': 2, 'tags': {'amenity': 'toilets'}}]
+    pairs, positions = find_duplicates(elements)
+
+    assert pairs == []
+    assert positions[1] is None
+
+
+def test_dedup_merges_a_node_into_its_building():
+    elements = [node(1, north_m=12, fee='no'), building(10, wheelchair='yes')]
+    output, report = dedup_elements(elements, distance_m=10)
+
+    assert len(output) == 1
+    assert output[0]['type'] == 'way'
+    assert output[0]['tags']['fee'] == 'no'
+    assert output[0]['tags']['wheelchair'] == 'yes'
+    assert report['links'] == {'inside': 1}
+    assert report['merged'][0]['members'] == ['node/1', 'way/10']
+
+
+def test_dedup_does_not_chain_a_row_of_toilets():
+    elements = [node(1), node(2, north_m=8), node(3, north_m=16), node(4, north_m=24)]
+    output, report = dedup_elements(elements, distance_m=10)
+
+    assert [el['id'] for el in output] == [1, 3]
+    assert all(cluster['extent_m'] <= 10 for cluster in report['merged'])
+    assert [link['refused'] for link in report['refused']] == ['extent']
+
+
+def test_dedup_keeps_differently_named_toilets_apart():
+    elements = [node(1, name='Herrer'), node(2, north_m=3, name='Damer'), node(3, north_m=5)]
+    output, report = dedup_elements(elements, distance_m=10)
+
+    assert len(output) == 2
+    assert [(link['a'], link['b'], link['refused']) for link in report['refused']] == [
+        ('node/1', 'node/2', 'tags'), ('node/2', 'node/3', 'tags'),
+    ]
+    assert report['merged'][0]['members'] == ['node/1', 'node/3']
+    assert report['merged'][0]['conflicts'] == {}
+
+
+def test_dedup_reports_conflicting_tags():
+    elements = [node(1, fee='yes', opening_hours='24/7'), node(2, north_m=2, fee='no')]
+    output, report = dedup_elements(elements, distance_m=10)
+
+    assert len(output) == 1
+    assert report['merged'][0]['conflicts'] == {'fee': {'node/1': 'yes', 'node/2': 'no'}}
+    assert output[0]['tags'] == {'amenity': 'toilets', 'fee': 'yes', 'opening_hours': '24/7'}
@@ -0,0 +1,141 @@
+import json
+
+import pytest
+
+from fake_overpass import FakeOverpassServer
+from fetch_toilets import fetch_toilet_data_tiled, merge_snapshots, refresh_snapshot, split_bbox
+from overpass_client import OverpassClient, OverpassError
+
+BBOX = (59.0, 10.0, 60.0, 11.0)
+OSM_BASE = '2025-06-01T00:00:00Z'
+
+
+def node(id, lat, lon, timestamp='2025-01-01T00:00:00Z', **tags):
+    return {'type': 'node', 'id': id, 'lat': lat, 'lon': lon, 'timestamp': timestamp,
+            'tags': {'amenity': 'toilets', **tags}}
+
+
+def document(elements):
+    return {'version': 0.6, 'generator': 'test', 'osm3s': {'timestamp_osm_base': OSM_BASE},
+            'elements': elements}
+
+
+def grid_nodes(count):
+    """Nodes spread over BBOX, so every quarter of it holds some"""
+    return [node(i + 1, 59.01 + 0.98 * (i % 5) / 4, 10.01 + 0.98 * (i // 5) / 4) for i in range(count)]
+
+
+def client_for(*urls):
+    return OverpassClient(endpoints=list(urls), max_retries=3, backoff=0, max_backoff=0)
+
+
+def test_split_bbox_covers_the_bbox_without_gaps():
+    tiles = split_bbox(BBOX, 2, 4)
+
+    assert len(tiles) == 8
+    assert tiles[0] == (59.0, 10.0, 59.5, 10.25)
+    assert tiles[-1] == (59.5, 10.75, 60.0, 11.0)
+    area = sum((north - south) * (east - west) for south, west, north, east in tiles)
+    assert area == pytest.approx(1.0)
+
+
+def test_merge_snapshots_dedups_and_keeps_oldest_base():
+    way = {'type': 'way', 'id': 1, 'tags': {'amenity': 'toilets'}}
+    first = {'osm3s': {'timestamp_osm_base': '2025-06-02T00:00:00Z'}, 'elements': [node(2, 59.1, 10.1), way]}
+    second = {'osm3s': {'timestamp_osm_base': OSM_BASE}, 'elements': [way, node(1, 59.2, 10.2)]}
+
+    merged = merge_snapshots([first, second])
+
+    assert merged['osm3s']['timestamp_osm_base'] == OSM_BASE
+    assert [(el['type'], el['id']) for el in merged['elements']] == [('node', 1), ('node', 2), ('way', 1)]
+
+
+def test_tiled_fetch_splits_tiles_that_run_out_of_memory(tmp_path):
+    elements = grid_nodes(25)
+    with FakeOverpassServer(document(elements), max_elements=10) as server:
+        output_file, data = fetch_toilet_data_tiled(
+            bbox=BBOX, output_file=str(tmp_path / 'toilets.json'), rows=1, cols=1,
+            max_workers=2, min_tile_size=0.1, client=client_for(server.url)
+        )
+
+    assert output_file == str(tmp_path / 'toilets.json')
+    assert sorted(el['id'] for el in data['elements']) == [el['id'] for el in elements]
+    assert len(server.queries) > 1
+    with open(output_file, encoding='utf-8') as f:
+        assert json.load(f)['elements'] == data['elements']
+
+
+def test_tiled_fetch_gives_up_on_tiles_too_small_to_split(tmp_path):
+    with FakeOverpassServer(document(grid_nodes(25)), max_elements=0) as server:
+        output_file, data = fetch_toilet_data_tiled(
+            bbox=BBOX, output_file=str(tmp_path / 'toilets.json'), rows=2, cols=2,
+            min_tile_size=0.3, client=client_for(server.url)
+        )
+
+    assert (output_file, data) == (None, None)
+    assert not (tmp_path / 'toilets.json').exists()
+
+
+def test_refresh_applies_added_modified_and_deleted_elements(tmp_path):
+    kept = node(1, 59.1, 10.1)
+    modified = node(2, 59.2, 10.2)
+    deleted = node(3, 59.3, 10.3)
+    snapshot_file = tmp_path / 'snapshot.json'
+    snapshot_file.write_text(json.dumps(document([kept, modified, deleted])), encoding='utf-8')
+
+    changed = node(2, 59.2, 10.2, timestamp='2025-06-10T00:00:00Z', fee='no')
+    added = node(4, 59.4, 10.4, timestamp='2025-06-11T00:00:00Z')
+    current = {**document([kept, changed, added]), 'osm3s': {'timestamp_osm_base': '2025-06-12T00:00:00Z'}}
+
+    with FakeOverpassServer(current) as server:
+        output_file, data = refresh_snapshot(
+            str(snapshot_file), bbox=BBOX, output_file=str(tmp_path / 'refreshed.json'),
+            client=client_for(server.url)
+        )
+
+    assert f'newer:"{OSM_BASE}"' in server.queries[0]
+    assert data['elements'] == [kept, changed, added]
+    assert data['osm3s']['timestamp_osm_base'] == '2025-06-12T00:00:00Z'
+    with open(output_file, encoding='utf-8') as f:
+        assert json.load(f) == data
+
+
+def test_refresh_refuses_a_truncated_answer(tmp_path):
+    snapshot_file = tmp_path / 'snapshot.json'
+    snapshot_file.write_text(json.dumps(document([node(1, 59.1, 10.1)])), encoding='utf-8')
+
+    with FakeOverpassServer(document([node(1, 59.1, 10.1)]), max_elements=0) as server:
+        result = refresh_snapshot(str(snapshot_file), bbox=BBOX, output_file=str(tmp_path / 'refreshed.json'),
+                                  client=client_for(server.url))
+
+    assert result == (None, None)
+    assert not (tmp_path / 'refreshed.json').exists()
+
+
+def test_client_fails_over_to_the_next_endpoint():
+    with FakeOverpassServer(document([]), errors=[503]) as busy, \
+            FakeOverpassServer(document([node(1, 59.1, 10.1)])) as healthy:
+        client = client_for(busy.url, healthy.url)
+        response = client.post('[out:json]; node; out;')
+
+        assert response.json()['elements'][0]['id'] == 1
+        assert client.endpoint == healthy.url
+        assert len(busy.queries) == 1
+
+
+def test_client_fails_over_when_an_endpoint_is_unreachable():
+    with FakeOverpassServer(document([node(1, 59.1, 10.1)])) as healthy:
+        client = client_for('http://127.0.0.1:1/api/interpreter', healthy.url)
+        response = client.post('[out:json]; node; out;')
+
+        assert response.status_code == 200
+        assert client.endpoint == healthy.url
+
+
+def test_client_raises_once_retries_are_used_up():
+    with FakeOverpassServer(document([]), errors=[429, 502, 503, 504]) as server:
+        with pytest.raises(OverpassError) as error:
+            client_for(server.url).post('[out:json]; node; out;')
+
+    assert error.value.status_code == 504
+    assert len(server.queries) == 4
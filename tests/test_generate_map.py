@@ -0,0 +1,57 @@
+import json
+import re
+import shutil
+import subprocess
+
+import pytest
+
+from generate_map import generate_toilet_map
+
+# Stand-ins for Leaflet and the DOM: every property and call returns another
+# stand-in, the filter dropdowns read 'all' and L.marker is counted
+BROWSER_STUB = '''
+const stub = () => new Proxy(function () {}, {
+    get: (target, prop) => prop === Symbol.toPrimitive ? () => '' : prop === 'then' ? undefined : stub(),
+    apply: () => stub(),
+    construct: () => stub(),
+});
+let markersCreated = 0;
+const L = new Proxy(stub(), {
+    get: (target, prop) => prop === 'marker' ? (...args) => { markersCreated++; return stub(); } : stub(),
+});
+const element = () => new Proxy(stub(), {get: (target, prop) => prop === 'value' ? 'all' : stub()});
+const document = {getElementById: element, querySelector: element, querySelectorAll: () => [],
+                  createElement: element, addEventListener: () => {}};
+const window = stub();
+'''
+
+REPORT = '''
+console.log(JSON.stringify({markersCreated, markers: markers.length, filtered: filteredToilets.length}));
+'''
+
+
+def node(id, lat, lon, **tags):
+    return {'type': 'node', 'id': id, 'lat': lat, 'lon': lon, 'tags': {'amenity': 'toilets', **tags}}
+
+
+@pytest.mark.skipif(not shutil.which('node'), reason='needs node to run the page script')
+def test_default_map_script_adds_a_marker_per_toilet(tmp_path):
+    snapshot = tmp_path / 'toilets.json'
+    snapshot.write_text(json.dumps({
+        'osm3s': {'timestamp_osm_base': '2025-06-23T13:11:31Z'},
+        'elements': [node(1, 59.91, 10.75, wheelchair='yes', fee='no'),
+                     node(2, 59.92, 10.76, fee='yes', charge='10 nok'),
+                     node(3, 59.93, 10.77, opening_hours='24/7')],
+    }), encoding='utf-8')
+    output_file = generate_toilet_map(str(snapshot), str(tmp_path / 'map.html'))
+
+    html = (tmp_path / 'map.html').read_text(encoding='utf-8')
+    page_script = [body for attrs, body in re.findall(r'<script([^>]*)>(.*?)</script>', html, re.S)
+                   if 'src=' not in attrs][-1]
+    script = tmp_path / 'page.js'
+    script.write_text(BROWSER_STUB + page_script + REPORT, encoding='utf-8')
+    result = subprocess.run(['node', str(script)], capture_output=True, text=True, timeout=60)
+
+    assert output_file == str(tmp_path / 'map.html')
+    assert result.returncode == 0, result.stderr
+    assert json.loads(result.stdout.strip().splitlines()[-1]) == {'markersCreated': 3, 'markers': 3, 'filtered': 3}
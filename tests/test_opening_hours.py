@@ -0,0 +1,91 @@
+from datetime import datetime
+
+import pytest
+
+from opening_hours import LOCAL_TIMEZONE, OpeningHoursIndex, Rule, compile_opening_hours, parse_rules
+from toilet_filters import bitset_of
+
+
+def at(day, time):
+    """Local datetime in the week of Monday 2025-06-23 ('mo' .. 'su'), or on an ISO date"""
+    weekdays = ['mo', 'tu', 'we', 'th', 'fr', 'sa', 'su']
+    date = f'2025-06-{23 + weekdays.index(day):02d}' if day in weekdays else day
+    return datetime.fromisoformat(f'{date}T{time}').replace(tzinfo=LOCAL_TIMEZONE)
+
+
+def test_parse_rules_reads_days_spans_and_states():
+    assert parse_rules('Mo-Fr 08:00-16:00; Su off') == [
+        Rule(None, (0, 1, 2, 3, 4), ((480, 960),), True, False),
+        Rule(None, (6,), None, False, False),
+    ]
+
+
+def test_parse_rules_joins_day_lists_and_extra_spans():
+    assert parse_rules('Sa, Su 10:00-18:00') == [Rule(None, (5, 6), ((600, 1080),), True, False)]
+    assert parse_rules('Sa 00:00-01:00, 09:30-24:00') == [
+        Rule(None, (5,), ((0, 60), (570, 1440)), True, False)
+    ]
+
+
+def test_parse_rules_skips_holiday_only_rules():
+    assert parse_rules('Mo-Su 06:00-22:00; PH off') == [
+        Rule(None, tuple(range(7)), ((360, 1320),), True, False)
+    ]
+    assert parse_rules('Sa,Su,PH 10:00-14:00')[0].days == (5, 6)
+
+
+@pytest.mark.parametrize('text', ['', 'Summer', 'unknown', 'Mo-Fr 25:00-26:00', '24/7 Mo-Fr', 'PH-SH off'])
+def test_parse_rules_rejects_what_it_cannot_read(text):
+    with pytest.raises(ValueError):
+        parse_rules(text)
+
+
+@pytest.mark.parametrize('text, when, expected', [
+    ('24/7', at('su', '03:00'), True),
+    ('Mo-Fr 08:00-16:00', at('mo', '08:00'), True),
+    ('Mo-Fr 08:00-16:00', at('fr', '16:00'), False),
+    ('Mo-Fr 08:00-16:00', at('sa', '12:00'), False),
+    ('Mo-Su 08:00-22:00; We off', at('we', '12:00'), False),
+    ('Mo-Su 08:00-22:00; We 10:00-12:00', at('we', '09:00'), False),
+    ('Mo-Su 08:00-22:00; We 10:00-12:00', at('we', '11:00'), True),
+    ('Fr-Sa 20:00-03:00', at('sa', '02:30'), True),
+    ('Fr-Sa 20:00-03:00', at('fr', '02:30'), False),
+    ('Su 22:00-02:00', at('mo', '01:00'), True),
+    ('Mo-Fr 08:00-12:00, 13:00-16:00', at('tu', '12:30'), False),
+    ('Mo-Fr 08:00-12:00, 13:00-16:00', at('tu', '13:30'), True),
+    ('May-Oct 00:00-24:00', at('2025-07-01', '12:00'), True),
+    ('May-Oct 00:00-24:00', at('2025-11-01', '12:00'), False),
+    ('08:00-20:00; Nov-Mar off', at('2025-12-01', '12:00'), False),
+    ('08:00-20:00; Nov-Mar off', at('2025-06-02', '12:00'), True),
+    ('week 20-35: Mo-Su 07:00-23:00', at('2025-06-23', '12:00'), True),
+    ('week 20-35: Mo-Su 07:00-23:00', at('2025-01-06', '12:00'), False),
+    ('off; SH 24/7', at('mo', '12:00'), False),
+    ('unknown', at('mo', '12:00'), False),
+])
+def test_is_open(text, when, expected):
+    assert compile_opening_hours(text).is_open(when) is expected
+
+
+def test_later_rules_override_earlier_ones():
+    assert compile_opening_hours('Nov-Mar off; 08:00-20:00').is_open(at('2025-12-01', '12:00'))
+
+
+def test_compiled_hours_are_shared():
+    assert compile_opening_hours('Mo-Fr 08:00-16:00') is compile_opening_hours('Mo-Fr 08:00-16:00')
+
+
+def test_index_open_at_combines_groups():
+    toilets = [
+        {'tags': {'opening_hours': '24/7'}},
+        {'tags': {'opening_hours': 'Mo-Fr 08:00-16:00'}},
+        {'tags': {}},
+        {'tags': {'opening_hours': 'Summer'}},
+        {'tags': {'opening_hours': '24/7'}},
+    ]
+    index = OpeningHoursIndex.from_toilets(toilets)
+
+    assert index.size == 5
+    assert index.open_at(at('mo', '09:00')) == bitset_of([0, 1, 4], 5)
+    assert index.open_at(at('sa', '09:00')) == bitset_of([0, 4], 5)
+    assert index.unparsed == bitset_of([3], 5)
+    assert index.known == bitset_of([0, 1, 4], 5)
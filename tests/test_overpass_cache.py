@@ -0,0 +1,80 @@
+import json
+
+from fake_overpass import FakeOverpassServer
+from overpass_cache import ResponseCache, query_overpass
+from overpass_client import OverpassClient
+
+QUERY = '[out:json][timeout:25]; node["amenity"="toilets"](bbox:59.0,10.0,60.0,11.0); out geom;'
+DATA = {
+    'osm3s': {'timestamp_osm_base': '2025-06-23T13:11:31Z'},
+    'elements': [{'type': 'node', 'id': 1, 'lat': 59.5, 'lon': 10.5, 'tags': {'amenity': 'toilets'}}],
+}
+
+
+def client_for(server):
+    return OverpassClient(endpoints=[server.url], max_retries=0)
+
+
+def test_fresh_entry_is_served_without_a_request(tmp_path):
+    cache = ResponseCache(str(tmp_path), ttl=3600, region_ttls={})
+    with FakeOverpassServer(DATA) as server:
+        client = client_for(server)
+        body, source = query_overpass(client, QUERY, 'test', cache)
+        cached, cached_source = query_overpass(client, QUERY, 'test', cache)
+
+    assert (source, cached_source) == ('network', 'cache')
+    assert cached == body
+    assert json.loads(body)['elements'] == DATA['elements']
+    assert len(server.queries) == 1
+
+
+def test_stale_entry_is_revalidated_with_its_etag(tmp_path):
+    cache = ResponseCache(str(tmp_path), ttl=0, region_ttls={})
+    with FakeOverpassServer(DATA, etag='"v1"') as server:
+        client = client_for(server)
+        body, source = query_overpass(client, QUERY, 'test', cache)
+        stored = cache.get(QUERY, client.endpoint).meta['stored']
+        revalidated, revalidated_source = query_overpass(client, QUERY, 'test', cache)
+
+    assert (source, revalidated_source) == ('network', 'revalidated')
+    assert revalidated == body
+    assert len(server.queries) == 2
+    assert cache.get(QUERY, client.endpoint).meta['stored'] >= stored
+
+
+def test_changed_etag_downloads_again(tmp_path):
+    cache = ResponseCache(str(tmp_path), ttl=0, region_ttls={})
+    with FakeOverpassServer(DATA, etag='"v1"') as server:
+        client = client_for(server)
+        query_overpass(client, QUERY, 'test', cache)
+        server.etag = '"v2"'
+        server.data = {**DATA, 'elements': []}
+        body, source = query_overpass(client, QUERY, 'test', cache)
+
+    assert source == 'network'
+    assert json.loads(body)['elements'] == []
+    assert cache.get(QUERY, client.endpoint).meta['etag'] == '"v2"'
+
+
+def test_revalidated_entry_streams_to_a_file(tmp_path):
+    cache = ResponseCache(str(tmp_path / 'cache'), ttl=0, region_ttls={})
+    with FakeOverpassServer(DATA, etag='"v1"') as server:
+        client = client_for(server)
+        query_overpass(client, QUERY, 'test', cache, output_file=str(tmp_path / 'first.json'))
+        body, source = query_overpass(client, QUERY, 'test', cache, output_file=str(tmp_path / 'second.json'))
+
+    assert (body, source) == (None, 'revalidated')
+    assert (tmp_path / 'second.json').read_bytes() == (tmp_path / 'first.json').read_bytes()
+
+
+def test_entry_is_filed_under_the_endpoint_that_answered(tmp_path):
+    cache = ResponseCache(str(tmp_path), ttl=3600, region_ttls={})
+    with FakeOverpassServer(DATA, errors=[503]) as primary, FakeOverpassServer(DATA) as backup:
+        client = OverpassClient(endpoints=[primary.url, backup.url], max_retries=2, backoff=0, max_backoff=0)
+        _, source = query_overpass(client, QUERY, 'test', cache)
+        _, cached_source = query_overpass(client, QUERY, 'test', cache)
+
+    assert (source, cached_source) == ('network', 'cache')
+    assert cache.get(QUERY, backup.url) is not None
+    assert cache.get(QUERY, primary.url) is None
+    assert len(backup.queries) == 1
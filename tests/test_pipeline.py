@@ -0,0 +1,36 @@
+import ast
+import os
+
+import pytest
+
+from pipeline import default_stages
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Imported by the stage code without shaping its output
+NOT_OUTPUT = {'instrumentation.py', 'overpass_stream.py', 'snapshot_catalog.py'}
+
+
+def local_imports(module, seen=None):
+    """module and every repository module it imports, directly or not"""
+    seen = set() if seen is None else seen
+    seen.add(module)
+    for node in ast.walk(ast.parse(open(os.path.join(ROOT, module), encoding='utf-8').read())):
+        if isinstance(node, ast.ImportFrom) and node.module:
+            names = [node.module]
+        elif isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        else:
+            continue
+        for name in names:
+            path = name + '.py'
+            if path not in seen and os.path.exists(os.path.join(ROOT, path)):
+                local_imports(path, seen)
+    return seen
+
+
+@pytest.mark.parametrize('stage_name, entry', [('toilets', 'build_toilets.py'), ('map', 'generate_map.py')])
+def test_stage_cache_key_covers_the_code_it_runs(stage_name, entry):
+    stage = {stage.name: stage for stage in default_stages('toilets_norway.json')}[stage_name]
+
+    assert local_imports(entry) - NOT_OUTPUT <= set(stage.modules)
@@ -0,0 +1,55 @@
+import json
+
+from snapshot_format import (ColumnarSnapshot, is_snapshot, json_to_snapshot, load_snapshot,
+                             snapshot_to_json, write_snapshot)
+
+DATA = {
+    'version': 0.6,
+    'generator': 'Overpass API 0.7.62.7 375dc00a',
+    'osm3s': {'timestamp_osm_base': '2025-06-23T13:11:31Z', 'copyright': 'ODbL'},
+    'elements': [
+        {'type': 'node', 'id': 1, 'lat': 59.9138688, 'lon': 10.7522454,
+         'tags': {'amenity': 'toilets', 'fee': 'yes', 'charge': '10 NOK'}},
+        {'type': 'node', 'id': 2, 'lat': -33.5, 'lon': -70.25},
+        {'type': 'node', 'id': 3, 'lat': 60.0, 'lon': 11.0, 'tags': {}},
+        {'type': 'way', 'id': 9007199254740993, 'tags': {'amenity': 'toilets', 'name': 'Toalett Ø'},
+         'bounds': {'minlat': 59.9, 'minlon': 10.7, 'maxlat': 59.91, 'maxlon': 10.71},
+         'nodes': [10, 11, 12, 10],
+         'geometry': [{'lat': 59.9, 'lon': 10.7}, {'lat': 59.91, 'lon': 10.7},
+                      {'lat': 59.91, 'lon': 10.71}, {'lat': 59.9, 'lon': 10.7}]},
+        {'type': 'relation', 'id': 5, 'tags': {'amenity': 'toilets'},
+         'members': [{'type': 'way', 'ref': 9007199254740993, 'role': 'outer'}]},
+    ],
+}
+
+
+def test_write_and_load_round_trip(tmp_path):
+    path = str(tmp_path / 'toilets.tsnap')
+    write_snapshot(DATA, path)
+
+    assert is_snapshot(path)
+    assert load_snapshot(path) == DATA
+
+
+def test_json_conversion_round_trip(tmp_path):
+    json_path = tmp_path / 'toilets.json'
+    json_path.write_text(json.dumps(DATA), encoding='utf-8')
+
+    snapshot_path = json_to_snapshot(str(json_path))
+    back_path = snapshot_to_json(snapshot_path, str(tmp_path / 'back.json'))
+
+    assert snapshot_path == str(tmp_path / 'toilets.tsnap')
+    assert not is_snapshot(str(json_path))
+    with open(back_path, encoding='utf-8') as f:
+        assert json.load(f) == DATA
+
+
+def test_columnar_snapshot_reads_single_elements(tmp_path):
+    path = str(tmp_path / 'toilets.tsnap')
+    write_snapshot(DATA, path)
+
+    with ColumnarSnapshot(path) as snapshot:
+        assert snapshot.type_name(3) == 'way'
+        assert snapshot.tags(3) == DATA['elements'][3]['tags']
+        assert snapshot.element(1) == DATA['elements'][1]
+        assert list(snapshot.iter_elements()) == DATA['elements']
@@ -0,0 +1,78 @@
+import random
+
+import pytest
+
+from spatial_index import SpatialIndex, linear_nearest, linear_within_radius
+
+
+@pytest.fixture(scope='module')
+def points():
+    """Toilets scattered over Norway plus a cluster near the pole and the antimeridian"""
+    rng = random.Random(7)
+    points = [(i, 'node' if i % 3 else 'way', 1000 + i, rng.uniform(57.9, 71.2), rng.uniform(4.5, 31.1))
+              for i in range(1500)]
+    points += [(len(points) + i, 'node', 5000 + i, rng.uniform(89.0, 90.0), rng.uniform(-180.0, 180.0))
+               for i in range(100)]
+    points += [(len(points) + i, 'node', 6000 + i, rng.uniform(-1.0, 1.0), rng.choice((-179.99, 179.99)))
+               for i in range(50)]
+    return points
+
+
+@pytest.fixture(scope='module')
+def index(points):
+    return SpatialIndex.from_points(points)
+
+
+QUERIES = [(59.91, 10.75), (69.65, 18.96), (78.2, 15.6), (89.9, 45.0), (0.0, 180.0), (0.5, -179.9)]
+
+
+@pytest.mark.parametrize('lat, lon', QUERIES)
+def test_nearest_matches_linear_scan(index, points, lat, lon):
+    expected = linear_nearest(points, lat, lon, k=10)
+    found = index.nearest(lat, lon, k=10)
+
+    assert [hit.distance_m for hit in found] == pytest.approx([distance for distance, _ in expected])
+    assert [hit.element_index for hit in found] == [point[0] for _, point in expected]
+
+
+@pytest.mark.parametrize('lat, lon', QUERIES)
+def test_within_radius_matches_linear_scan(index, points, lat, lon):
+    expected = linear_within_radius(points, lat, lon, 150_000)
+    found = index.within_radius(lat, lon, 150_000)
+
+    assert sorted(hit.element_index for hit in found) == sorted(point[0] for point in expected)
+    assert [hit.distance_m for hit in found] == sorted(hit.distance_m for hit in found)
+
+
+def test_nearest_with_accept_skips_rejected_points(index, points):
+    ways = [point for point in points if point[1] == 'way']
+    expected = linear_nearest(ways, 63.43, 10.39, k=5)
+    found = index.nearest(63.43, 10.39, k=5, accept=lambda i: points[i][1] == 'way')
+
+    assert [hit.element_index for hit in found] == [point[0] for _, point in expected]
+    assert all(hit.type == 'way' for hit in found)
+
+
+def test_in_bbox_matches_linear_scan(index, points):
+    found = index.in_bbox(59.0, 9.0, 61.5, 12.0)
+
+    assert sorted(hit.element_index for hit in found) == sorted(
+        point[0] for point in points if 59.0 <= point[3] <= 61.5 and 9.0 <= point[4] <= 12.0
+    )
+
+
+def test_save_and_load_answer_the_same(index, tmp_path):
+    path = str(tmp_path / 'toilets.tsidx')
+    index.save(path)
+    loaded = SpatialIndex.load(path)
+
+    assert len(loaded) == len(index)
+    for lat, lon in QUERIES:
+        assert loaded.nearest(lat, lon, k=5) == index.nearest(lat, lon, k=5)
+
+
+def test_empty_index():
+    index = SpatialIndex.from_points([])
+
+    assert index.nearest(59.91, 10.75, k=3) == []
+    assert index.within_radius(59.91, 10.75, 1000) == []
@@ -0,0 +1,57 @@
+import json
+import os
+
+from pipeline import _copy
+from static_assets import copy_published, is_published, load_manifest, publish
+
+
+def published_files(directory):
+    return sorted(name for name in os.listdir(directory) if name != 'manifest.json')
+
+
+def test_publish_keeps_the_previous_generation(tmp_path):
+    first = publish({'toilets.json': b'{"v": 1}'}, str(tmp_path))['assets']['toilets.json']['file']
+    second = publish({'toilets.json': b'{"v": 2}'}, str(tmp_path))['assets']['toilets.json']['file']
+    third = publish({'toilets.json': b'{"v": 3}'}, str(tmp_path))['assets']['toilets.json']['file']
+
+    assert first != second != third
+    assert published_files(tmp_path) == sorted([second, second + '.gz', third, third + '.gz'])
+    assert load_manifest(str(tmp_path))['assets']['toilets.json']['file'] == third
+
+
+def test_publish_keeps_the_current_file_over_newer_orphans(tmp_path):
+    current = publish({'toilets.json': b'{"v": 1}'}, str(tmp_path))['assets']['toilets.json']['file']
+    (tmp_path / 'toilets.0123456789ab.json').write_bytes(b'{"orphan": true}')
+    os.utime(tmp_path / current, (0, 0))
+
+    latest = publish({'toilets.json': b'{"v": 2}'}, str(tmp_path))['assets']['toilets.json']['file']
+
+    assert published_files(tmp_path) == sorted([current, current + '.gz', latest, latest + '.gz'])
+
+
+def test_copy_published_merges_into_the_destination(tmp_path):
+    live, build = str(tmp_path / 'live'), str(tmp_path / 'build')
+    old = publish({'toilets.json': b'{"v": 1}'}, live)['assets']['toilets.json']
+    new = publish({'toilets.json': b'{"v": 2}'}, build)['assets']['toilets.json']
+    assert not is_published(build, live)
+
+    manifest = copy_published(build, live)
+
+    assert manifest['assets']['toilets.json'] == new
+    assert is_published(build, live)
+    assert published_files(live) == sorted([old['file'], old['file'] + '.gz', new['file'], new['file'] + '.gz'])
+    with open(os.path.join(live, 'manifest.json'), encoding='utf-8') as f:
+        assert json.load(f) == manifest
+
+
+def test_pipeline_copy_does_not_wipe_published_assets(tmp_path):
+    live = str(tmp_path / 'live')
+    old = publish({'toilets.json': b'{"v": 1}'}, live)['assets']['toilets.json']['file']
+    for version in (2, 3):
+        build = str(tmp_path / f'build{version}')
+        publish({'toilets.json': json.dumps({'v': version}).encode()}, build)
+        _copy(build, live)
+
+    assert old not in published_files(live)
+    assert len(published_files(live)) == 4
+    assert is_published(str(tmp_path / 'build3'), live)
@@ -0,0 +1,119 @@
+import asyncio
+import json
+
+import pytest
+
+from toilet_service import QueryError, ServiceState, ToiletService, answer_query
+
+
+def node(id, lat, lon, **tags):
+    return {'type': 'node', 'id': id, 'lat': lat, 'lon': lon, 'tags': {'amenity': 'toilets', **tags}}
+
+
+@pytest.fixture
+def state(tmp_path):
+    snapshot = tmp_path / 'toilets_oslo_20250623_151209.json'
+    snapshot.write_text(json.dumps({
+        'osm3s': {'timestamp_osm_base': '2025-06-23T13:11:31Z'},
+        'elements': [
+            node(1, 59.9100, 10.7500, opening_hours='Mo-Fr 08:00-16:00'),
+            node(2, 59.9101, 10.7501, opening_hours='24/7', wheelchair='yes'),
+            node(3, 59.9102, 10.7502, opening_hours='Summer'),
+            node(4, 59.9103, 10.7503),
+        ],
+    }), encoding='utf-8')
+    return ServiceState(str(snapshot))
+
+
+def query(state, path, **params):
+    return answer_query(state, path, {name: [value] for name, value in params.items()})
+
+
+def ids(body):
+    return sorted(result['id'] for result in body['results'])
+
+
+def test_open_leaves_out_unknown_hours(state):
+    status, body = query(state, '/nearest', lat='59.91', lon='10.75', n='10', open='2025-06-28T12:00')
+
+    assert status == 200
+    assert ids(body) == [2]
+    assert body['results'][0]['open'] is True
+
+
+def test_include_unknown_marks_unknown_hours(state):
+    status, body = query(state, '/nearest', lat='59.91', lon='10.75', n='10', open='2025-06-28T12:00',
+                         include_unknown='true')
+
+    assert ids(body) == [2, 3, 4]
+    assert {result['id']: result['open'] for result in body['results']} == {2: True, 3: None, 4: None}
+
+
+def test_include_unknown_combines_with_filters(state):
+    _, body = query(state, '/radius', lat='59.91', lon='10.75', r='1000', open='2025-06-23T09:00',
+                    include_unknown='1', wheelchair='yes')
+
+    assert ids(body) == [2]
+
+
+def test_results_without_open_have_no_open_field(state):
+    _, body = query(state, '/bbox', south='59.9', west='10.7', north='60', east='10.8')
+
+    assert ids(body) == [1, 2, 3, 4]
+    assert all('open' not in result for result in body['results'])
+
+
+def test_health_counts_known_and_unparsed_hours(state):
+    status, body = query(state, '/health')
+
+    assert status == 200
+    assert body['opening_hours'] == {'known': 2, 'unparsed': 1}
+
+
+def test_bad_include_unknown_is_rejected(state):
+    with pytest.raises(QueryError):
+        query(state, '/nearest', lat='59.91', lon='10.75', open='now', include_unknown='maybe')
+
+
+def test_unfiltered_queries_build_no_predicate(state, monkeypatch):
+    def predicate(bits):
+        raise AssertionError("predicate built for an unfiltered query")
+    monkeypatch.setattr(state.filters, 'predicate', predicate)
+
+    _, body = query(state, '/nearest', lat='59.91', lon='10.75', n='10')
+
+    assert ids(body) == [1, 2, 3, 4]
+
+
+def exchange(state, request):
+    """Send raw bytes to a ToiletService serving state and return the status line"""
+    async def run():
+        service = ToiletService(state.snapshot_path)
+        service.state = state
+        server = await asyncio.start_server(service.handle_connection, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(request)
+            await writer.drain()
+            status_line = await reader.readline()
+            writer.close()
+        return status_line.decode('latin-1').strip()
+    return asyncio.run(run())
+
+
+def test_service_answers_a_request(state):
+    assert exchange(state, b'GET /health HTTP/1.1\r\nConnection: close\r\n\r\n') == 'HTTP/1.1 200 OK'
+
+
+@pytest.mark.parametrize('length', [10_000, 100_000])
+def test_service_rejects_a_long_request_line(state, length):
+    request = b'GET /nearest?lat=59.91&lon=10.75&pad=' + b'x' * length + b' HTTP/1.1\r\n\r\n'
+
+    assert exchange(state, request) == 'HTTP/1.1 414 URI Too Long'
+
+
+def test_service_rejects_a_long_header(state):
+    request = b'GET /health HTTP/1.1\r\nCookie: ' + b'x' * 100_000 + b'\r\n\r\n'
+
+    assert exchange(state, request) == 'HTTP/1.1 431 Request Header Fields Too Large'
@@ -0,0 +1,172 @@
+import base64
+
+# Filter name -> accepted values ('all' disables the filter). Access takes
+# any OSM access value.
+FILTER_CHOICES = {
+    'wheelchair': ('all', 'yes', 'no', 'limited'),
+    'fee': ('all', 'free', 'paid'),
+    'access': None,
+}
+
+
+def validate_filters(wheelchair='all', fee='all', access='all'):
+    """Raise ValueError for filter values the map does not offer"""
+    for name, value in (('wheelchair', wheelchair), ('fee', fee)):
+        if value not in FILTER_CHOICES[name]:
+            choices = ', '.join(FILTER_CHOICES[name])
+            raise ValueError(f"Invalid {name} filter '{value}', expected one of: {choices}")
+    if not access:
+        raise ValueError("Empty access filter")
+
+
+def matches_filters(tags, wheelchair='all', fee='all', access='all'):
+    """
+    Check an element's tags against the map's filters
+
+    The semantics mirror filterToilets() in the page written by
+    generate_map.py, so the service returns the same toilets the map shows.
+
+    Args:
+        tags: The element's tags dict
+        wheelchair: 'all', 'yes', 'no' (anything but yes) or 'limited'
+        fee: 'all', 'free' (anything but fee=yes) or 'paid'
+        access: 'all' or an exact access value such as 'customers'
+    """
+    if wheelchair == 'yes' and tags.get('wheelchair') != 'yes':
+        return False
+    if wheelchair == 'no' and tags.get('wheelchair') == 'yes':
+        return False
+    if wheelchair == 'limited' and tags.get('wheelchair') != 'limited':
+        return False
+
+    if fee == 'free' and tags.get('fee') == 'yes':
+        return False
+    if fee == 'paid' and tags.get('fee') != 'yes':
+        return False
+
+    if access != 'all' and tags.get('access') != access:
+        return False
+
+    return True
+
+
+# Attributes the build precomputes bitsets for, one per value seen
+BITSET_KEYS = ('wheelchair', 'fee', 'access', 'changing_table', 'unisex')
+
+
+def toilet_value(toilet, key):
+    """A toilet's value for key, from its tags or a normalized field of build_toilets.py"""
+    tags = toilet.get('tags') or {}
+    return tags.get(key, toilet.get(key))
+
+
+def bitset_of(indices, size):
+    """
+    The int bitset with the given bits set, built in one pass
+
+    OR-ing 1 << i into an int per toilet copies the whole int each time,
+    which is quadratic in the number of toilets.
+    """
+    data = bytearray((size + 7) // 8)
+    for i in indices:
+        data[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(data, 'little')
+
+
+class FilterIndex:
+    """
+    Bitsets of the toilets carrying each attribute value
+
+    Bit i of a bitset stands for the i-th toilet of the payload. Bitsets
+    are plain ints, so any filter combines them with & (AND), | (OR) and
+    invert() in a few word operations instead of a pass over every toilet.
+    They are shipped base64-encoded (little-endian bytes, bit i in byte
+    i // 8) in the payload's 'filters' entry for the map pages.
+
+    Args:
+        size: Number of toilets
+        bitsets: (key, value) -> bitset
+    """
+
+    def __init__(self, size, bitsets):
+        self.size = size
+        self.bitsets = bitsets
+        self.everything = (1 << size) - 1
+
+    @classmethod
+    def from_toilets(cls, toilets, keys=BITSET_KEYS):
+        """Index toilet dicts (project_element output or Overpass elements) in order"""
+        members = {}
+        size = 0
+        for i, toilet in enumerate(toilets):
+            for key in keys:
+                value = toilet_value(toilet, key)
+                if value is not None:
+                    members.setdefault((key, value), []).append(i)
+            size = i + 1
+        return cls(size, {pair: bitset_of(indices, size) for pair, indices in members.items()})
+
+    def bits(self, key, *values):
+        """Toilets whose key has any of the values (OR)"""
+        result = 0
+        for value in values:
+            result |= self.bitsets.get((key, value), 0)
+        return result
+
+    def match(self, **conditions):
+        """
+        Toilets meeting every condition (AND); a condition is one value or
+        a tuple of values any of which is accepted (OR)
+
+            index.match(wheelchair=('yes', 'limited'), fee='no')
+        """
+        result = self.everything
+        for key, values in conditions.items():
+            result &= self.bits(key, *(values if isinstance(values, tuple) else (values,)))
+        return result
+
+    def invert(self, bits):
+        return self.everything & ~bits
+
+    def select(self, wheelchair='all', fee='all', access='all'):
+        """The toilets matches_filters() accepts, as a bitset"""
+        result = self.everything
+        if wheelchair in ('yes', 'limited'):
+            result &= self.bits('wheelchair', wheelchair)
+        elif wheelchair == 'no':
+            result &= self.invert(self.bits('wheelchair', 'yes'))
+        if fee == 'free':
+            result &= self.invert(self.bits('fee', 'yes'))
+        elif fee == 'paid':
+            result &= self.bits('fee', 'yes')
+        if access != 'all':
+            result &= self.bits('access', access)
+        return result
+
+    def members(self, bits):
+        """Indices of the toilets in a bitset, ascending"""
+        data = bits.to_bytes((self.size + 7) // 8, 'little')
+        for byte_index, byte in enumerate(data):
+            while byte:
+                low = byte & -byte
+                yield byte_index * 8 + low.bit_length() - 1
+                byte ^= low
+
+    def predicate(self, bits):
+        """Constant-time membership test for a bitset, for per-candidate checks"""
+        data = bits.to_bytes((self.size + 7) // 8, 'little')
+        return lambda i: data[i >> 3] >> (i & 7) & 1 == 1
+
+    def to_dict(self):
+        """The payload form: {'size', 'bitsets': {key: {value: base64}}}"""
+        length = (self.size + 7) // 8
+        encoded = {}
+        for (key, value), bits in sorted(self.bitsets.items()):
+            encoded.setdefault(key, {})[value] = base64.b64encode(bits.to_bytes(length, 'little')).decode('ascii')
+        return {'size': self.size, 'bitsets': encoded}
+
+    @classmethod
+    def from_dict(cls, data):
+        bitsets = {(key, value): int.from_bytes(base64.b64decode(encoded), 'little')
+                   for key, values in data['bitsets'].items() for value, encoded in values.items()}
+        return cls(data['size'], bitsets)
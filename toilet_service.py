@@ -0,0 +1,386 @@
+import argparse
+import asyncio
+import glob
+import json
+import os
+import time
+from datetime import datetime
+from urllib.parse import parse_qs, urlsplit
+
+from opening_hours import LOCAL_TIMEZONE, OpeningHoursIndex
+from snapshot_catalog import region_from_name
+from snapshot_format import SNAPSHOT_EXTENSION, load_snapshot
+from spatial_index import INDEX_EXTENSION, SpatialIndex, iter_element_points
+from toilet_filters import FilterIndex, validate_filters
+
+MAX_RESULTS = 100
+MAX_RADIUS_M = 50_000
+MAX_BBOX_RESULTS = 1000
+MAX_REQUEST_LINE = 8192
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           414: 'URI Too Long', 431: 'Request Header Fields Too Large', 503: 'Service Unavailable'}
+
+
+class QueryError(Exception):
+    """Raised for invalid query parameters; answered with 400"""
+
+
+def newest_snapshot(path):
+    """
+    Resolve a snapshot path: a file is used as is, a directory resolves to
+    its most recently modified toilets_*.json / *.tsnap file
+    """
+    if not os.path.isdir(path):
+        return path
+    candidates = [
+        file for pattern in ('toilets_*.json', f'toilets_*{SNAPSHOT_EXTENSION}')
+        for file in glob.glob(os.path.join(path, pattern))
+        if region_from_name(file)  # Skips *_tags_analysis.json and other outputs
+    ]
+    if not candidates:
+        return None
+    return max(candidates, key=os.path.getmtime)
+
+
+class ServiceState:
+    """
+    One loaded snapshot with its spatial index
+
+    States are immutable once built; a reload builds a new one and swaps the
+    reference, so requests already running keep using the state they began
+    with.
+    """
+
+    def __init__(self, snapshot_path):
+        stat = os.stat(snapshot_path)
+        self.snapshot_path = snapshot_path
+        self.signature = (snapshot_path, stat.st_mtime_ns, stat.st_size)
+
+        data = load_snapshot(snapshot_path)
+        self.elements = data.get('elements', [])
+        self.timestamp = data.get('osm3s', {}).get('timestamp_osm_base')
+        self.filters = FilterIndex.from_toilets(self.elements)
+        self.hours = OpeningHoursIndex.from_toilets(self.elements)
+        self.hours_known = self.filters.predicate(self.hours.known)
+
+        # Reuse a saved index built from this snapshot when it is up to date
+        index_path = os.path.splitext(snapshot_path)[0] + INDEX_EXTENSION
+        index = None
+        if os.path.exists(index_path) and os.path.getmtime(index_path) >= stat.st_mtime:
+            try:
+                index = SpatialIndex.load(index_path)
+                if index.source != os.path.basename(snapshot_path):
+                    index = None
+            except ValueError:
+                index = None
+        if index is None:
+            index = SpatialIndex.from_points(iter_element_points(self.elements),
+                                             source=os.path.basename(snapshot_path))
+        self.index = index
+        self.loaded_at = time.time()
+
+    def describe(self):
+        return {
+            'snapshot': os.path.basename(self.snapshot_path),
+            'timestamp_osm_base': self.timestamp,
+            'elements': len(self.elements),
+            'indexed': len(self.index),
+            'opening_hours': {'known': self.hours.known.bit_count(),
+                              'unparsed': self.hours.unparsed.bit_count()},
+            'loaded_at': self.loaded_at,
+        }
+
+
+def _float(params, name):
+    try:
+        return float(params[name][0])
+    except KeyError:
+        raise QueryError(f"Missing parameter '{name}'")
+    except ValueError:
+        raise QueryError(f"Parameter '{name}' must be a number")
+
+
+def _int(params, name, default, maximum):
+    try:
+        value = int(params[name][0]) if name in params else default
+    except ValueError:
+        raise QueryError(f"Parameter '{name}' must be an integer")
+    if value < 1:
+        raise QueryError(f"Parameter '{name}' must be at least 1")
+    return min(value, maximum)
+
+
+def _filters(params):
+    filters = {name: params[name][0] if name in params else 'all'
+               for name in ('wheelchair', 'fee', 'access')}
+    try:
+        validate_filters(**filters)
+    except ValueError as e:
+        raise QueryError(str(e))
+    return filters
+
+
+def _flag(params, name):
+    if name not in params:
+        return False
+    value = params[name][0].lower()
+    if value not in ('1', 'true', 'yes', '0', 'false', 'no'):
+        raise QueryError(f"Parameter '{name}' must be true or false")
+    return value in ('1', 'true', 'yes')
+
+
+def _open_at(params):
+    """The local time of the open= parameter: 'now' or an ISO datetime, or None"""
+    if 'open' not in params:
+        return None
+    value = params['open'][0]
+    if value == 'now':
+        return datetime.now(LOCAL_TIMEZONE)
+    try:
+        when = datetime.fromisoformat(value)
+    except ValueError:
+        raise QueryError("Parameter 'open' must be 'now' or an ISO datetime")
+    return when.astimezone(LOCAL_TIMEZONE) if when.tzinfo else when
+
+
+def _result(state, hit, open_at=None):
+    element = state.elements[hit.element_index]
+    result = {
+        'type': hit.type,
+        'id': hit.id,
+        'lat': hit.lat,
+        'lon': hit.lon,
+        'tags': element.get('tags', {}),
+    }
+    if hit.distance_m is not None:
+        result['distance_m'] = round(hit.distance_m, 1)
+    if open_at is not None:
+        # Only open toilets pass the open= filter, so anything else is unknown
+        result['open'] = True if state.hours_known(hit.element_index) else None
+    return result
+
+
+def answer_query(state, path, params):
+    """
+    Answer one API request against a loaded state
+
+    Endpoints (all GET, filters wheelchair/fee/access as in generate_map.py):
+        /nearest?lat=&lon=[&n=5]          the n nearest matching toilets
+        /radius?lat=&lon=&r=              matching toilets within r metres
+        /bbox?south=&west=&north=&east=   matching toilets inside the bbox
+        /health                           information about the loaded snapshot
+
+    open=now or open=<ISO datetime> keeps only toilets whose opening_hours
+    say they are open then (Norwegian time unless the datetime has an
+    offset). Toilets without opening_hours, or with hours that cannot be
+    parsed, are left out unless include_unknown=true is given too. Each
+    result then says 'open': true, or null when its hours are unknown.
+
+    Returns:
+        (status, body dict)
+    """
+    if path == '/health':
+        return 200, {'status': 'ok', **state.describe()}
+
+    if path not in ('/nearest', '/radius', '/bbox'):
+        return 404, {'error': f"Unknown endpoint '{path}'"}
+
+    filters = _filters(params)
+    open_at = _open_at(params)
+    filtered = open_at is not None or any(value != 'all' for value in filters.values())
+
+    # The predicate costs a pass over the whole bitset, so unfiltered
+    # queries skip it
+    accept = None
+    if filtered:
+        selected = state.filters.select(**filters)
+        if open_at is not None:
+            hours = state.hours.open_at(open_at)
+            if _flag(params, 'include_unknown'):
+                hours |= state.filters.invert(state.hours.known)
+            selected &= hours
+        accept = state.filters.predicate(selected)
+
+    if path == '/nearest':
+        lat, lon = _float(params, 'lat'), _float(params, 'lon')
+        n = _int(params, 'n', 5, MAX_RESULTS)
+        hits = state.index.nearest(lat, lon, n, accept=accept)
+    elif path == '/radius':
+        lat, lon = _float(params, 'lat'), _float(params, 'lon')
+        radius = _float(params, 'r')
+        if not 0 < radius <= MAX_RADIUS_M:
+            raise QueryError(f"Parameter 'r' must be between 0 and {MAX_RADIUS_M} metres")
+        hits = state.index.within_radius(lat, lon, radius)
+        if filtered:
+            hits = [hit for hit in hits if accept(hit.element_index)]
+        hits = hits[:_int(params, 'limit', MAX_BBOX_RESULTS, MAX_BBOX_RESULTS)]
+    else:
+        south, west = _float(params, 'south'), _float(params, 'west')
+        north, east = _float(params, 'north'), _float(params, 'east')
+        if south > north or west > east:
+            raise QueryError("Bounding box must have south <= north and west <= east")
+        hits = state.index.in_bbox(south, west, north, east)
+        if filtered:
+            hits = [hit for hit in hits if accept(hit.element_index)]
+        hits = [hit._replace(distance_m=None) for hit in hits]
+        hits = hits[:_int(params, 'limit', MAX_BBOX_RESULTS, MAX_BBOX_RESULTS)]
+
+    return 200, {
+        'snapshot': os.path.basename(state.snapshot_path),
+        'count': len(hits),
+        'results': [_result(state, hit, open_at) for hit in hits],
+    }
+
+
+class ToiletService:
+    """
+    Asyncio HTTP/1.1 service answering nearest, radius and bbox queries
+
+    The snapshot (or the newest snapshot in a directory) is polled every
+    reload_interval seconds. When it changes, the new state is loaded in a
+    worker thread while requests keep being served from the old one, and
+    then swapped in with a single assignment.
+    """
+
+    def __init__(self, snapshot_path, reload_interval=2.0):
+        self.snapshot_path = snapshot_path
+        self.reload_interval = reload_interval
+        self.state = None
+        self.requests_served = 0
+
+    def _current_signature(self):
+        path = newest_snapshot(self.snapshot_path)
+        if not path or not os.path.exists(path):
+            return None
+        stat = os.stat(path)
+        return (path, stat.st_mtime_ns, stat.st_size)
+
+    async def reload_if_changed(self):
+        """Load the snapshot if it changed since the current state was built"""
+        signature = self._current_signature()
+        if signature is None or (self.state and self.state.signature == signature):
+            return False
+        loop = asyncio.get_running_loop()
+        try:
+            state = await loop.run_in_executor(None, ServiceState, signature[0])
+        except Exception as e:
+            # A snapshot that is still being written fails to parse; keep
+            # serving the old state and retry on the next poll
+            print(f"⚠️  Could not load {signature[0]}: {e}")
+            return False
+        self.state = state
+        print(f"🔄 Loaded {os.path.basename(state.snapshot_path)}: {len(state.index)} toilets indexed")
+        return True
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            await self.reload_if_changed()
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request_line = await reader.readline()
+                except ValueError:
+                    # Longer than the StreamReader buffer limit
+                    request_line = None
+                if request_line == b'':
+                    break
+                if request_line is None or len(request_line) > MAX_REQUEST_LINE:
+                    await self._respond(writer, 414, {'error': 'Request line too long'}, False)
+                    break
+
+                headers = {}
+                while True:
+                    try:
+                        line = await reader.readline()
+                    except ValueError:
+                        line = None
+                    if line is None or len(line) > MAX_REQUEST_LINE:
+                        await self._respond(writer, 431, {'error': 'Header line too long'}, False)
+                        return
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                parts = request_line.decode('latin-1').split()
+                if len(parts) != 3:
+                    await self._respond(writer, 400, {'error': 'Malformed request line'}, False)
+                    break
+                method, target, version = parts
+                keep_alive = (headers.get('connection', '').lower() != 'close'
+                              and version == 'HTTP/1.1')
+
+                if int(headers.get('content-length', 0) or 0):
+                    await reader.readexactly(int(headers['content-length']))
+
+                status, body = self._dispatch(method, target)
+                await self._respond(writer, status, body, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionResetError, asyncio.IncompleteReadError, BrokenPipeError):
+            pass
+        finally:
+            writer.close()
+
+    def _dispatch(self, method, target):
+        if method != 'GET':
+            return 405, {'error': 'Only GET is supported'}
+        state = self.state
+        if state is None:
+            return 503, {'error': 'No snapshot loaded yet'}
+        url = urlsplit(target)
+        try:
+            status, body = answer_query(state, url.path.rstrip('/') or '/', parse_qs(url.query))
+        except QueryError as e:
+            return 400, {'error': str(e)}
+        self.requests_served += 1
+        return status, body
+
+    async def _respond(self, writer, status, body, keep_alive):
+        payload = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        head = (
+            f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode('latin-1') + payload)
+        await writer.drain()
+
+    async def serve(self, host='127.0.0.1', port=8000):
+        await self.reload_if_changed()
+        if self.state is None:
+            print(f"⚠️  No snapshot found at {self.snapshot_path} yet, waiting for one")
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        watcher = asyncio.create_task(self._watch())
+        address = server.sockets[0].getsockname()
+        print(f"🚽 Toilet service listening on http://{address[0]}:{address[1]}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            watcher.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve nearest/radius/bbox toilet queries from a snapshot")
+    parser.add_argument('snapshot', help="Snapshot file, or a directory to serve the newest toilets_* snapshot from")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--reload-interval', type=float, default=2.0,
+                        help="Seconds between checks for a new snapshot")
+    args = parser.parse_args()
+
+    service = ToiletService(args.snapshot, reload_interval=args.reload_interval)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print(f"\n👋 Stopped after {service.requests_served} requests")
+
+
+if __name__ == "__main__":
+    main()
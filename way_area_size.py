@@ -1,78 +1,385 @@
 import json
+import math
+import sys
+from array import array
 
-def analyze_toilet_areas(json_file_path):
+import numpy as np
+
+from geo import EARTH_RADIUS_M
+from instrumentation import enable_from_args, file_size, instrumented, stage
+from overpass_stream import iter_elements
+from snapshot_format import ColumnarSnapshot, HAS_BOUNDS, TYPE_CODES, is_snapshot
+
+def iter_snapshot_ways(snapshot):
+    """
+    Yield the ways of a columnar snapshot as lightweight elements
+    
+    Only type, id and (when complete) bounds are filled in from the columns;
+    the full element can be rebuilt with snapshot.element(element['index']).
+    """
+    way_code = TYPE_CODES['way']
+    bound_columns = [(key, getattr(snapshot, key)) for key in ('minlat', 'minlon', 'maxlat', 'maxlon')]
+    for i in range(snapshot.count):
+        if snapshot.type[i] != way_code:
+            continue
+        element = {'type': 'way', 'id': snapshot.id[i], 'index': i}
+        if snapshot.flags[i] & HAS_BOUNDS:
+            element['bounds'] = {
+                key: column[i] for key, column in bound_columns if not math.isnan(column[i])
+            }
+        yield element
+
+REQUIRED_BOUNDS = ['minlat', 'maxlat', 'minlon', 'maxlon']
+
+# Closed rings smaller than this are reported as degenerate
+DEGENERATE_AREA_M2 = 1.0
+
+# Areas further than this many interquartile ranges above the upper
+# quartile (of log10 area) are reported as outliers
+OUTLIER_IQR = 3.0
+
+class PackedWays:
     """
-    Analyze toilet data to find the largest area for 'way' type objects
-    and identify any 'way' objects without bounds.
+    Way geometries packed into flat arrays
+    
+    Way i's points are lat/lon[offsets[i]:offsets[i + 1]]. Missing points
+    (None in Overpass geometry, NaN in snapshots) are dropped.
     """
     
-    try:
-        # Read the JSON file
-        with open(json_file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        if 'elements' not in data:
-            print("Error: 'elements' key not found in JSON")
+    def __init__(self):
+        self.ids = array('q')
+        self.offsets = array('q', [0])
+        self.lat = array('d')
+        self.lon = array('d')
+    
+    def add(self, element):
+        """Append a way's geometry; ways without geometry are skipped"""
+        points = [point for point in element.get('geometry') or () if point]
+        if not points:
             return
+        self.ids.append(element['id'])
+        self.lat.extend(point['lat'] for point in points)
+        self.lon.extend(point['lon'] for point in points)
+        self.offsets.append(len(self.lat))
+    
+    @classmethod
+    def from_arrays(cls, ids, offsets, lat, lon):
+        packed = cls()
+        packed.ids, packed.offsets, packed.lat, packed.lon = ids, offsets, lat, lon
+        return packed
+    
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        """Gather the ways' geometry straight from a columnar snapshot's columns"""
+        types = np.asarray(snapshot.type)
+        offsets = np.asarray(snapshot.geom_offsets)
+        ways = np.flatnonzero(types == TYPE_CODES['way'])
+        starts, ends = offsets[ways], offsets[ways + 1]
+        counts = ends - starts
         
-        elements = data['elements']
-        print(f"Total elements: {len(elements)}")
+        # Index of every point of every way, in way order
+        index = np.arange(counts.sum()) + np.repeat(starts - np.cumsum(counts) + counts, counts)
+        lat = np.asarray(snapshot.geom_lat)[index]
+        lon = np.asarray(snapshot.geom_lon)[index]
+        
+        # Drop missing points and ways left without any
+        present = ~np.isnan(lat)
+        way_of = np.repeat(np.arange(len(ways)), counts)
+        counts = np.bincount(way_of[present], minlength=len(ways))
+        keep = counts > 0
+        return cls.from_arrays(
+            np.asarray(snapshot.id)[ways][keep],
+            np.concatenate(([0], np.cumsum(counts[keep]))),
+            lat[present],
+            lon[present],
+        )
+    
+    def __len__(self):
+        return len(self.ids)
+
+def way_metrics(packed):
+    """
+    Geodesic area, perimeter and centroid of every packed way in one pass
+    
+    Everything is computed on whole arrays: segments are formed between
+    consecutive points of the same way and summed per way with bincount.
+    Area uses the spherical excess of the ring (Chamberlain & Duquette
+    2007) on a sphere of EARTH_RADIUS_M, perimeter the haversine length of
+    the segments, and the centroid the same area-weighted planar formula
+    as geo.polygon_centroid. Ways that are not closed rings get area 0 and
+    the mean of their points as centroid.
+    
+    Returns:
+        dict of numpy arrays: id, points, closed, area_m2, perimeter_m,
+        lat, lon
+    """
+    ids = np.asarray(packed.ids, dtype=np.int64)
+    offsets = np.asarray(packed.offsets, dtype=np.int64)
+    lat = np.radians(np.asarray(packed.lat, dtype=np.float64))
+    lon = np.radians(np.asarray(packed.lon, dtype=np.float64))
+    n = len(ids)
+    counts = np.diff(offsets)
+    way_of = np.repeat(np.arange(n), counts)
+    
+    first, last = offsets[:-1], offsets[1:] - 1
+    closed = (counts >= 4) & (lat[first] == lat[np.maximum(last, 0)]) & (lon[first] == lon[np.maximum(last, 0)])
+    
+    # Segments between consecutive points of the same way
+    same = way_of[:-1] == way_of[1:]
+    segment_way = way_of[:-1][same]
+    lat1, lat2 = lat[:-1][same], lat[1:][same]
+    dlon = lon[1:][same] - lon[:-1][same]
+    dlon = (dlon + np.pi) % (2 * np.pi) - np.pi  # Shortest way round the antimeridian
+    
+    # Perimeter: haversine length of every segment
+    h = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    perimeter = np.bincount(segment_way, 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(h, 1.0))),
+                            minlength=n)
+    
+    # Area: spherical excess of the closed rings
+    excess = np.bincount(segment_way, dlon * (2 + np.sin(lat1) + np.sin(lat2)), minlength=n)
+    area = np.where(closed, np.abs(excess) * EARTH_RADIUS_M ** 2 / 2, 0.0)
+    
+    # Centroid: area-weighted on a local plane around each way's first point
+    lat0 = np.repeat(lat[first], counts)
+    lon0 = np.repeat(lon[first], counts)
+    x = (lon - lon0 + np.pi) % (2 * np.pi) - np.pi
+    x *= np.cos(lat0)
+    y = lat - lat0
+    x1, y1, x2, y2 = x[:-1][same], y[:-1][same], x[1:][same], y[1:][same]
+    cross = x1 * y2 - x2 * y1
+    twice_area = np.bincount(segment_way, cross, minlength=n)
+    cx = np.bincount(segment_way, (x1 + x2) * cross, minlength=n)
+    cy = np.bincount(segment_way, (y1 + y2) * cross, minlength=n)
+    
+    mean_lat = np.bincount(way_of, lat, minlength=n) / np.maximum(counts, 1)
+    mean_lon = np.bincount(way_of, lon, minlength=n) / np.maximum(counts, 1)
+    planar = closed & (np.abs(twice_area) > 1e-18)
+    safe = np.where(planar, twice_area, 1.0)
+    centroid_lat = np.where(planar, lat[first] + cy / (3 * safe), mean_lat)
+    centroid_lon = np.where(planar, lon[first] + cx / (3 * safe * np.cos(lat[first])), mean_lon)
+    
+    return {
+        'id': ids,
+        'points': counts,
+        'closed': closed,
+        'area_m2': area,
+        'perimeter_m': perimeter,
+        'lat': np.degrees(centroid_lat),
+        'lon': np.degrees(centroid_lon),
+    }
+
+def _way_summary(metrics, i, source=None):
+    summary = {
+        'id': int(metrics['id'][i]),
+        'area_m2': round(float(metrics['area_m2'][i]), 2),
+        'perimeter_m': round(float(metrics['perimeter_m'][i]), 1),
+        'lat': round(float(metrics['lat'][i]), 6),
+        'lon': round(float(metrics['lon'][i]), 6),
+    }
+    if source:
+        summary['file'] = source
+    return summary
+
+def area_report(metrics, sources=None, top=5):
+    """
+    Distribution, largest ways and outliers of way_metrics() results
+    
+    Args:
+        metrics: dict returned by way_metrics (or merged ones)
+        sources: Optional array with the file each way came from
+        top: Number of largest ways to list
+    """
+    area = metrics['area_m2']
+    closed = metrics['closed']
+    rings = area[closed]
+    label = (lambda i: sources[i]) if sources is not None else (lambda i: None)
+    
+    report = {
+        'ways': int(len(area)),
+        'closed': int(closed.sum()),
+        'open': int((~closed).sum()),
+        'total_area_m2': round(float(rings.sum()), 1),
+        'area_m2': {},
+        'perimeter_m': {},
+        'largest': [],
+        'outliers': [],
+        'degenerate': [],
+    }
+    if not len(rings):
+        return report
+    
+    for name, values in (('area_m2', rings), ('perimeter_m', metrics['perimeter_m'][closed])):
+        p50, p90, p99 = np.percentile(values, [50, 90, 99])
+        report[name] = {
+            'min': round(float(values.min()), 1),
+            'p50': round(float(p50), 1),
+            'p90': round(float(p90), 1),
+            'p99': round(float(p99), 1),
+            'max': round(float(values.max()), 1),
+            'mean': round(float(values.mean()), 1),
+        }
+    
+    order = np.argsort(-area, kind='stable')
+    report['largest'] = [_way_summary(metrics, i, label(i)) for i in order[:top]]
+    
+    # Outliers on a log scale, where building footprints are roughly normal
+    positive = closed & (area >= DEGENERATE_AREA_M2)
+    if positive.any():
+        log_area = np.log10(area[positive])
+        q1, q3 = np.percentile(log_area, [25, 75])
+        limit = 10 ** (q3 + OUTLIER_IQR * (q3 - q1))
+        report['outlier_limit_m2'] = round(float(limit), 1)
+        report['outliers'] = [_way_summary(metrics, i, label(i))
+                              for i in order if positive[i] and area[i] > limit]
+    report['degenerate'] = [_way_summary(metrics, i, label(i))
+                            for i in np.flatnonzero(closed & (area < DEGENERATE_AREA_M2))]
+    return report
+
+class AreaStats:
+    """
+    Mergeable way area statistics
+    
+    Feed elements with add(); ways without complete bounds are collected as
+    bounds problems and geometries are packed for way_metrics(), which
+    finish() runs once all elements are in. Finished partial results from
+    several files (or processes) are combined with merge().
+    """
+    
+    def __init__(self, source=None):
+        self.source = source
+        self.elements = 0
+        self.ways = 0
+        self.without_bounds = []
+        self.packed = PackedWays()
+        self.metrics = None
+        self.sources = None
+    
+    def add(self, element):
+        self.elements += 1
+        if element.get('type') != 'way':
+            return
+        self.ways += 1
+        self.packed.add(element)
         
-        # Initialize variables
-        largest_area = 0
-        largest_area_object = None
-        way_objects_count = 0
-        way_without_bounds = []
+        # Check if all required bound keys exist
+        bounds = element.get('bounds')
+        if not bounds or not all(key in bounds for key in REQUIRED_BOUNDS):
+            self.without_bounds.append((self.source, element))
+    
+    def finish(self):
+        """Compute the metrics of the packed ways and drop the geometry"""
+        if self.metrics is None:
+            self.metrics = way_metrics(self.packed)
+            self.sources = np.full(len(self.packed), self.source, dtype=object)
+            self.packed = None
+        return self
+    
+    def merge(self, other):
+        self.finish()
+        other.finish()
+        self.elements += other.elements
+        self.ways += other.ways
+        self.without_bounds.extend(other.without_bounds)
+        self.metrics = {key: np.concatenate((self.metrics[key], other.metrics[key])) for key in self.metrics}
+        self.sources = np.concatenate((self.sources, other.sources))
+        return self
+    
+    def to_dict(self, top=5):
+        self.finish()
+        return {
+            'elements': self.elements,
+            'ways': self.ways,
+            **area_report(self.metrics, self.sources, top),
+            'bounds_problems': [
+                {'file': source, 'id': element['id'],
+                 'reason': 'missing bounds' if 'bounds' not in element else 'incomplete bounds'}
+                for source, element in self.without_bounds
+            ],
+        }
+
+def compute_area_stats(json_file_path, source=None):
+    """
+    Compute AreaStats for one snapshot
+    
+    Overpass JSON is streamed element by element; for columnar snapshots
+    the geometry is gathered from the columns in one vectorized step, and
+    only the ways without bounds are rebuilt as elements.
+    """
+    stats = AreaStats(source)
+    if is_snapshot(json_file_path):
+        with ColumnarSnapshot(json_file_path) as snapshot:
+            add_snapshot_ways(stats, snapshot)
+    else:
+        for element in iter_elements(json_file_path):
+            stats.add(element)
+    return stats.finish()
+
+def add_snapshot_ways(stats, snapshot):
+    """Fill an empty AreaStats from a columnar snapshot"""
+    for element in iter_snapshot_ways(snapshot):
+        stats.ways += 1
+        bounds = element.get('bounds')
+        if not bounds or not all(key in bounds for key in REQUIRED_BOUNDS):
+            stats.without_bounds.append((stats.source, snapshot.element(element['index'])))
+    stats.elements = snapshot.count
+    stats.packed = PackedWays.from_snapshot(snapshot)
+    return stats.finish()
+
+def print_way_summary(way):
+    print(f"  Way {way['id']}: {way['area_m2']:,.1f} m², perimeter {way['perimeter_m']:,.1f} m, "
+          f"centroid {way['lat']}, {way['lon']}")
+
+@instrumented()
+def analyze_toilet_areas(json_file_path):
+    """
+    Analyze toilet data: geodesic area of every 'way' type object, their
+    distribution and outliers, and any 'way' objects without bounds.
+    
+    Accepts Overpass JSON or a columnar snapshot; for snapshots the
+    geometry is read straight from the columns.
+    
+    Returns:
+        The AreaStats report dict, or None on failure
+    """
+    
+    try:
+        with stage('compute') as s:
+            stats = compute_area_stats(json_file_path)
+            s.record(bytes_in=file_size(json_file_path), elements=stats.elements, ways=stats.ways)
+        print(f"Total elements: {stats.elements}")
         
-        # Process each element
-        for element in elements:
-            if element.get('type') == 'way':
-                way_objects_count += 1
-                
-                # Check if bounds exist
-                if 'bounds' not in element:
-                    way_without_bounds.append(element)
-                    continue
-                
-                bounds = element['bounds']
-                
-                # Check if all required bound keys exist
-                required_keys = ['minlat', 'maxlat', 'minlon', 'maxlon']
-                if not all(key in bounds for key in required_keys):
-                    way_without_bounds.append(element)
-                    continue
-                
-                # Calculate area (approximate, in degrees squared)
-                lat_diff = bounds['maxlat'] - bounds['minlat']
-                lon_diff = bounds['maxlon'] - bounds['minlon']
-                area = lat_diff * lon_diff
-                
-                # Update largest area if this one is bigger
-                if area > largest_area:
-                    largest_area = area
-                    largest_area_object = element
+        with stage('report'):
+            report = stats.to_dict()
+        way_without_bounds = [element for _, element in stats.without_bounds]
         
         # Print results
-        print(f"\nWay objects found: {way_objects_count}")
+        print(f"\nWay objects found: {stats.ways}")
         print(f"Way objects without bounds: {len(way_without_bounds)}")
+        print(f"Closed rings: {report['closed']}, open ways: {report['open']}")
         
-        if largest_area_object:
-            print(f"\nLargest area found: {largest_area:.10f} square degrees")
-            print(f"Largest area object ID: {largest_area_object['id']}")
-            print(f"Largest area object bounds:")
-            bounds = largest_area_object['bounds']
-            print(f"  Min lat: {bounds['minlat']}")
-            print(f"  Max lat: {bounds['maxlat']}")
-            print(f"  Min lon: {bounds['minlon']}")
-            print(f"  Max lon: {bounds['maxlon']}")
-            print(f"  Lat difference: {bounds['maxlat'] - bounds['minlat']:.10f}")
-            print(f"  Lon difference: {bounds['maxlon'] - bounds['minlon']:.10f}")
+        if report['area_m2']:
+            print(f"\nTotal area: {report['total_area_m2']:,.1f} m²")
+            for name, unit in (('area_m2', 'm²'), ('perimeter_m', 'm')):
+                d = report[name]
+                print(f"{'Area' if name == 'area_m2' else 'Perimeter'}: "
+                      f"min {d['min']:,.1f}, median {d['p50']:,.1f}, p90 {d['p90']:,.1f}, "
+                      f"p99 {d['p99']:,.1f}, max {d['max']:,.1f} {unit}")
+            
+            print("\nLargest areas:")
+            for way in report['largest']:
+                print_way_summary(way)
             
-            # Show tags if available
-            if 'tags' in largest_area_object:
-                print(f"  Tags: {largest_area_object['tags']}")
+            if report['outliers']:
+                print(f"\nOutliers (above {report['outlier_limit_m2']:,.1f} m²):")
+                for way in report['outliers']:
+                    print_way_summary(way)
+            if report['degenerate']:
+                print(f"\nDegenerate rings (under {DEGENERATE_AREA_M2} m²):")
+                for way in report['degenerate']:
+                    print_way_summary(way)
         else:
-            print("\nNo way objects with valid bounds found.")
+            print("\nNo closed way geometries found.")
         
         # Print objects without bounds
         if way_without_bounds:
@@ -92,6 +399,7 @@ def analyze_toilet_areas(json_file_path):
                 # Print the entire object for debugging
                 print(f"  Full object: {json.dumps(obj, indent=2)}")
         
+        return report
     except FileNotFoundError:
         print(f"Error: File '{json_file_path}' not found.")
     except json.JSONDecodeError:
@@ -101,10 +409,14 @@ def analyze_toilet_areas(json_file_path):
 
 # Run the analysis
 if __name__ == "__main__":
-    # Replace with your actual file path
-    file_path = "toilets_norway_20250623_151225.json"
+    args = enable_from_args(sys.argv)
+    if len(args) != 2:
+        print("Usage: python way_area_size.py <json_file_path>")
+        print("Example: python way_area_size.py toilets_norway_20250623_151225.json")
+        print("For many snapshots at once, use batch_analysis.py")
+        sys.exit(1)
     
     print("Toilet Area Analyzer")
     print("=" * 30)
     
-    analyze_toilet_areas(file_path)
\ No newline at end of file
+    analyze_toilet_areas(args[1])
\ No newline at end of file